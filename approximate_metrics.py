@@ -0,0 +1,119 @@
+from message_loader import as_record
+from perf import span
+from sketches import TOP_K, HyperLogLog, TopK
+
+# Approximate metrics engine (METRICS_ENGINE=approx) for histories too large
+# to keep a per-user index in memory. Message counts stay exact; users and
+# rooms are counted with HyperLogLog and the most active users come from a
+# count-min sketch with a top-k list (see sketches.py), so memory stays a
+# fixed few hundred kilobytes whatever the number of users. Aggregates
+# merge, so large inputs are summarised in parallel shards (as in
+# parallel_metrics.py) and combined; with METRICS_STATE_PATH the aggregate
+# is the state incremental_metrics persists and folds new messages into.
+# Results carry an "error_bounds" entry next to each approximated figure.
+# The per-user breakdowns (single vs multiple message users, 'ya'/'tidak'
+# replies) and the conversation metrics need exact per-user and per-room
+# state and are left out.
+
+
+class ApproximateAggregate:
+    def __init__(self, top_k=TOP_K):
+        self.total_messages = 0
+        self.counted_messages = 0
+        self.user_messages = 0
+        self.agent_messages = 0
+        self.users = HyperLogLog()  # Users with a counted message
+        self.rooms = HyperLogLog()
+        self.top_users = TopK(top_k)  # Counted messages per user
+
+    def add_record(self, record):
+        self.total_messages += 1
+        user_name = record.user_name
+        room_id = record.room_id
+        if not user_name or record.timestamp or not room_id:  # Only count messages without timestamp
+            return
+        self.counted_messages += 1
+        self.users.add(user_name)
+        self.rooms.add(room_id)
+        self.top_users.add(user_name)
+        sender_type = record.sender_type
+        if sender_type is None or sender_type == "user":
+            self.user_messages += 1
+        else:
+            self.agent_messages += 1
+
+    def add_all(self, matches):
+        for match in matches:
+            self.add_record(as_record(match))
+
+    def merge(self, other):
+        self.total_messages += other.total_messages
+        self.counted_messages += other.counted_messages
+        self.user_messages += other.user_messages
+        self.agent_messages += other.agent_messages
+        self.users.merge(other.users)
+        self.rooms.merge(other.rooms)
+        self.top_users.merge(other.top_users)
+        return self
+
+    def result(self):
+        total_users = min(self.users.count(), self.counted_messages)
+        total_rooms = min(self.rooms.count(), self.counted_messages)
+        avg_messages_per_user = self.counted_messages / total_users if total_users > 0 else 0
+        users_error = self.users.error_bound()
+        count_error = self.top_users.error_bound()
+        return {
+            "approximate": True,
+            "total_users": total_users,
+            "total_rooms": total_rooms,
+            "avg_messages_per_user": round(avg_messages_per_user, 2),
+            "total_messages": self.total_messages,
+            "user_messages": self.user_messages,
+            "agent_messages": self.agent_messages,
+            "top_users": [
+                {"user": user, "messages": messages, "min_messages": max(messages - count_error, 1)}
+                for user, messages in self.top_users.top()
+            ],
+            "other_single_messages": [],
+            "error_bounds": {
+                # Half-widths of about 95% intervals; top user counts are
+                # overestimated by at most top_user_messages (99% of the time)
+                "total_users": users_error,
+                "total_rooms": self.rooms.error_bound(),
+                "avg_messages_per_user": round(avg_messages_per_user * users_error / total_users, 2) if total_users > 0 else 0,
+                "top_user_messages": count_error,
+            },
+        }
+
+
+def merge_aggregates(aggregates):
+    # One aggregate summarising every partition
+    merged = ApproximateAggregate()
+    for aggregate in aggregates:
+        merged.merge(aggregate)
+    return merged
+
+
+def _aggregate_shard(records, keys):
+    # Worker: aggregate of one parallel_metrics shard (keys are not needed)
+    aggregate = ApproximateAggregate()
+    for record in records:
+        aggregate.add_record(record)
+    return aggregate
+
+
+def calculate_metrics_approx(query_result, workers=None):
+    # Large inputs are sharded across processes like METRICS_ENGINE=parallel
+    # and the workers' aggregates merged
+    from parallel_metrics import PARALLEL_MIN_RECORDS, PARALLEL_WORKERS, run_sharded
+
+    workers = workers or PARALLEL_WORKERS
+    if workers > 1 and len(query_result) >= PARALLEL_MIN_RECORDS:
+        with span("parallel metrics") as timing:
+            timing.add(records=len(query_result), shards=workers)
+            aggregates = run_sharded(query_result, _aggregate_shard, workers)
+        if aggregates is not None:
+            return merge_aggregates(aggregates).result()
+    aggregate = ApproximateAggregate()
+    aggregate.add_all(query_result)
+    return aggregate.result()
@@ -0,0 +1,256 @@
+import asyncio
+import os
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from message_loader import (
+    FETCH_BATCH_SIZE,
+    LIST_PAGE_SIZE,
+    MESSAGES_NAMESPACE,
+    make_record,
+    matches_filter,
+)
+
+# asyncio data access layer.
+# Listing pages, metadata fetch batches and queries for several namespaces
+# or filters are issued concurrently on one event loop, bounded by a
+# semaphore. Pinecone indexes are driven through IndexAsyncio (one pooled
+# aiohttp session per load) when pinecone[asyncio] is installed; any other
+# index, including the FakeIndex, is driven through a dedicated thread pool.
+# Rate-limited calls (HTTP 429) are retried with exponential backoff and
+# full jitter.
+
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "16"))
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.5  # Seconds before the first retry, doubled on each attempt
+RETRY_MAX_DELAY = 8.0
+RETRY_STATUSES = {429}
+
+
+def is_rate_limited(error):
+    # Pinecone's PineconeApiException (and the fake's throttling error) carry the HTTP status
+    return getattr(error, "status", None) in RETRY_STATUSES
+
+
+async def with_retry(call, *args, attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY, **kwargs):
+    for attempt in range(attempts):
+        try:
+            return await call(*args, **kwargs)
+        except Exception as error:
+            if not is_rate_limited(error) or attempt == attempts - 1:
+                raise
+            await asyncio.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+
+
+class ThreadedAsyncIndex:
+    # Async facade over a blocking index; each call runs on a pool sized to
+    # the concurrency limit, so blocking HTTP calls overlap
+    def __init__(self, index, max_workers=MAX_CONCURRENT_REQUESTS):
+        self.index = index
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        self._pool.shutdown(wait=False)
+
+    def _run(self, method, **kwargs):
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self._pool, lambda: getattr(self.index, method)(**kwargs))
+
+    async def describe_index_stats(self, **kwargs):
+        return await self._run("describe_index_stats", **kwargs)
+
+    async def list_paginated(self, **kwargs):
+        return await self._run("list_paginated", **kwargs)
+
+    async def fetch(self, **kwargs):
+        return await self._run("fetch", **kwargs)
+
+    async def query(self, **kwargs):
+        return await self._run("query", **kwargs)
+
+
+def open_async_index(index, max_concurrency=MAX_CONCURRENT_REQUESTS):
+    # Native asyncio client for Pinecone indexes when aiohttp is available,
+    # otherwise the thread-pool facade. Use as `async with`.
+    config = getattr(index, "config", None)
+    if getattr(config, "host", None) and getattr(config, "api_key", None):
+        try:
+            import aiohttp  # noqa: F401  (pinecone[asyncio])
+        except ImportError:
+            pass
+        else:
+            from pinecone import Pinecone
+
+            return Pinecone(api_key=config.api_key).IndexAsyncio(host=config.host, connection_pool_maxsize=max_concurrency)
+    return ThreadedAsyncIndex(index, max_workers=max_concurrency)
+
+
+class AsyncMessageClient:
+    def __init__(self, index, max_concurrency=MAX_CONCURRENT_REQUESTS):
+        self.index = index  # Async index (IndexAsyncio or ThreadedAsyncIndex)
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _call(self, method, **kwargs):
+        async with self._semaphore:
+            return await with_retry(getattr(self.index, method), **kwargs)
+
+    async def count(self, namespace=MESSAGES_NAMESPACE):
+        try:
+            stats = await self._call("describe_index_stats")
+        except Exception:
+            return None
+        summary = stats.namespaces.get(namespace) if stats.namespaces else None
+        return summary.vector_count if summary else 0
+
+    async def list_pages(self, namespace=MESSAGES_NAMESPACE, page_size=LIST_PAGE_SIZE):
+        # Async generator of ID pages; each page needs the previous page's token
+        token = None
+        while True:
+            kwargs = {"namespace": namespace, "limit": page_size}
+            if token:
+                kwargs["pagination_token"] = token
+            results = await self._call("list_paginated", **kwargs)
+            if results.vectors:
+                yield [v.id for v in results.vectors]
+            if not results.pagination:
+                return
+            token = results.pagination.next
+
+    async def fetch(self, ids, namespace=MESSAGES_NAMESPACE):
+        # Records for a batch of IDs, in listing order
+        response = await self._call("fetch", ids=ids, namespace=namespace)
+        vectors = response.vectors
+        return [
+            make_record(vector_id, vectors[vector_id].metadata)
+            for vector_id in ids
+            if vector_id in vectors
+        ]
+
+    async def fetch_vectors(self, ids, namespace=MESSAGES_NAMESPACE, batch_size=FETCH_BATCH_SIZE):
+        # {id: values} for the given IDs, fetched in concurrent batches; missing IDs are left out
+        async def fetch_batch(batch_ids):
+            response = await self._call("fetch", ids=batch_ids, namespace=namespace)
+            return {vector_id: list(vector.values or []) for vector_id, vector in response.vectors.items()}
+
+        batches = await asyncio.gather(*(
+            fetch_batch(ids[start:start + batch_size]) for start in range(0, len(ids), batch_size)
+        ))
+        return {vector_id: values for batch in batches for vector_id, values in batch.items()}
+
+    async def load(self, namespace=MESSAGES_NAMESPACE, filters=(None,), batch_size=FETCH_BATCH_SIZE, on_progress=None, skip_ids=None):
+        # Lists the namespace once and fetches batches concurrently while
+        # listing continues; returns one record list per filter, in listing order.
+        # Each batch is filtered as it arrives, and at most max_concurrency * 2
+        # batches are in flight or waiting to be collected, as in iter_messages.
+        total, done, pending = await self.count(namespace), 0, deque()
+        results = [[] for _ in filters]
+
+        async def fetch_batch(batch_ids):
+            nonlocal done
+            records = await self.fetch(batch_ids, namespace)
+            done += len(batch_ids)
+            if on_progress:
+                on_progress(done, total)
+            return [[r for r in records if matches_filter(r, filter)] for filter in filters]
+
+        async def collect_one():
+            for result, matching in zip(results, await pending.popleft()):
+                result.extend(matching)
+
+        try:
+            async for page in self.list_pages(namespace):
+                if skip_ids:
+                    new_ids = [vector_id for vector_id in page if vector_id not in skip_ids]
+                    done += len(page) - len(new_ids)
+                    page = new_ids
+                for start in range(0, len(page), batch_size):
+                    pending.append(asyncio.ensure_future(fetch_batch(page[start:start + batch_size])))
+                    while len(pending) >= self.max_concurrency * 2:
+                        await collect_one()
+            while pending:
+                await collect_one()
+        finally:
+            for task in pending:
+                task.cancel()
+        return results
+
+    async def load_many(self, queries, on_progress=None):
+        # queries: (namespace, filter) pairs. Each namespace is listed and
+        # fetched once, namespaces concurrently; results follow `queries`.
+        namespaces = {}
+        for namespace, filter in queries:
+            namespaces.setdefault(namespace, []).append(filter)
+        loaded = await asyncio.gather(*(
+            self.load(namespace, filters, on_progress=on_progress)
+            for namespace, filters in namespaces.items()
+        ))
+        results = {namespace: iter(records) for namespace, records in zip(namespaces, loaded)}
+        return [next(results[namespace]) for namespace, _ in queries]
+
+    async def query_many(self, requests):
+        # requests: keyword dicts for index.query (vector, top_k, namespace, filter, ...)
+        return await asyncio.gather(*(self._call("query", **request) for request in requests))
+
+
+def run_async(coroutine):
+    # Run a coroutine to completion from synchronous code (the Streamlit script
+    # thread has no event loop; if one is already running, use a helper thread)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    result = {}
+
+    def target():
+        try:
+            result["value"] = asyncio.run(coroutine)
+        except BaseException as error:
+            result["error"] = error
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+async def load_messages_async(index, namespace=MESSAGES_NAMESPACE, filter=None, on_progress=None, max_concurrency=MAX_CONCURRENT_REQUESTS, **kwargs):
+    async with open_async_index(index, max_concurrency) as async_index:
+        client = AsyncMessageClient(async_index, max_concurrency)
+        records, = await client.load(namespace, (filter,), on_progress=on_progress, **kwargs)
+        return records
+
+
+async def load_queries_async(index, queries, on_progress=None, max_concurrency=MAX_CONCURRENT_REQUESTS):
+    async with open_async_index(index, max_concurrency) as async_index:
+        return await AsyncMessageClient(async_index, max_concurrency).load_many(queries, on_progress=on_progress)
+
+
+async def fetch_vectors_async(index, ids, namespace=MESSAGES_NAMESPACE, max_concurrency=MAX_CONCURRENT_REQUESTS):
+    async with open_async_index(index, max_concurrency) as async_index:
+        return await AsyncMessageClient(async_index, max_concurrency).fetch_vectors(ids, namespace)
+
+
+def load_messages_concurrently(index, namespace=MESSAGES_NAMESPACE, filter=None, on_progress=None, **kwargs):
+    # Blocking entry point with the same contract as message_loader.load_messages
+    return run_async(load_messages_async(index, namespace=namespace, filter=filter, on_progress=on_progress, **kwargs))
+
+
+def load_queries(index, queries, on_progress=None, **kwargs):
+    # Blocking entry point: one record list per (namespace, filter) pair
+    return run_async(load_queries_async(index, queries, on_progress=on_progress, **kwargs))
+
+
+def fetch_vectors(index, ids, namespace=MESSAGES_NAMESPACE, **kwargs):
+    # Blocking entry point: {id: embedding values}
+    return run_async(fetch_vectors_async(index, ids, namespace=namespace, **kwargs))
@@ -0,0 +1,287 @@
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from async_loader import AsyncMessageClient, load_messages_concurrently, open_async_index, run_async
+from fake_index import FakeIndex
+from conversation_loader import ConversationIndex
+from message_loader import cached_load_messages, fetch_messages, iter_message_ids, load_messages, make_record, matches_filter
+from metrics import calculate_metrics, calculate_response_metrics
+from query_cache import QueryCache
+from timestamps import parse_timestamp
+
+# Benchmark harness for the dashboard hot paths.
+# Generates synthetic WhatsApp conversations with skewed activity, times each
+# stage at increasing message counts and records peak memory, plus the
+# memory held per 100k loaded records, then emits JSON so runs can be compared:
+#
+#   python benchmark.py --sizes 1000 10000 100000 1000000 --output bench.json
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+LOAD_FILTER = {"timestamp": {"$exists": False}}
+QUERY_COUNT = 32  # Filtered queries issued by the query stages
+MEMORY_UNIT = 100000  # Record memory is reported per this many messages
+
+# The previous record layout (a metadata dict per record), for the memory comparison
+DictRecord = namedtuple("DictRecord", ["id", "metadata", "ts"])
+USER_TEXTS = ["ya", "Ya", "tidak", "Tidak", "ya saya mau", "saya tidak tahu", "halo", "stop", "berapa harganya?", "terima kasih"]
+AGENT_TEXTS = ["Halo! Apakah Anda tertarik?", "Baik, terima kasih.", "Silakan balas ya atau tidak.", "Ada yang bisa kami bantu?"]
+
+
+def _skewed(rnd, mean, alpha=1.5):
+    # Pareto-distributed integer >= 1 with roughly the given mean
+    scale = mean * (alpha - 1) / alpha
+    return max(1, int(rnd.paretovariate(alpha) * scale))
+
+
+def generate_messages(total, rooms_per_user=2, messages_per_room=6, timestamped_fraction=0.2, seed=0):
+    # Synthetic messages: users own a skewed number of rooms, rooms hold a
+    # skewed number of alternating user/agent messages. Exactly `total` records.
+    rnd = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    records = []
+    user_number = 0
+    while len(records) < total:
+        user_number += 1
+        user_name = f"62812{user_number:07d}"
+        for room_number in range(_skewed(rnd, rooms_per_user)):
+            room_id = f"room-{user_number}-{room_number}"
+            moment = start + timedelta(minutes=rnd.randint(0, 60 * 24 * 180))
+            for position in range(_skewed(rnd, messages_per_room)):
+                if len(records) >= total:
+                    break
+                sender_type = "user" if position % 2 == 0 else "agent"
+                metadata = {
+                    "user_name": user_name,
+                    "room_id": room_id,
+                    "sender_type": sender_type,
+                    "text": rnd.choice(USER_TEXTS if sender_type == "user" else AGENT_TEXTS),
+                }
+                if rnd.random() < timestamped_fraction:
+                    metadata["timestamp"] = moment.isoformat().replace("+00:00", "Z")
+                moment += timedelta(seconds=rnd.randint(5, 600))
+                records.append(make_record(f"msg-{len(records):09d}", metadata))
+    return records
+
+
+def group_and_sort_rooms(messages):
+    # Conversation view: group messages by user and room, then open every room
+    conversations = ConversationIndex(messages)
+    for user_name in conversations.users():
+        for room_id in conversations.rooms(user_name):
+            conversations.room_messages(user_name, room_id)
+    return conversations
+
+
+def pandas_metrics(messages):
+    from vectorized_metrics import calculate_metrics_df, messages_frame
+
+    return calculate_metrics_df(messages_frame(messages))
+
+
+def pandas_response_metrics(messages):
+    from vectorized_metrics import calculate_response_metrics_df, messages_frame
+
+    return calculate_response_metrics_df(messages_frame(messages))
+
+
+def fake_index_setup(messages, latency=0.0):
+    return (FakeIndex.from_records(messages, latency=latency),)
+
+
+def fake_queries_setup(messages, latency=0.0, count=QUERY_COUNT):
+    # One filtered query per user, as a per-user drill-down would issue
+    index = FakeIndex.from_records(messages, latency=latency)
+    users = sorted({m.user_name for m in messages})[:count]
+    requests = [
+        {"vector": [0.0] * index.dimension, "top_k": 100, "namespace": "messages",
+         "filter": {"user_name": {"$eq": user_name}}, "include_metadata": True}
+        for user_name in users
+    ]
+    return index, requests
+
+
+def warm_cache_setup(messages, latency=0.0):
+    index = FakeIndex.from_records(messages, latency=latency)
+    cache = QueryCache()
+    cached_load_messages(index, cache=cache)
+    return index, cache
+
+
+def fake_load_sequential(index):
+    # Baseline: one blocking call after another
+    return [
+        record
+        for ids in iter_message_ids(index)
+        for record in fetch_messages(index, ids)
+        if matches_filter(record, LOAD_FILTER)
+    ]
+
+
+def fake_load(index):
+    # Full list/fetch load through the in-memory fake index
+    return load_messages(index, filter=LOAD_FILTER)
+
+
+def fake_load_async(index):
+    # Same load through the asyncio layer (bounded concurrency, retries)
+    return load_messages_concurrently(index, filter=LOAD_FILTER)
+
+
+def fake_queries_sequential(index, requests):
+    return [index.query(**request) for request in requests]
+
+
+def fake_queries_async(index, requests):
+    async def run_queries():
+        async with open_async_index(index) as async_index:
+            return await AsyncMessageClient(async_index).query_many(requests)
+    return run_async(run_queries())
+
+
+def cached_reload(index, cache):
+    # Repeated load of the same query (a Streamlit rerun), served from the cache
+    return cached_load_messages(index, cache=cache)
+
+
+STAGES = {
+    "load_messages_sequential": fake_load_sequential,
+    "load_messages_fake": fake_load,
+    "load_messages_async": fake_load_async,
+    "load_messages_cached": cached_reload,
+    "queries_sequential": fake_queries_sequential,
+    "queries_async": fake_queries_async,
+    "calculate_metrics": calculate_metrics,
+    "calculate_metrics_pandas": pandas_metrics,
+    "room_grouping_sort": group_and_sort_rooms,
+    "response_metrics": calculate_response_metrics,
+    "response_metrics_pandas": pandas_response_metrics,
+}
+
+# Stages whose inputs are prepared outside the timed region
+STAGE_SETUP = {
+    "load_messages_sequential": fake_index_setup,
+    "load_messages_fake": fake_index_setup,
+    "load_messages_async": fake_index_setup,
+    "load_messages_cached": warm_cache_setup,
+    "queries_sequential": fake_queries_setup,
+    "queries_async": fake_queries_setup,
+}
+
+
+def _dict_record(payload):
+    metadata = payload["metadata"]
+    return DictRecord(payload["id"], metadata, parse_timestamp(metadata.get("timestamp")))
+
+
+def _compact_record(payload):
+    return make_record(payload["id"], payload["metadata"])
+
+
+def record_memory(messages):
+    # MB held per MEMORY_UNIT records, built from JSON payloads as a fetch
+    # response delivers them (fresh strings, one dict per message)
+    payloads = [json.dumps({"id": m.id, "metadata": m.metadata}) for m in messages]
+    result = {}
+    for name, build in (("dict_records", _dict_record), ("compact_records", _compact_record)):
+        gc.collect()
+        tracemalloc.start()
+        records = [build(json.loads(payload)) for payload in payloads]
+        held, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result[name] = round(held * MEMORY_UNIT / len(records) / (1024 * 1024), 2)
+        del records
+    return result
+
+
+def measure(func, *args, repeat=1, memory=True):
+    # Best wall time over `repeat` runs, plus peak traced memory of one extra run
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    result = {"seconds": round(best, 6)}
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["peak_mb"] = round(peak / (1024 * 1024), 3)
+    return result
+
+
+def run(sizes, stages, repeat=1, memory=True, seed=0, log=None, fake_latency=0.0, **generator_options):
+    results = []
+    for size in sizes:
+        started = time.perf_counter()
+        messages = generate_messages(size, seed=seed, **generator_options)
+        entry = {
+            "messages": size,
+            "users": len({m.user_name for m in messages}),
+            "generate_seconds": round(time.perf_counter() - started, 6),
+            "stages": {},
+        }
+        if memory and messages:
+            entry["record_mb_per_100k"] = record_memory(messages)
+            if log:
+                log(f"{size:>9,} messages  record memory per 100k (MB) {entry['record_mb_per_100k']}")
+        for name in stages:
+            setup = STAGE_SETUP.get(name)
+            args = setup(messages, fake_latency) if setup else (messages,)
+            entry["stages"][name] = measure(STAGES[name], *args, repeat=repeat, memory=memory)
+            if log:
+                log(f"{size:>9,} messages  {name:<28} {entry['stages'][name]}")
+        results.append(entry)
+        del messages
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark metrics computation and message handling at scale")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="message counts to benchmark")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--rooms-per-user", type=float, default=2, help="mean rooms per user")
+    parser.add_argument("--messages-per-room", type=float, default=6, help="mean messages per room")
+    parser.add_argument("--timestamped-fraction", type=float, default=0.2)
+    parser.add_argument("--fake-latency", type=float, default=0.0, help="simulated seconds per fake index call")
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs per stage (best is kept)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak memory run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    results = run(
+        args.sizes,
+        args.stages,
+        repeat=args.repeat,
+        memory=not args.no_memory,
+        seed=args.seed,
+        log=lambda line: print(line, file=sys.stderr),
+        fake_latency=args.fake_latency,
+        rooms_per_user=args.rooms_per_user,
+        messages_per_room=args.messages_per_room,
+        timestamped_fraction=args.timestamped_fraction,
+    )
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
@@ -1,13 +1,22 @@
 import os
 import streamlit as st
-from pinecone import Pinecone
 from dotenv import load_dotenv
 import openai
 import asyncio
 import socket
 import sys
-from datetime import datetime
-from collections import defaultdict
+import time
+from metrics import cached_metrics
+from conversation_metrics import cached_conversation_metrics
+from incremental_metrics import METRICS_STATE_PATH, cached_incremental_metrics
+from index_backend import resolve_message_source
+from message_loader import MESSAGES_NAMESPACE, cached_load_messages, progress_callback
+from perf import finish_trace, span, start_trace
+from rollups import cached_rollups
+from sidebar_view import render_activity, render_conversations, render_metrics, render_sidebar_header, render_performance, render_timings
+
+script_started = time.perf_counter()
+start_trace(os.path.basename(__file__))
 
 # Set page config for wider sidebar - MUST be first Streamlit command
 st.set_page_config(
@@ -45,110 +54,14 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
-def format_timestamp(timestamp_str):
-    try:
-        # Convert timestamp to datetime object
-        dt = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-        # Format as: Day, Month Date, Year, Time
-        return dt.strftime("%A, %B %d, %Y, %I:%M %p")
-    except:
-        return timestamp_str  # Return original if parsing fails
-
-def calculate_metrics(query_result):
-    # Initialize counters
-    total_messages = len(query_result)
-    user_rooms = defaultdict(set)  # user -> set of rooms
-    user_messages = defaultdict(int)  # user -> total number of messages
-    user_message_count = 0
-    agent_message_count = 0
-    single_message_users = 0  # Count users with only one message
-    multiple_message_users = 0  # Count users with 2 or more messages
-    multiple_message_total = 0  # Total messages from users with multiple messages
-    single_ya_users = 0  # Users with single "ya" message
-    single_tidak_users = 0  # Users with single "tidak" message
-    other_single_messages = []  # List of other single messages
-    
-    # Process all messages
-    for match in query_result:
-        if match.metadata and not match.metadata.get("timestamp"):  # Only process messages without timestamp
-            user_name = match.metadata.get("user_name")
-            room_id = match.metadata.get("room_id")
-            sender_type = match.metadata.get("sender_type", "user")
-            text = match.metadata.get("text", "").strip()
-            
-            if user_name and room_id:
-                user_rooms[user_name].add(room_id)
-                user_messages[user_name] += 1
-                
-                # Count user vs agent messages
-                if sender_type == "user":
-                    user_message_count += 1
-                else:
-                    agent_message_count += 1
-    
-    # Calculate single and multiple message users
-    for user, count in user_messages.items():
-        if count == 1:
-            single_message_users += 1
-            # Find the single message for this user
-            for match in query_result:
-                if (match.metadata and 
-                    match.metadata.get("user_name") == user and 
-                    match.metadata.get("sender_type") == "user"):
-                    text = match.metadata.get("text", "").strip().lower()
-                    if text == "ya":
-                        single_ya_users += 1
-                    elif text == "tidak":
-                        single_tidak_users += 1
-                    else:
-                        other_single_messages.append({
-                            "user": user,
-                            "message": match.metadata.get("text", "").strip()
-                        })
-                    break
-        elif count >= 2:
-            multiple_message_users += 1
-            multiple_message_total += count
-    
-    # Calculate metrics
-    total_users = len(user_rooms)
-    total_rooms = len(set(room for rooms in user_rooms.values() for room in rooms))
-    avg_messages_per_user = sum(user_messages.values()) / total_users if total_users > 0 else 0
-    single_message_percentage = (single_message_users / total_users * 100) if total_users > 0 else 0
-    multiple_message_percentage = (multiple_message_users / total_users * 100) if total_users > 0 else 0
-    avg_messages_multiple_users = multiple_message_total / multiple_message_users if multiple_message_users > 0 else 0
-    single_ya_percentage = (single_ya_users / single_message_users * 100) if single_message_users > 0 else 0
-    single_tidak_percentage = (single_tidak_users / single_message_users * 100) if single_message_users > 0 else 0
-    
-    return {
-        "total_users": total_users,
-        "total_rooms": total_rooms,
-        "avg_messages_per_user": round(avg_messages_per_user, 2),
-        "total_messages": total_messages,
-        "user_messages": user_message_count,
-        "agent_messages": agent_message_count,
-        "single_message_users": single_message_users,
-        "single_message_percentage": round(single_message_percentage, 1),
-        "multiple_message_users": multiple_message_users,
-        "multiple_message_percentage": round(multiple_message_percentage, 1),
-        "avg_messages_multiple_users": round(avg_messages_multiple_users, 2),
-        "single_ya_users": single_ya_users,
-        "single_ya_percentage": round(single_ya_percentage, 1),
-        "single_tidak_users": single_tidak_users,
-        "single_tidak_percentage": round(single_tidak_percentage, 1),
-        "other_single_messages": other_single_messages,
-        "multiple_message_total": multiple_message_total
-    }
-
 try:
     # Environment setup
     openai.api_key = os.getenv("OPENAI_API_KEY")
-    pinecone_api_key = os.getenv("PINECONE_API_KEY")
-    pinecone_index_name = os.getenv("PINECONE_INDEX")
 
-    # Init Pinecone
-    pc = Pinecone(api_key=pinecone_api_key)
-    index = pc.Index(pinecone_index_name)
+    # Start from the local SQLite store or Parquet snapshot (kept current by
+    # ingest_worker.py) when one is configured, otherwise connect to the index
+    # backend (Pinecone, or the offline fake)
+    index, snapshot_dir, message_db = resolve_message_source()
 
     # Title
     st.title("Whatsapp AI bot interaction before May")
@@ -159,104 +72,57 @@ try:
     
     try:
         status_text.text("Fetching user list...")
-        # Query to get all unique user names
-        query_result = index.query(
-            vector=[0.0]*1536,
-            namespace="messages",
-            filter={"timestamp": {"$exists": False}},  # Only get messages without timestamp
-            top_k=1000,
-            include_metadata=True
-        )
-        
-        progress_bar.progress(50)
-        status_text.text("Processing user list...")
-        
-        # Ensure query_result is handled correctly
-        if isinstance(query_result, list):
-            messages = query_result
+        message_filter = {"timestamp": {"$exists": False}}  # Only get messages without timestamp
+        if METRICS_STATE_PATH:
+            # Persisted aggregate state: a refresh only fetches and folds in new messages
+            metrics, fetched_at = cached_incremental_metrics(
+                index,
+                METRICS_STATE_PATH,
+                namespace=MESSAGES_NAMESPACE,
+                filter=message_filter,
+                on_progress=progress_callback(progress_bar, status_text, "Fetching new messages"),
+                snapshot_dir=snapshot_dir,
+                message_db=message_db
+            )
         else:
-            messages = query_result.matches
-
-        # Calculate metrics directly from messages (no need to filter again)
-        metrics = calculate_metrics(messages)
+            # Load every message in the namespace (no top_k truncation), cached across reruns
+            messages, fetched_at = cached_load_messages(
+                index,
+                namespace=MESSAGES_NAMESPACE,
+                filter=message_filter,
+                on_progress=progress_callback(progress_bar, status_text, "Fetching user list"),
+                snapshot_dir=snapshot_dir,
+                message_db=message_db
+            )
+            
+            metrics = None
         
-        # Display metrics in sidebar
+        # Display metrics in sidebar: the header first, then the metrics once computed
         with st.sidebar:
-            # Display date at the top
-            current_date = datetime.now().strftime("%d/%m/%Y")
-            st.header(f"📅 {current_date}")
-            
-            # Overview Metrics Section
-            st.header("📊 Overview Metrics")
-            col1, col2 = st.columns(2)
-            with col1:
-                st.metric("Total Users", metrics["total_users"])
-                st.metric("Total Rooms", metrics["total_rooms"])
-            with col2:
-                st.metric("Total Messages", metrics["total_messages"])
-                st.metric("Avg Messages per User", metrics["avg_messages_per_user"])
-            
-            # User Analysis Section
-            st.header("👤 User Analysis")
-            
-            # Single Message Users Section
-            st.subheader("Single Message Users")
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric(
-                    "Total Single Message Users", 
-                    metrics["single_message_users"],
-                    f"{metrics['single_message_percentage']}%"
-                )
-            with col2:
-                st.metric(
-                    "Users saying 'Ya'", 
-                    metrics["single_ya_users"],
-                    f"{metrics['single_ya_percentage']}%"
-                )
-            with col3:
-                st.metric(
-                    "Users saying 'Tidak'", 
-                    metrics["single_tidak_users"],
-                    f"{metrics['single_tidak_percentage']}%"
+            render_sidebar_header(fetched_at)
+            interactive_at = time.perf_counter()
+            if metrics is None:
+                status_text.text("Processing user list...")
+                # Calculate metrics directly from messages (no need to filter again), once per load
+                metrics = cached_metrics(messages, fetched_at, filter=message_filter)
+            with span("render sidebar"):
+                render_metrics(metrics, index, fetched_at)
+            with span("render conversations"):
+                render_conversations(
+                    lambda: cached_conversation_metrics(index, snapshot_dir=snapshot_dir, message_db=message_db),
+                    show_by_default=bool(snapshot_dir or message_db)  # Cheap with a local store
                 )
-            
-            # Show other single messages if any
-            if metrics["other_single_messages"]:
-                with st.expander("Other Single Messages"):
-                    for msg in metrics["other_single_messages"]:
-                        st.write(f"**{msg['user']}**: {msg['message']}")
-            
-            # Multiple Message Users Section
-            st.subheader("Multiple Message Users")
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric(
-                    "Total Multiple Message Users", 
-                    metrics["multiple_message_users"],
-                    f"{metrics['multiple_message_percentage']}%"
-                )
-            with col2:
-                st.metric(
-                    "Total Messages", 
-                    metrics["multiple_message_total"]
+            with span("render activity"):
+                render_activity(
+                    lambda: cached_rollups(index, snapshot_dir=snapshot_dir, message_db=message_db),
+                    show_by_default=bool(snapshot_dir or message_db)  # Cheap with a local store
                 )
-            with col3:
-                st.metric(
-                    "Avg Messages per User", 
-                    round(metrics["avg_messages_multiple_users"], 2)
-                )
-            
-            # Message Metrics Section
-            st.header("📝 Message Metrics")
-            col1, col2 = st.columns(2)
-            with col1:
-                st.metric("User Messages", metrics["user_messages"])
-            with col2:
-                st.metric("Agent Messages", metrics["agent_messages"])
         
         progress_bar.progress(100)
         status_text.text("Ready!")
+        with st.sidebar:
+            render_timings(script_started, interactive_at)
+            render_performance(finish_trace())
         
     except Exception as e:
         st.error(f"Error fetching user list: {str(e)}")
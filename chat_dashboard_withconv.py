@@ -1,13 +1,27 @@
 import os
 import streamlit as st
-from pinecone import Pinecone
 from dotenv import load_dotenv
 import openai
 import asyncio
 import socket
 import sys
-from datetime import datetime
-from collections import defaultdict
+import time
+from metrics import cached_metrics
+from incremental_metrics import METRICS_STATE_PATH, cached_incremental_metrics
+from conversation_metrics import cached_conversation_metrics
+from conversation_loader import get_conversation_index
+from conversation_view import USER_KEY, render_conversation, render_search, room_key
+from index_backend import resolve_message_source
+from message_loader import MESSAGES_NAMESPACE, cached_load_messages, progress_callback
+from search_index import get_search_index
+from perf import finish_trace, span, start_trace
+from rollups import cached_rollups
+from sidebar_view import metrics_placeholder, render_activity, render_conversations, render_metrics, render_sidebar_header, render_performance, render_timings
+from timestamps import format_timestamp
+from sqlite_store import get_message_store
+
+script_started = time.perf_counter()
+start_trace(os.path.basename(__file__))
 
 # Set page config for wider sidebar - MUST be first Streamlit command
 st.set_page_config(
@@ -45,110 +59,14 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
-def format_timestamp(timestamp_str):
-    try:
-        # Convert timestamp to datetime object
-        dt = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-        # Format as: Day, Month Date, Year, Time
-        return dt.strftime("%A, %B %d, %Y, %I:%M %p")
-    except:
-        return timestamp_str  # Return original if parsing fails
-
-def calculate_metrics(query_result):
-    # Initialize counters
-    total_messages = len(query_result)
-    user_rooms = defaultdict(set)  # user -> set of rooms
-    user_messages = defaultdict(int)  # user -> total number of messages
-    user_message_count = 0
-    agent_message_count = 0
-    single_message_users = 0  # Count users with only one message
-    multiple_message_users = 0  # Count users with 2 or more messages
-    multiple_message_total = 0  # Total messages from users with multiple messages
-    single_ya_users = 0  # Users with single "ya" message
-    single_tidak_users = 0  # Users with single "tidak" message
-    other_single_messages = []  # List of other single messages
-    
-    # Process all messages
-    for match in query_result:
-        if match.metadata and not match.metadata.get("timestamp"):  # Only process messages without timestamp
-            user_name = match.metadata.get("user_name")
-            room_id = match.metadata.get("room_id")
-            sender_type = match.metadata.get("sender_type", "user")
-            text = match.metadata.get("text", "").strip()
-            
-            if user_name and room_id:
-                user_rooms[user_name].add(room_id)
-                user_messages[user_name] += 1
-                
-                # Count user vs agent messages
-                if sender_type == "user":
-                    user_message_count += 1
-                else:
-                    agent_message_count += 1
-    
-    # Calculate single and multiple message users
-    for user, count in user_messages.items():
-        if count == 1:
-            single_message_users += 1
-            # Find the single message for this user
-            for match in query_result:
-                if (match.metadata and 
-                    match.metadata.get("user_name") == user and 
-                    match.metadata.get("sender_type") == "user"):
-                    text = match.metadata.get("text", "").strip().lower()
-                    if text == "ya":
-                        single_ya_users += 1
-                    elif text == "tidak":
-                        single_tidak_users += 1
-                    else:
-                        other_single_messages.append({
-                            "user": user,
-                            "message": match.metadata.get("text", "").strip()
-                        })
-                    break
-        elif count >= 2:
-            multiple_message_users += 1
-            multiple_message_total += count
-    
-    # Calculate metrics
-    total_users = len(user_rooms)
-    total_rooms = len(set(room for rooms in user_rooms.values() for room in rooms))
-    avg_messages_per_user = sum(user_messages.values()) / total_users if total_users > 0 else 0
-    single_message_percentage = (single_message_users / total_users * 100) if total_users > 0 else 0
-    multiple_message_percentage = (multiple_message_users / total_users * 100) if total_users > 0 else 0
-    avg_messages_multiple_users = multiple_message_total / multiple_message_users if multiple_message_users > 0 else 0
-    single_ya_percentage = (single_ya_users / single_message_users * 100) if single_message_users > 0 else 0
-    single_tidak_percentage = (single_tidak_users / single_message_users * 100) if single_message_users > 0 else 0
-    
-    return {
-        "total_users": total_users,
-        "total_rooms": total_rooms,
-        "avg_messages_per_user": round(avg_messages_per_user, 2),
-        "total_messages": total_messages,
-        "user_messages": user_message_count,
-        "agent_messages": agent_message_count,
-        "single_message_users": single_message_users,
-        "single_message_percentage": round(single_message_percentage, 1),
-        "multiple_message_users": multiple_message_users,
-        "multiple_message_percentage": round(multiple_message_percentage, 1),
-        "avg_messages_multiple_users": round(avg_messages_multiple_users, 2),
-        "single_ya_users": single_ya_users,
-        "single_ya_percentage": round(single_ya_percentage, 1),
-        "single_tidak_users": single_tidak_users,
-        "single_tidak_percentage": round(single_tidak_percentage, 1),
-        "other_single_messages": other_single_messages,
-        "multiple_message_total": multiple_message_total
-    }
-
 try:
     # Environment setup
     openai.api_key = os.getenv("OPENAI_API_KEY")
-    pinecone_api_key = os.getenv("PINECONE_API_KEY")
-    pinecone_index_name = os.getenv("PINECONE_INDEX")
 
-    # Init Pinecone
-    pc = Pinecone(api_key=pinecone_api_key)
-    index = pc.Index(pinecone_index_name)
+    # Start from the local SQLite store or Parquet snapshot (kept current by
+    # ingest_worker.py) when one is configured, otherwise connect to the index
+    # backend (Pinecone, or the offline fake)
+    index, snapshot_dir, message_db = resolve_message_source()
 
     # Title
     st.title("Whatsapp AI bot interaction")
@@ -159,112 +77,37 @@ try:
     
     try:
         status_text.text("Fetching user list...")
-        # Query to get all unique user names
-        query_result = index.query(
-            vector=[0.0]*1536,
-            namespace="messages",
-            filter={"timestamp": {"$exists": False}},  # Only get messages without timestamp
-            top_k=1000,
-            include_metadata=True
-        )
-        
-        progress_bar.progress(50)
-        status_text.text("Processing user list...")
-        
-        # Ensure query_result is handled correctly
-        if isinstance(query_result, list):
-            messages = query_result
+        message_filter = {"timestamp": {"$exists": False}}  # Only get messages without timestamp
+
+        def load_messages():
+            # Load every message in the namespace (no top_k truncation), cached across reruns
+            return cached_load_messages(
+                index,
+                namespace=MESSAGES_NAMESPACE,
+                filter=message_filter,
+                on_progress=progress_callback(progress_bar, status_text, "Fetching user list"),
+                snapshot_dir=snapshot_dir,
+                message_db=message_db
+            )
+
+        if message_db:
+            # User, room and conversation lookups are indexed SQLite queries,
+            # so the browser is drawn before the messages are loaded
+            conversations = get_message_store(message_db).conversations(message_filter)
+            messages = fetched_at = None
         else:
-            messages = query_result.matches
+            messages, fetched_at = load_messages()
+            # Group messages without timestamps by user and room (built once per load)
+            conversations = get_conversation_index(messages, fetched_at, filter=message_filter)
+        user_names = conversations.users()
 
-        # Calculate metrics directly from messages (no need to filter again)
-        metrics = calculate_metrics(messages)
-        
-        # Display metrics in sidebar
+        # Sidebar header now; the metrics fill in once the conversation view is drawn
         with st.sidebar:
-            # Display date at the top
-            current_date = datetime.now().strftime("%d/%m/%Y")
-            st.header(f"📅 {current_date}")
-            
-            # Overview Metrics Section
-            st.header("📊 Overview Metrics")
-            col1, col2 = st.columns(2)
-            with col1:
-                st.metric("Total Users", metrics["total_users"])
-                st.metric("Total Rooms", metrics["total_rooms"])
-            with col2:
-                st.metric("Total Messages", metrics["total_messages"])
-                st.metric("Avg Messages per User", metrics["avg_messages_per_user"])
-            
-            # User Analysis Section
-            st.header("👤 User Analysis")
-            
-            # Single Message Users Section
-            st.subheader("Single Message Users")
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric(
-                    "Total Single Message Users", 
-                    metrics["single_message_users"],
-                    f"{metrics['single_message_percentage']}%"
-                )
-            with col2:
-                st.metric(
-                    "Users saying 'Ya'", 
-                    metrics["single_ya_users"],
-                    f"{metrics['single_ya_percentage']}%"
-                )
-            with col3:
-                st.metric(
-                    "Users saying 'Tidak'", 
-                    metrics["single_tidak_users"],
-                    f"{metrics['single_tidak_percentage']}%"
-                )
-            
-            # Show other single messages if any
-            if metrics["other_single_messages"]:
-                with st.expander("Other Single Messages"):
-                    for msg in metrics["other_single_messages"]:
-                        st.write(f"**{msg['user']}**: {msg['message']}")
-            
-            # Multiple Message Users Section
-            st.subheader("Multiple Message Users")
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric(
-                    "Total Multiple Message Users", 
-                    metrics["multiple_message_users"],
-                    f"{metrics['multiple_message_percentage']}%"
-                )
-            with col2:
-                st.metric(
-                    "Total Messages", 
-                    metrics["multiple_message_total"]
-                )
-            with col3:
-                st.metric(
-                    "Avg Messages per User", 
-                    round(metrics["avg_messages_multiple_users"], 2)
-                )
-            
-            # Message Metrics Section
-            st.header("📝 Message Metrics")
-            col1, col2 = st.columns(2)
-            with col1:
-                st.metric("User Messages", metrics["user_messages"])
-            with col2:
-                st.metric("Agent Messages", metrics["agent_messages"])
-        
-        # Extract unique user names from messages without timestamps
-        user_names = set()
-        for match in messages:
-            if match.metadata and "user_name" in match.metadata:
-                user_names.add(match.metadata["user_name"])
-        
-        user_names = sorted(list(user_names))
-        progress_bar.progress(100)
-        status_text.text("Ready!")
-        
+            header_slot = st.container()
+            metrics_slot = metrics_placeholder()
+            timings_slot = st.empty()
+        search_slot = st.container()
+
         # Display total number of users
         st.subheader(f"Total Users: {len(user_names)}")
         
@@ -275,31 +118,15 @@ try:
             selected_user = st.selectbox(
                 "Select a user to view conversations:",
                 options=user_names,
-                format_func=lambda x: f"User: {x}"
+                format_func=lambda x: f"User: {x}",
+                key=USER_KEY
             )
 
             if selected_user:
-                with st.spinner("Fetching messages..."):
+                with st.spinner("Loading conversations..."):
                     try:
-                        # Run the query for selected user
-                        query_result = index.query(
-                            vector=[0.0]*1536,
-                            namespace="messages",
-                            filter={
-                                "$and": [
-                                    {"user_name": {"$eq": selected_user}},
-                                    {"timestamp": {"$exists": False}}  # Only get messages without timestamp
-                                ]
-                            },
-                            top_k=1000,
-                            include_metadata=True
-                        )
-
-                        # Get unique room_ids
-                        room_ids = set()
-                        for match in query_result.matches:
-                            if match.metadata and "room_id" in match.metadata:
-                                room_ids.add(match.metadata["room_id"])
+                        # Rooms of the selected user, looked up in the conversation index
+                        room_ids = conversations.rooms(selected_user)
 
                         if room_ids:
                             st.subheader(f"Found conversations in {len(room_ids)} rooms:")
@@ -307,53 +134,78 @@ try:
                             # Display room selection
                             selected_room = st.selectbox(
                                 "Select a room to view messages:",
-                                options=list(room_ids),
-                                format_func=lambda x: f"Room: {x}"
+                                options=room_ids,
+                                format_func=lambda x: f"Room: {x}",
+                                key=room_key(selected_user)
                             )
 
                             if selected_room:
-                                # Filter messages for selected room
-                                room_messages = [
-                                    m.metadata for m in query_result.matches
-                                    if m.metadata and m.metadata.get("room_id") == selected_room
-                                ]
-                                
-                                # Sort messages by timestamp
-                                sorted_messages = sorted(room_messages, key=lambda x: x.get("timestamp", ""))
-                                
-                                # Create a container for the conversation
-                                conversation_container = st.container()
-                                
-                                with conversation_container:
-                                    st.write("---")  # Add a separator before the conversation
-                                    
-                                    # Display messages in chronological order
-                                    for msg in sorted_messages:
-                                        role = msg.get("sender_type", "user")
-                                        content = msg.get("text", "")
-                                        timestamp = msg.get("timestamp", "")
-                                        formatted_time = format_timestamp(timestamp)
-                                        
-                                        # Create columns for message layout
-                                        col1, col2 = st.columns([1, 4])
-                                        
-                                        with col1:
-                                            st.write(formatted_time)
-                                        
-                                        with col2:
-                                            if role == "user":
-                                                st.write("**User:**")
-                                                st.chat_message("user").write(content)
-                                            else:
-                                                st.write("**Agent:**")
-                                                st.chat_message("assistant").write(content)
-                                        
-                                        st.write("---")  # Add a separator between messages
+                                # Render the selected room one page at a time
+                                with span("render conversation"):
+                                    render_conversation(conversations, selected_user, selected_room, format_timestamp)
                                     
                         else:
                             st.info("No conversations found for this user.")
                     except Exception as e:
                         st.error(f"Error during query: {str(e)}")
+        interactive_at = time.perf_counter()
+
+        status_text.text("Computing metrics...")
+        if METRICS_STATE_PATH:
+            # Persisted aggregate state: a refresh only folds in new messages
+            metrics, metrics_at = cached_incremental_metrics(
+                index,
+                METRICS_STATE_PATH,
+                namespace=MESSAGES_NAMESPACE,
+                filter=message_filter,
+                on_progress=progress_callback(progress_bar, status_text, "Fetching new messages"),
+                snapshot_dir=snapshot_dir,
+                message_db=message_db
+            )
+        else:
+            metrics = metrics_at = None
+
+        if message_db:
+            # Full-text search runs on the store's FTS5 table, so the messages
+            # are only loaded when the metrics need them
+            search_index = get_message_store(message_db).search_index(message_filter)
+            if metrics is None:
+                status_text.text("Loading messages for metrics...")
+                messages, fetched_at = load_messages()
+            else:
+                fetched_at = metrics_at
+        else:
+            # In-memory index over the loaded messages (built once, then only
+            # new messages are added)
+            search_index = get_search_index(messages, fetched_at, filter=message_filter)
+        with header_slot:
+            render_sidebar_header(fetched_at)
+
+        # Full-text search across every conversation; a hit opens its conversation below
+        with search_slot, span("render search"):
+            render_search(search_index, conversations, format_timestamp)
+
+        if metrics is None:
+            # Calculate metrics directly from messages (no need to filter again), once per load
+            metrics = cached_metrics(messages, fetched_at, filter=message_filter)
+        with metrics_slot.container():
+            with span("render sidebar"):
+                render_metrics(metrics, index, fetched_at)
+            with span("render conversations"):
+                render_conversations(
+                    lambda: cached_conversation_metrics(index, snapshot_dir=snapshot_dir, message_db=message_db),
+                    show_by_default=bool(snapshot_dir or message_db)  # Cheap with a local store
+                )
+            with span("render activity"):
+                render_activity(
+                    lambda: cached_rollups(index, snapshot_dir=snapshot_dir, message_db=message_db),
+                    show_by_default=bool(snapshot_dir or message_db)  # Cheap with a local store
+                )
+        progress_bar.progress(100)
+        status_text.text("Ready!")
+        with timings_slot.container():
+            render_timings(script_started, interactive_at)
+            render_performance(finish_trace())
     except Exception as e:
         st.error(f"Error fetching user list: {str(e)}")
     finally:
@@ -361,4 +213,4 @@ try:
         status_text.empty()
 
 except Exception as e:
-    st.error(f"Error initializing Pinecone: {str(e)}")
\ No newline at end of file
+    st.error(f"Error initializing Pinecone: {str(e)}")
@@ -0,0 +1,104 @@
+import bisect
+import threading
+from collections import OrderedDict
+
+from message_loader import MESSAGES_NAMESPACE
+from perf import span
+from query_cache import cache_key, get_shared_cache
+from timestamps import sort_key
+
+# Conversation access for the conversation dashboard.
+# Loaded messages are grouped once into user -> room -> messages, so listing
+# a user's rooms and opening a room are dictionary lookups instead of scans
+# over every message. Sorted rooms are kept in a bounded LRU so switching
+# back and forth between recently viewed rooms costs nothing.
+
+ROOM_CACHE_SIZE = 64  # Sorted rooms kept per conversation index
+ROOM_PAGE_SIZE = 50
+
+
+class ConversationIndex:
+    def __init__(self, records, cache_size=ROOM_CACHE_SIZE):
+        self._rooms = {}  # user -> {room -> [record, ...]} in load order
+        self._sorted = OrderedDict()  # (user, room) -> records sorted by timestamp
+        self.cache_size = cache_size
+        self._lock = threading.Lock()  # Shared by every session served by this process
+        for record in records:
+            if record.user_name is None:
+                continue
+            rooms = self._rooms.setdefault(record.user_name, {})
+            if record.room_id is not None:
+                rooms.setdefault(record.room_id, []).append(record)
+
+    def users(self):
+        return sorted(self._rooms)
+
+    def rooms(self, user_name):
+        # Room IDs of a user, in the order they were first seen
+        return list(self._rooms.get(user_name, {}))
+
+    def room_size(self, user_name, room_id):
+        return len(self._rooms.get(user_name, {}).get(room_id, ()))
+
+    def room_messages(self, user_name, room_id):
+        key = (user_name, room_id)
+        with self._lock:
+            messages = self._sorted.get(key)
+            if messages is not None:
+                self._sorted.move_to_end(key)
+                return messages
+        with span("sort room") as timing:
+            messages = sorted(self._rooms.get(user_name, {}).get(room_id, []), key=sort_key)
+            timing.add(records=len(messages))
+        with self._lock:
+            self._sorted[key] = messages
+            while len(self._sorted) > self.cache_size:
+                self._sorted.popitem(last=False)
+        return messages
+
+    def room_page(self, user_name, room_id, page=0, page_size=ROOM_PAGE_SIZE):
+        # One page of a room in chronological order; returns (messages, page_count)
+        messages = self.room_messages(user_name, room_id)
+        page_count = max(1, -(-len(messages) // page_size))
+        page = min(max(page, 0), page_count - 1)
+        return messages[page * page_size:(page + 1) * page_size], page_count
+
+    def room_position(self, user_name, room_id, epoch):
+        # Number of messages in the room before the given epoch second
+        return bisect.bisect_left(self.room_messages(user_name, room_id), (True, epoch), key=sort_key)
+
+    def room_date_bounds(self, user_name, room_id):
+        # (first, last) epoch second of the room's dated messages, or None
+        messages = self.room_messages(user_name, room_id)
+        if not messages or messages[-1].ts is None:
+            return None
+        first = bisect.bisect_left(messages, True, key=lambda record: record.ts is not None)
+        return messages[first].ts, messages[-1].ts
+
+    def message_position(self, user_name, room_id, message_id, ts=None):
+        # Position of a message within its room (for linking to its page), or None
+        messages = self.room_messages(user_name, room_id)
+        position = bisect.bisect_left(messages, (ts is not None, ts or 0), key=sort_key)
+        while position < len(messages) and sort_key(messages[position]) == (ts is not None, ts or 0):
+            if messages[position].id == message_id:
+                return position
+            position += 1
+        return None
+
+
+def get_conversation_index(records, fetched_at, namespace=MESSAGES_NAMESPACE, filter=None, cache=None):
+    # Conversation index for a loaded record set, built once and shared
+    # across reruns through the query cache (keyed by the load's timestamp)
+    if cache is None:
+        cache = get_shared_cache()
+    def build():
+        with span("index conversations") as timing:
+            timing.add(records=len(records))
+            return ConversationIndex(records)
+
+    index, _ = cache.get_or_load(
+        cache_key(namespace, filter, page=("conversations", fetched_at)),
+        build,
+        sizer=lambda index: 64 * len(records)
+    )
+    return index
@@ -0,0 +1,316 @@
+import math
+from bisect import bisect_right
+from collections import Counter
+
+from message_loader import MESSAGES_NAMESPACE
+from query_cache import cache_key, get_shared_cache
+
+# Per-room conversation metrics computed in one streaming pass.
+# Messages must arrive in conversation order: each room's messages undated
+# first, then by time (as in the conversation view); rooms may interleave.
+# Each room keeps a constant-size state: the sender of the last turn, when
+# the user started waiting, and turn and reply counters. From it come the
+# agent response latency (first message of a user turn to the agent's
+# reply, when both have a timestamp), the turns per conversation, a funnel
+# of how many user turns rooms reach and where users stop replying, and
+# per-room and per-user breakdowns. Latencies go into a fixed log-spaced
+# histogram, so percentiles cost no per-message memory. Every message is
+# analysed, dated or not (the sidebar counts only undated ones): the
+# SQLite store streams them from a sorted query, the other sources stream
+# through conversation_order, which sorts each room's messages on its own.
+
+FUNNEL_DEPTH = 5  # The last funnel step counts rooms with this many user turns or more
+LATENCY_GROWTH = 1.1  # Bucket width ratio; percentiles are within about 5%
+LATENCY_MAX_SECONDS = 90 * 86400  # Longer waits share the last bucket
+SNAPSHOT_COLUMNS = ["id", "user_name", "room_id", "sender_type", "timestamp"]  # All the analyzer reads
+ROOM_COLUMNS = ("user", "room", "messages", "turns", "user_turns", "ended_on_user", "responses", "latency_total")
+
+# Bucket upper bounds in whole seconds: [0, 1), [1, 2), ... growing by LATENCY_GROWTH
+LATENCY_EDGES = sorted({
+    int(LATENCY_GROWTH ** i + 0.999999)
+    for i in range(int(math.log(LATENCY_MAX_SECONDS, LATENCY_GROWTH)) + 2)
+})
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_EDGES) + 1)
+        self.total = 0
+        self.sum = 0
+
+    def add(self, seconds):
+        self.counts[bisect_right(LATENCY_EDGES, seconds)] += 1
+        self.total += 1
+        self.sum += seconds
+
+    def add_counts(self, counts, total, seconds):
+        # Bulk add of already bucketed latencies (vectorized engine)
+        for bucket, count in enumerate(counts):
+            self.counts[bucket] += int(count)
+        self.total += int(total)
+        self.sum += int(seconds)
+
+    def merge(self, other):
+        self.add_counts(other.counts, other.total, other.sum)
+        return self
+
+    def percentile(self, q):
+        # Nearest-rank percentile, reported as the middle of its bucket
+        if not self.total:
+            return None
+        rank = max(1, -(-self.total * q // 100))
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                low = LATENCY_EDGES[bucket - 1] if bucket else 0
+                high = LATENCY_EDGES[bucket] if bucket < len(LATENCY_EDGES) else low + 1
+                return round((low + high - 1) / 2, 1)
+        return None
+
+
+class RoomState:
+    __slots__ = ("messages", "turns", "user_turns", "last_is_user", "waiting_since", "responses", "latency_total")
+
+    def __init__(self):
+        self.messages = 0
+        self.turns = 0
+        self.user_turns = 0
+        self.last_is_user = None  # Sender of the last turn
+        self.waiting_since = None  # Time of the first dated message of the open user turn
+        self.responses = 0  # Agent replies with a measured latency
+        self.latency_total = 0
+
+
+class ConversationAnalyzer:
+    def __init__(self):
+        self.rooms = {}  # (user, room) -> RoomState, in the order rooms were first seen
+        self.latency = LatencyHistogram()
+
+    def add(self, record):
+        # Next message of its room, in conversation order
+        user_name = record.user_name
+        room_id = record.room_id
+        if not user_name or not room_id:
+            return
+        state = self.rooms.get((user_name, room_id))
+        if state is None:
+            state = self.rooms[(user_name, room_id)] = RoomState()
+        sender_type = record.sender_type
+        is_user = sender_type is None or sender_type == "user"
+        ts = record.ts
+        state.messages += 1
+        if is_user != state.last_is_user:
+            state.turns += 1
+            if is_user:
+                state.user_turns += 1
+                state.waiting_since = ts
+            else:
+                if state.last_is_user and state.waiting_since is not None and ts is not None:
+                    latency = ts - state.waiting_since
+                    self.latency.add(latency)
+                    state.responses += 1
+                    state.latency_total += latency
+                state.waiting_since = None
+            state.last_is_user = is_user
+        elif is_user and state.waiting_since is None:
+            state.waiting_since = ts
+
+    def add_all(self, records):
+        # Records in conversation order (see conversation_order)
+        for record in records:
+            self.add(record)
+
+    def room_columns(self):
+        # One list per ROOM_COLUMNS entry, one item per room
+        columns = {column: [] for column in ROOM_COLUMNS}
+        for (user_name, room_id), state in self.rooms.items():
+            columns["user"].append(user_name)
+            columns["room"].append(room_id)
+            columns["messages"].append(state.messages)
+            columns["turns"].append(state.turns)
+            columns["user_turns"].append(state.user_turns)
+            columns["ended_on_user"].append(bool(state.last_is_user))
+            columns["responses"].append(state.responses)
+            columns["latency_total"].append(state.latency_total)
+        return columns
+
+    def result(self):
+        return conversation_metrics_result(self.room_columns(), self.latency)
+
+
+def _nearest_rank(counts, total, q):
+    rank = max(1, -(-total * q // 100))
+    seen = 0
+    for value in sorted(counts):
+        seen += counts[value]
+        if seen >= rank:
+            return value
+    return None
+
+
+def _mean_latency(total, responses):
+    return round(total / responses, 1) if responses else None
+
+
+def conversation_metrics_result(columns, latency):
+    # Metrics dict shared by both engines, from ROOM_COLUMNS lists (one item
+    # per room, rooms in the order they were first seen) and the histogram
+    turns = columns["turns"]
+    user_turns = columns["user_turns"]
+    ended_on_user = columns["ended_on_user"]
+    rooms = len(turns)
+    turn_counts = Counter(turns)
+    reached = Counter(user_turns)
+    dropped = Counter(count for count, on_user in zip(user_turns, ended_on_user) if not on_user)
+
+    # Rooms reaching each number of user turns, and rooms where the user
+    # stopped replying after exactly that many (the agent had the last turn)
+    funnel = []
+    remaining = rooms
+    for step in range(FUNNEL_DEPTH + 1):
+        last = step == FUNNEL_DEPTH
+        funnel.append({
+            "user_turns": step,
+            "rooms": remaining,
+            "percentage": round(remaining / rooms * 100, 1) if rooms else 0,
+            "dropped": sum(n for count, n in dropped.items() if count >= step) if last else dropped[step],
+        })
+        remaining -= reached[step]
+
+    # Per-user totals, users in the order their first room was seen
+    users = {}
+    for user_name, messages, room_turns, responses, latency_total in zip(
+        columns["user"], columns["messages"], turns, columns["responses"], columns["latency_total"]
+    ):
+        totals = users.get(user_name)
+        if totals is None:
+            totals = users[user_name] = [0, 0, 0, 0, 0]
+        totals[0] += 1
+        totals[1] += messages
+        totals[2] += room_turns
+        totals[3] += responses
+        totals[4] += latency_total
+
+    return {
+        "conversation_rooms": rooms,
+        "turns_per_room": {
+            "mean": round(sum(turns) / rooms, 2) if rooms else 0,
+            "p50": _nearest_rank(turn_counts, rooms, 50),
+            "p90": _nearest_rank(turn_counts, rooms, 90),
+            "max": max(turns, default=None),
+        },
+        "response_latency": {
+            "responses": latency.total,
+            "mean_seconds": round(latency.sum / latency.total, 1) if latency.total else None,
+            "p50_seconds": latency.percentile(50),
+            "p90_seconds": latency.percentile(90),
+            "p99_seconds": latency.percentile(99),
+        },
+        "funnel": funnel,
+        "unanswered_rooms": sum(ended_on_user),
+        # Breakdowns as columns (one list per field), ready for st.dataframe
+        "rooms": {
+            "user": list(columns["user"]),
+            "room": list(columns["room"]),
+            "messages": list(columns["messages"]),
+            "turns": list(turns),
+            "user_turns": list(user_turns),
+            "responses": list(columns["responses"]),
+            "mean_latency_seconds": [_mean_latency(*pair) for pair in zip(columns["latency_total"], columns["responses"])],
+            "ended_on_user": list(ended_on_user),
+        },
+        "users": {
+            "user": list(users),
+            "rooms": [totals[0] for totals in users.values()],
+            "messages": [totals[1] for totals in users.values()],
+            "turns": [totals[2] for totals in users.values()],
+            "responses": [totals[3] for totals in users.values()],
+            "mean_latency_seconds": [_mean_latency(totals[4], totals[3]) for totals in users.values()],
+        },
+    }
+
+
+def calculate_conversation_metrics(records):
+    # Records in conversation order
+    analyzer = ConversationAnalyzer()
+    analyzer.add_all(records)
+    return analyzer.result()
+
+
+def _conversation_key(record):
+    # Undated messages first, then by time; ties in ID (load) order
+    return record.ts is not None, record.ts or 0, record.id
+
+
+def conversation_order(records):
+    # Records with a user and a room, in conversation order. They are grouped
+    # by room as they stream in and each room is sorted on its own, so no
+    # sort ever spans more than one room; rooms come in the order they first
+    # appear and are let go once yielded.
+    rooms = {}
+    for record in records:
+        if record.user_name and record.room_id:
+            key = (record.user_name, record.room_id)
+            room = rooms.get(key)
+            if room is None:
+                room = rooms[key] = []
+            room.append(record)
+    for key in list(rooms):
+        room = rooms.pop(key)
+        room.sort(key=_conversation_key)
+        yield from room
+
+
+def conversation_records(index, namespace=MESSAGES_NAMESPACE, snapshot_dir=None, message_db=None):
+    # Every message with a user and a room, dated or not, in conversation
+    # order. Streamed from the source: nothing is loaded into the shared
+    # cache, and the snapshot is read file by file without the text.
+    if message_db:
+        from sqlite_store import get_message_store
+
+        return get_message_store(message_db).conversation_records()
+    if snapshot_dir:
+        from snapshot_store import iter_snapshot_messages
+
+        return conversation_order(iter_snapshot_messages(snapshot_dir, columns=SNAPSHOT_COLUMNS))
+    from message_loader import iter_messages
+
+    return conversation_order(iter_messages(index, namespace=namespace))
+
+
+def compute_conversation_metrics(records, engine=None):
+    # Conversation metrics with the configured engine (the pandas engine, or
+    # the streaming analyzer for every other one)
+    from metrics import METRICS_ENGINE
+
+    if (engine or METRICS_ENGINE) == "pandas":
+        from vectorized_metrics import calculate_conversation_metrics_df, messages_frame
+
+        return calculate_conversation_metrics_df(messages_frame(records))
+    return calculate_conversation_metrics(records)
+
+
+def cached_conversation_metrics(index, namespace=MESSAGES_NAMESPACE, snapshot_dir=None, message_db=None, engine=None, cache=None):
+    # Conversation metrics of the whole namespace, shared across reruns and
+    # keyed by the data version like rollups.cached_rollups
+    from metrics import METRICS_ENGINE
+
+    if cache is None:
+        cache = get_shared_cache()
+    if message_db:
+        from sqlite_store import get_message_store
+
+        version = f"sqlite:{message_db}:{get_message_store(message_db).version()}"
+    elif snapshot_dir:
+        from snapshot_store import snapshot_version
+
+        version = f"snapshot:{snapshot_dir}:{snapshot_version(snapshot_dir)}"
+    else:
+        version = f"index:{namespace}"  # No version to key on: recomputed when the cache entry expires
+    metrics, _ = cache.get_or_load(
+        cache_key(namespace, None, page=("conversations", version, engine or METRICS_ENGINE)),
+        lambda: compute_conversation_metrics(conversation_records(index, namespace, snapshot_dir, message_db), engine),
+        sizer=lambda metrics: 128 * metrics["conversation_rooms"]
+    )
+    return metrics
@@ -0,0 +1,150 @@
+import html
+
+import streamlit as st
+
+from conversation_loader import ROOM_PAGE_SIZE
+from timestamps import date_to_epoch, epoch_to_date
+
+# Windowed conversation renderer.
+# Only one page of a room is rendered per run, so the number of Streamlit
+# elements (and the render time) stays flat however long the room is.
+# "Compact" mode renders the whole page as a single pre-built HTML block
+# instead of several elements per message. "Jump to date" is only offered
+# for rooms with dated messages.
+
+PAGE_SIZES = [25, 50, 100, 200]
+RENDER_MODES = ["Chat", "Compact"]
+SEARCH_DISPLAY_LIMIT = 20
+USER_KEY = "conversation_user"  # Session state keys of the user/room selectboxes
+
+
+def room_key(user_name):
+    return f"conversation_room:{user_name}"
+
+
+def page_key(user_name, room_id):
+    return f"conversation_page:{user_name}:{room_id}"
+
+CONVERSATION_CSS = """
+<style>
+.conv-msg { display: flex; gap: 1rem; padding: 0.4rem 0; border-bottom: 1px solid rgba(128, 128, 128, 0.2); }
+.conv-time { flex: 0 0 20%; color: gray; font-size: 0.85rem; }
+.conv-body { flex: 1; white-space: pre-wrap; }
+.conv-agent .conv-body { color: #1f6feb; }
+</style>
+"""
+
+
+def _render_chat(messages, format_time):
+    # Same layout as before, limited to one page
+    for record in messages:
+        msg = record  # Metadata fields through MessageRecord.get
+        role = msg.get("sender_type", "user")
+        content = msg.get("text", "")
+        formatted_time = format_time(msg.get("timestamp", ""))
+
+        # Create columns for message layout
+        col1, col2 = st.columns([1, 4])
+
+        with col1:
+            st.write(formatted_time)
+
+        with col2:
+            if role == "user":
+                st.write("**User:**")
+                st.chat_message("user").write(content)
+            else:
+                st.write("**Agent:**")
+                st.chat_message("assistant").write(content)
+
+        st.write("---")  # Add a separator between messages
+
+
+def _render_compact(messages, format_time):
+    # One markdown element for the whole page
+    rows = []
+    for record in messages:
+        msg = record  # Metadata fields through MessageRecord.get
+        is_user = msg.get("sender_type", "user") == "user"
+        rows.append(
+            f'<div class="conv-msg {"conv-user" if is_user else "conv-agent"}">'
+            f'<div class="conv-time">{html.escape(str(format_time(msg.get("timestamp", ""))))}</div>'
+            f'<div class="conv-body"><b>{"User" if is_user else "Agent"}:</b> '
+            f'{html.escape(str(msg.get("text", "")))}</div></div>'
+        )
+    st.markdown(CONVERSATION_CSS + "".join(rows), unsafe_allow_html=True)
+
+
+def render_conversation(conversations, user_name, room_id, format_time):
+    # conversations: a ConversationIndex or a sqlite_store.StoreConversations
+    message_count = conversations.room_size(user_name, room_id)
+    date_bounds = conversations.room_date_bounds(user_name, room_id)
+    state_key = page_key(user_name, room_id)
+    date_key = f"conversation_jump:{user_name}:{room_id}"
+
+    def go_to(target):
+        st.session_state[state_key] = target
+
+    def jump_to_date():
+        # First message on or after the chosen date, using the precomputed epoch timestamps
+        jump_date = st.session_state[date_key]
+        if jump_date is not None and message_count:
+            position = conversations.room_position(user_name, room_id, date_to_epoch(jump_date))
+            go_to(min(position, message_count - 1) // st.session_state["conversation_page_size"])
+
+    col1, col2, col3 = st.columns([2, 1, 2])
+    with col1:
+        mode = st.radio("Display", RENDER_MODES, horizontal=True, key="conversation_mode")
+    with col2:
+        page_size = st.selectbox("Messages per page", PAGE_SIZES, index=PAGE_SIZES.index(ROOM_PAGE_SIZE), key="conversation_page_size")
+    if date_bounds is not None:
+        with col3:
+            first_day, last_day = (epoch_to_date(epoch) for epoch in date_bounds)
+            st.date_input("Jump to date", value=None, min_value=first_day, max_value=last_day, key=date_key, on_change=jump_to_date)
+
+    page_count = max(1, -(-message_count // page_size))
+    if state_key not in st.session_state:
+        go_to(page_count - 1)  # Start with the most recent messages
+    page = min(st.session_state[state_key], page_count - 1)
+
+    page_messages, page_count = conversations.room_page(user_name, room_id, page, page_size)
+    first = page * page_size + 1 if message_count else 0
+    st.caption(f"Messages {first:,}–{page * page_size + len(page_messages):,} of {message_count:,} (page {page + 1} of {page_count})")
+
+    nav_older, nav_newer = st.columns(2)
+    with nav_older:
+        st.button("⬆️ Load older", disabled=page == 0, on_click=go_to, args=(page - 1,), key=f"{state_key}:older")
+    with nav_newer:
+        st.button("⬇️ Newer", disabled=page >= page_count - 1, on_click=go_to, args=(page + 1,), key=f"{state_key}:newer")
+
+    st.write("---")  # Add a separator before the conversation
+    if mode == "Compact":
+        _render_compact(page_messages, format_time)
+    else:
+        _render_chat(page_messages, format_time)
+
+
+def render_search(search_index, conversations, format_time):
+    # Search box over every conversation; "Open" selects the hit's user and
+    # room and turns to the page holding the message
+    query = st.text_input("🔍 Search messages", key="message_search", placeholder="Words to find, e.g. harga")
+    if not query.strip():
+        return
+
+    def open_hit(hit):
+        st.session_state[USER_KEY] = hit.user_name
+        st.session_state[room_key(hit.user_name)] = hit.room_id
+        position = conversations.message_position(hit.user_name, hit.room_id, hit.id, hit.ts)
+        if position is not None:
+            st.session_state[page_key(hit.user_name, hit.room_id)] = position // st.session_state.get("conversation_page_size", ROOM_PAGE_SIZE)
+
+    hits = [hit for hit in search_index.search(query) if hit.user_name and hit.room_id][:SEARCH_DISPLAY_LIMIT]
+    total = search_index.count(query)
+    st.caption(f"{total:,} matching messages" + (f", showing the {len(hits)} most recent" if total > len(hits) else ""))
+    for hit in hits:
+        col1, col2 = st.columns([5, 1])
+        with col1:
+            when = format_time(hit.timestamp) if hit.timestamp else "no timestamp"
+            st.markdown(f"**{hit.user_name}** · {hit.room_id} · {when}  \n{hit.text}")
+        with col2:
+            st.button("Open", key=f"search_hit:{hit.id}", on_click=open_hit, args=(hit,))
@@ -0,0 +1,180 @@
+import bisect
+import json
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from message_loader import MESSAGES_NAMESPACE, matches_filter
+
+# In-process stand-in for a Pinecone index, used by tests and benchmarks.
+# Implements the calls the dashboards make (query, list/list_paginated,
+# fetch, describe_index_stats) over in-memory data, with the metadata
+# filter operators from message_loader.matches_filter and optional
+# simulated latency and rate limiting per call.
+
+DEFAULT_DIMENSION = 1536
+
+
+class FakeVector:
+    __slots__ = ("id", "values", "metadata", "score")
+
+    def __init__(self, id, values=None, metadata=None, score=None):
+        self.id = id
+        self.values = values or []
+        self.metadata = metadata
+        self.score = score
+
+
+class FakeResponse:
+    # Attribute bag mirroring the Pinecone response objects
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class FakeRateLimitError(Exception):
+    # Raised like Pinecone's PineconeApiException for an HTTP 429 response
+    status = 429
+
+    def __init__(self, method):
+        super().__init__(f"(429) Too Many Requests: {method}")
+
+
+class FakeIndex:
+    def __init__(self, dimension=DEFAULT_DIMENSION, latency=0.0, jitter=0.0, throttle_rate=0.0, seed=None):
+        self.dimension = dimension
+        self.latency = latency  # Seconds added to every call
+        self.jitter = jitter  # Extra random delay, up to this many seconds
+        self.throttle_rate = throttle_rate  # Fraction of calls rejected with a 429
+        self.calls = {}  # method name -> number of calls, for assertions in tests
+        self._namespaces = {}  # namespace -> OrderedDict(id -> FakeVector)
+        self._sorted_ids = {}  # namespace -> sorted IDs, rebuilt after upserts
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_records(cls, records, namespace=MESSAGES_NAMESPACE, **kwargs):
+        # Build from loaded records (anything with .id and .metadata)
+        index = cls(**kwargs)
+        index.upsert([(r.id, None, r.metadata) for r in records], namespace=namespace)
+        return index
+
+    @classmethod
+    def from_jsonl(cls, path, namespace=MESSAGES_NAMESPACE, **kwargs):
+        # One JSON object per line: either {"id", "values", "metadata"} or a
+        # plain metadata object (the id is taken from "id" or the line number)
+        vectors = []
+        with open(path) as f:
+            for line_number, line in enumerate(f):
+                line = line.strip()
+                if not line:
+                    continue
+                item = json.loads(line)
+                if "metadata" in item:
+                    vectors.append((str(item.get("id", line_number)), item.get("values"), item["metadata"]))
+                else:
+                    vectors.append((str(item.get("id", line_number)), None, item))
+        index = cls(**kwargs)
+        index.upsert(vectors, namespace=namespace)
+        return index
+
+    def _simulate_call(self, name):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            delay = self.latency + (self._random.random() * self.jitter if self.jitter else 0)
+            throttled = self.throttle_rate and self._random.random() < self.throttle_rate
+        if delay:
+            time.sleep(delay)
+        if throttled:
+            raise FakeRateLimitError(name)
+
+    def _vectors(self, namespace):
+        return self._namespaces.get(namespace or "", OrderedDict())
+
+    def upsert(self, vectors, namespace=None):
+        # vectors: (id, values, metadata) tuples or {"id", "values", "metadata"} dicts
+        store = self._namespaces.setdefault(namespace or "", OrderedDict())
+        for vector in vectors:
+            if isinstance(vector, dict):
+                vector = (vector["id"], vector.get("values"), vector.get("metadata"))
+            vector_id, values, metadata = vector
+            store[vector_id] = FakeVector(vector_id, values, metadata)
+        self._sorted_ids.pop(namespace or "", None)
+        return FakeResponse(upserted_count=len(vectors))
+
+    def describe_index_stats(self, filter=None, **kwargs):
+        self._simulate_call("describe_index_stats")
+        namespaces = {
+            name: FakeResponse(vector_count=len(store))
+            for name, store in self._namespaces.items()
+        }
+        return FakeResponse(
+            dimension=self.dimension,
+            namespaces=namespaces,
+            total_vector_count=sum(len(store) for store in self._namespaces.values())
+        )
+
+    def query(self, *args, top_k, vector=None, id=None, namespace=None, filter=None,
+              include_values=None, include_metadata=None, **kwargs):
+        self._simulate_call("query")
+        store = self._vectors(namespace)
+        if id is not None:
+            vector = store[id].values if id in store else None
+        candidates = [v for v in store.values() if matches_filter(v.metadata, filter)]
+        scored = [(_cosine(vector, v.values), position, v) for position, v in enumerate(candidates)]
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        matches = [
+            FakeVector(
+                v.id,
+                v.values if include_values else [],
+                v.metadata if include_metadata else None,
+                score
+            )
+            for score, _, v in scored[:top_k]
+        ]
+        return FakeResponse(matches=matches, namespace=namespace or "")
+
+    def list_paginated(self, prefix=None, limit=None, pagination_token=None, namespace=None, **kwargs):
+        self._simulate_call("list_paginated")
+        limit = limit or 100
+        ids = self._sorted_ids.get(namespace or "")
+        if ids is None:
+            ids = self._sorted_ids[namespace or ""] = sorted(self._vectors(namespace))
+        # Pagination tokens are positions in the sorted ID list
+        start = int(pagination_token) if pagination_token else bisect.bisect_left(ids, prefix or "")
+        page = [i for i in ids[start:start + limit] if not prefix or i.startswith(prefix)]
+        next_start = start + limit
+        has_more = next_start < len(ids) and (not prefix or ids[next_start].startswith(prefix))
+        pagination = FakeResponse(next=str(next_start)) if has_more else None
+        return FakeResponse(
+            vectors=[FakeResponse(id=i) for i in page],
+            pagination=pagination,
+            namespace=namespace or ""
+        )
+
+    def list(self, **kwargs):
+        # Same generator contract as pinecone's Index.list: yields lists of IDs
+        while True:
+            results = self.list_paginated(**kwargs)
+            if results.vectors:
+                yield [v.id for v in results.vectors]
+            if not results.pagination:
+                return
+            kwargs["pagination_token"] = results.pagination.next
+
+    def fetch(self, ids, namespace=None, **kwargs):
+        self._simulate_call("fetch")
+        store = self._vectors(namespace)
+        return FakeResponse(
+            vectors={i: store[i] for i in ids if i in store},
+            namespace=namespace or ""
+        )
+
+
+def _cosine(a, b):
+    if not a or not b:
+        return 0.0
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
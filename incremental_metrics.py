@@ -0,0 +1,168 @@
+import json
+import os
+import time
+
+from message_loader import MESSAGES_NAMESPACE, iter_messages, matches_filter
+from metrics import METRICS_ENGINE, aggregate_class
+from perf import span
+from persist import LockedState, Registry, load_pickle, save_pickle
+from query_cache import cache_key, get_shared_cache
+
+# Incremental sidebar metrics.
+# The per-user aggregate state from metrics.MetricsAggregate is persisted to
+# disk together with a watermark, the point of its message source it has
+# read up to. A refresh reads only what the source added after it and folds
+# it in, so its cost follows the number of new messages instead of the
+# whole history:
+#   SQLite store (MESSAGE_DB)        the last row (seq) folded in
+#   Parquet snapshot (SNAPSHOT_DIR)  the last batch folded in
+#   index                            the set of IDs folded in
+# The index has no order new messages are guaranteed to list after (IDs
+# need not grow with time), so it is listed in full and only the IDs not
+# in the set are fetched. A state is rebuilt when its source, filter or
+# engine changes. With METRICS_ENGINE=approx the state holds the fixed-size
+# sketches of approximate_metrics instead of the per-user index.
+
+METRICS_STATE_PATH = os.getenv("METRICS_STATE_PATH")
+
+
+def message_source(namespace=MESSAGES_NAMESPACE, snapshot_dir=None, message_db=None):
+    # Identifies where a state's messages come from
+    if message_db:
+        return f"sqlite:{os.path.abspath(message_db)}"
+    if snapshot_dir:
+        return f"snapshot:{os.path.abspath(snapshot_dir)}"
+    return f"index:{namespace}"
+
+
+class IncrementalMetrics(LockedState):
+    def __init__(self, filter=None, engine=None, source=None):
+        super().__init__()
+        self.filter = filter  # Metadata filter the aggregate was built with
+        self.source = source  # See message_source()
+        self.aggregate = aggregate_class(engine)()
+        self.watermark = None  # Resume point in the source; None before the first refresh
+        self.updated_at = None
+
+    def _fold(self, records):
+        # Stream the records matching the filter into the aggregate; returns how many were read
+        read = 0
+
+        def matching():
+            nonlocal read
+            for record in records:
+                read += 1
+                if matches_filter(record, self.filter):
+                    yield record
+
+        self.aggregate.add_all(matching())
+        self.updated_at = time.time()
+        return read
+
+    def _refresh_store(self, message_db):
+        from sqlite_store import get_message_store
+
+        store = get_message_store(message_db)
+        upto = store.version() or 0
+        read = self._fold(store.messages_between(self.watermark or 0, upto))
+        self.watermark = upto
+        return read
+
+    def _refresh_snapshot(self, snapshot_dir):
+        from snapshot_store import load_snapshot_batches, read_ingest_state
+
+        upto = read_ingest_state(snapshot_dir).get("batches", 0)
+        read = self._fold(load_snapshot_batches(snapshot_dir, after=self.watermark, upto=upto))
+        self.watermark = upto
+        return read
+
+    def _refresh_index(self, index, namespace, on_progress):
+        if self.watermark is None:
+            self.watermark = set()
+        seen_ids = self.watermark
+
+        def new_records():
+            for record in iter_messages(index, namespace=namespace, skip_ids=seen_ids, on_progress=on_progress):
+                seen_ids.add(record.id)
+                yield record
+
+        return self._fold(new_records())
+
+    def refresh(self, index=None, namespace=MESSAGES_NAMESPACE, on_progress=None, snapshot_dir=None, message_db=None, path=None):
+        # Fold in what the source added after the watermark and save to path;
+        # returns how many messages were read. The lock is held throughout, so
+        # a save never sees a half-folded state.
+        with self._lock:
+            if message_db:
+                read = self._refresh_store(message_db)
+            elif snapshot_dir:
+                read = self._refresh_snapshot(snapshot_dir)
+            else:
+                read = self._refresh_index(index, namespace, on_progress)
+            if path:
+                save_pickle(path, self)
+            return read
+
+    def result(self):
+        with self._lock:
+            return self.aggregate.result()
+
+
+def load_metrics_state(path, filter=None, engine=None, source=None):
+    # Persisted state for this filter, engine and source, or an empty one
+    state = load_pickle(path)
+    if state is not None:
+        # States of another engine are rebuilt
+        current = type(state.aggregate) is aggregate_class(engine)
+        if json.dumps(state.filter, sort_keys=True) == json.dumps(filter, sort_keys=True) and current and state.source == source:
+            return state
+    return IncrementalMetrics(filter, engine, source)
+
+
+_states = Registry()
+
+
+def _state_key(path, filter, engine, source):
+    return (path, json.dumps(filter, sort_keys=True), aggregate_class(engine), source)
+
+
+def get_metrics_state(path, filter=None, engine=None, source=None):
+    # One state object per file, filter, engine and source, shared by every session of the process
+    return _states.get(_state_key(path, filter, engine, source), lambda: load_metrics_state(path, filter, engine, source))
+
+
+def cached_incremental_metrics(index, path, namespace=MESSAGES_NAMESPACE, filter=None, on_progress=None, snapshot_dir=None, message_db=None, engine=None, cache=None):
+    # Returns (metrics, refreshed_at). Between cache expiries reruns reuse the
+    # last result; an expiry or a manual refresh folds in only the new messages.
+    if cache is None:
+        cache = get_shared_cache()
+    source = message_source(namespace, snapshot_dir, message_db)
+    state = get_metrics_state(path, filter, engine, source)
+
+    def refresh():
+        with span("incremental metrics") as timing:
+            try:
+                timing.add(records=state.refresh(
+                    index, namespace=namespace, on_progress=on_progress,
+                    snapshot_dir=snapshot_dir, message_db=message_db, path=path
+                ))
+            except BaseException:
+                # The aggregate may hold part of the new messages: start over from the saved state
+                _states.discard(_state_key(path, filter, engine, source))
+                raise
+            return state.result()
+
+    version = None
+    if message_db:
+        from sqlite_store import get_message_store
+
+        version = get_message_store(message_db).version()
+    elif snapshot_dir:
+        from snapshot_store import snapshot_version
+
+        version = snapshot_version(snapshot_dir)
+    return cache.get_or_load(
+        cache_key(namespace, filter, page=("incremental_metrics", path, source, version, engine or METRICS_ENGINE)),
+        refresh,
+        sizer=lambda metrics: 0
+    )
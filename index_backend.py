@@ -0,0 +1,54 @@
+import os
+
+from persist import Registry
+
+# Pluggable index backend.
+# INDEX_BACKEND=pinecone (default) connects to PINECONE_INDEX with
+# PINECONE_API_KEY. INDEX_BACKEND=fake serves an in-process FakeIndex loaded
+# from the JSONL fixture in FAKE_INDEX_PATH, with FAKE_INDEX_LATENCY seconds
+# of simulated latency per call, so the dashboards run fully offline.
+# Index handles are created once per process and reused across reruns.
+# resolve_message_source picks where the dashboards and report.py read
+# messages from: the local SQLite store or Parquet snapshot when one is
+# configured, otherwise the index.
+
+_indexes = Registry()
+
+
+def create_index(backend=None):
+    backend = backend or os.getenv("INDEX_BACKEND", "pinecone")
+    if backend == "fake":
+        from fake_index import FakeIndex
+
+        return FakeIndex.from_jsonl(
+            os.getenv("FAKE_INDEX_PATH", "messages.jsonl"),
+            latency=float(os.getenv("FAKE_INDEX_LATENCY", "0"))
+        )
+    if backend == "pinecone":
+        from pinecone import Pinecone
+
+        pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+        return pc.Index(os.getenv("PINECONE_INDEX"))
+    raise ValueError(f"Unknown INDEX_BACKEND: {backend}")
+
+
+def get_index(backend=None):
+    backend = backend or os.getenv("INDEX_BACKEND", "pinecone")
+    key = (backend, os.getenv("PINECONE_INDEX"), os.getenv("FAKE_INDEX_PATH"))
+    return _indexes.get(key, lambda: create_index(backend))
+
+
+def resolve_message_source(message_db=None, snapshot_dir=None):
+    # Returns (index, snapshot_dir, message_db) with exactly one of them set.
+    # The SQLite store (MESSAGE_DB) wins over the Parquet snapshot
+    # (SNAPSHOT_DIR), both kept current by ingest_worker.py; the index is
+    # only connected to when neither exists.
+    from snapshot_store import snapshot_exists
+
+    message_db = message_db or os.getenv("MESSAGE_DB")
+    snapshot_dir = snapshot_dir or os.getenv("SNAPSHOT_DIR")
+    if message_db and os.path.exists(message_db):
+        return None, None, message_db
+    if snapshot_dir and snapshot_exists(snapshot_dir):
+        return None, snapshot_dir, None
+    return get_index(), None, None
@@ -0,0 +1,87 @@
+import argparse
+import logging
+import os
+import signal
+import threading
+import time
+
+from message_loader import MESSAGES_NAMESPACE
+from snapshot_store import SNAPSHOT_DIR, export_snapshot, read_snapshot_ids, write_ingest_state
+from sqlite_store import MESSAGE_DB, MessageStore
+
+# Background ingestion worker.
+# A single long-running process polls the messages namespace and appends new
+# records to the local snapshot (see snapshot_store), or with --db to the
+# SQLite store (see sqlite_store). Dashboards started with SNAPSHOT_DIR or
+# MESSAGE_DB pointing at the same location read only from the store, so page
+# loads never wait on Pinecone and every session shares this one upstream
+# reader. Run it next to the dashboards:
+#
+#   python ingest_worker.py --interval 60
+#   python ingest_worker.py --db messages.db
+
+INGEST_INTERVAL = float(os.getenv("INGEST_INTERVAL", "60"))  # Seconds between polls
+
+log = logging.getLogger("ingest_worker")
+
+
+def poll_once(index, path=SNAPSHOT_DIR, namespace=MESSAGES_NAMESPACE, known_ids=None, store=None):
+    # One incremental export; returns the number of new records
+    if store is not None:
+        return store.ingest(index, namespace=namespace, known_ids=known_ids)
+    started = time.time()
+    written = export_snapshot(index, path=path, namespace=namespace, known_ids=known_ids)
+    write_ingest_state(path, last_poll_at=time.time(), last_poll_seconds=round(time.time() - started, 3), last_error=None)
+    return written
+
+
+def run_worker(index, path=SNAPSHOT_DIR, namespace=MESSAGES_NAMESPACE, interval=INGEST_INTERVAL, stop=None, store=None):
+    # Poll until `stop` (a threading.Event) is set; errors are logged and retried on the next poll
+    stop = stop or threading.Event()
+    if store is not None:
+        known_ids = store.known_ids()
+        target = store.path
+    else:
+        os.makedirs(path, exist_ok=True)
+        known_ids = read_snapshot_ids(path)
+        target = path
+    log.info("Starting with %d messages in %s, polling every %ss", len(known_ids), target, interval)
+    while not stop.is_set():
+        try:
+            written = poll_once(index, path, namespace, known_ids, store)
+            if written:
+                log.info("Appended %d messages (%d total)", written, len(known_ids))
+        except Exception as e:
+            log.exception("Poll failed")
+            if store is None:
+                write_ingest_state(path, last_poll_at=time.time(), last_error=str(e))
+        stop.wait(interval)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    from index_backend import get_index
+
+    parser = argparse.ArgumentParser(description="Keep the local message snapshot in sync with the messages namespace")
+    parser.add_argument("--dir", default=SNAPSHOT_DIR, help="snapshot directory")
+    parser.add_argument("--db", default=MESSAGE_DB, help="write to this SQLite store instead of the snapshot")
+    parser.add_argument("--namespace", default=MESSAGES_NAMESPACE)
+    parser.add_argument("--interval", type=float, default=INGEST_INTERVAL, help="seconds between polls")
+    parser.add_argument("--once", action="store_true", help="poll once and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    load_dotenv()
+    index = get_index()
+    store = MessageStore(args.db) if args.db else None
+
+    if args.once:
+        if store is None:
+            os.makedirs(args.dir, exist_ok=True)
+        log.info("Appended %d messages", poll_once(index, args.dir, args.namespace, store=store))
+    else:
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        signal.signal(signal.SIGINT, lambda *_: stop.set())
+        run_worker(index, args.dir, args.namespace, args.interval, stop, store)
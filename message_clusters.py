@@ -0,0 +1,174 @@
+import zlib
+
+import numpy as np
+
+from message_loader import MESSAGES_NAMESPACE
+from perf import span
+from query_cache import cache_key, get_shared_cache
+from search_index import index_terms, tokenize
+
+# Grouping of the "other single messages" into clusters of similar text.
+# Messages are deduplicated by normalised text, the stored embeddings of one
+# message per distinct text are fetched in concurrent batches and clustered
+# with mini-batch k-means over a NumPy matrix (k-means++ seeding, batches
+# drawn in proportion to how often each text occurs). When no embeddings
+# are available (local snapshot or store, or an index without values) the
+# texts are embedded locally with hashed bag-of-words vectors instead.
+
+CLUSTER_MIN_MESSAGES = 20  # Below this the messages are listed as they are
+MAX_CLUSTERS = 12
+KMEANS_BATCH_SIZE = 1024
+KMEANS_MAX_ITER = 100
+KMEANS_TOLERANCE = 1e-4
+HASH_DIMENSION = 512
+ASSIGN_CHUNK_SIZE = 8192  # Rows scored against the centers at a time
+SAMPLES_PER_CLUSTER = 5
+
+
+def hashed_text_vectors(texts, dimension=HASH_DIMENSION):
+    # L2-normalised hashed bag-of-words (tokens and their particle-stripped forms)
+    matrix = np.zeros((len(texts), dimension), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for token in tokenize(text):
+            for term in index_terms(token):
+                matrix[row, zlib.crc32(term.encode()) % dimension] += 1.0
+    return _normalize_rows(matrix)
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _assign(matrix, centers):
+    # Nearest center of every row, and its similarity score; chunked to bound memory
+    half_norms = 0.5 * np.einsum("ij,ij->i", centers, centers)
+    labels = np.empty(len(matrix), dtype=np.int64)
+    scores = np.empty(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), ASSIGN_CHUNK_SIZE):
+        chunk = matrix[start:start + ASSIGN_CHUNK_SIZE] @ centers.T - half_norms
+        labels[start:start + len(chunk)] = chunk.argmax(axis=1)
+        scores[start:start + len(chunk)] = chunk.max(axis=1)
+    return labels, scores
+
+
+def _kmeans_plus_plus(matrix, k, weights, rng):
+    # Seeds spread out in proportion to squared distance from the chosen ones
+    probabilities = weights / weights.sum()
+    centers = [matrix[rng.choice(len(matrix), p=probabilities)]]
+    distances = np.sum((matrix - centers[0]) ** 2, axis=1)
+    for _ in range(1, k):
+        spread = distances * weights
+        if spread.sum() <= 0:
+            break
+        centers.append(matrix[rng.choice(len(matrix), p=spread / spread.sum())])
+        distances = np.minimum(distances, np.sum((matrix - centers[-1]) ** 2, axis=1))
+    return np.array(centers, dtype=np.float32)
+
+
+def minibatch_kmeans(matrix, k, weights=None, batch_size=KMEANS_BATCH_SIZE, max_iter=KMEANS_MAX_ITER, tol=KMEANS_TOLERANCE, seed=0):
+    # Returns (centers, labels, scores) for the rows of matrix
+    rng = np.random.default_rng(seed)
+    weights = np.ones(len(matrix)) if weights is None else np.asarray(weights, dtype=np.float64)
+    centers = _kmeans_plus_plus(matrix, min(k, len(matrix)), weights, rng)
+    counts = np.zeros(len(centers))
+    probabilities = weights / weights.sum()
+    for _ in range(max_iter):
+        batch = matrix[rng.choice(len(matrix), size=min(batch_size, len(matrix)), p=probabilities)]
+        labels, _ = _assign(batch, centers)
+        one_hot = np.zeros((len(batch), len(centers)), dtype=np.float32)
+        one_hot[np.arange(len(batch)), labels] = 1.0
+        batch_counts = one_hot.sum(axis=0)
+        sums = one_hot.T @ batch
+        # Per-center learning rate 1 / (samples seen so far)
+        counts += batch_counts
+        updated = batch_counts > 0
+        previous = centers.copy()
+        centers[updated] += (sums[updated] - batch_counts[updated, None] * centers[updated]) / counts[updated, None]
+        if np.max(np.sum((centers - previous) ** 2, axis=1)) < tol:
+            break
+    labels, scores = _assign(matrix, centers)
+    return centers, labels, scores
+
+
+def cluster_count(distinct_texts):
+    return max(1, min(MAX_CLUSTERS, int(round(np.sqrt(distinct_texts / 2)))))
+
+
+def cluster_messages(entries, vectors=None, seed=0):
+    # entries: dicts with "message" (and "user", "id") as in metrics'
+    # other_single_messages. vectors: optional {id: embedding}. Returns clusters
+    # sorted by size: {"size", "samples": [(text, count), ...], "entries"}.
+    groups = {}  # normalised text -> entries with that text
+    for entry in entries:
+        groups.setdefault(" ".join(tokenize(entry["message"])) or entry["message"], []).append(entry)
+    keys = list(groups)
+    if not keys:
+        return []
+    texts = [groups[key][0]["message"] for key in keys]
+    weights = np.array([len(groups[key]) for key in keys], dtype=np.float64)
+
+    matrix = None
+    if vectors:
+        rows = [_first_vector(groups[key], vectors) for key in keys]
+        if all(rows) and len({len(row) for row in rows}) == 1:
+            matrix = _normalize_rows(np.array(rows, dtype=np.float32))
+    if matrix is None:
+        matrix = hashed_text_vectors(texts)
+
+    _, labels, scores = minibatch_kmeans(matrix, cluster_count(len(keys)), weights, seed=seed)
+    clusters = []
+    for label in np.unique(labels):
+        members = np.flatnonzero(labels == label)
+        # Most frequent texts first, closest to the center among equals
+        members = members[np.lexsort((-scores[members], -weights[members]))]
+        clusters.append({
+            "size": int(weights[members].sum()),
+            "samples": [(texts[i], int(weights[i])) for i in members[:SAMPLES_PER_CLUSTER]],
+            "entries": [entry for i in members for entry in groups[keys[i]]],
+        })
+    clusters.sort(key=lambda cluster: -cluster["size"])
+    return clusters
+
+
+def _first_vector(entries, vectors):
+    for entry in entries:
+        values = vectors.get(entry.get("id"))
+        if values:
+            return values
+    return None
+
+
+def cached_message_clusters(index, entries, fetched_at, namespace=MESSAGES_NAMESPACE, cache=None):
+    # Clusters for the current metrics, computed once per load and shared
+    # across reruns; embeddings come from the index when there is one
+    if cache is None:
+        cache = get_shared_cache()
+
+    def compute():
+        vectors = None
+        if index is not None:
+            from async_loader import fetch_vectors
+
+            # One embedding per distinct text is enough
+            seen, ids = set(), []
+            for entry in entries:
+                key = " ".join(tokenize(entry["message"])) or entry["message"]
+                if entry.get("id") and key not in seen:
+                    seen.add(key)
+                    ids.append(entry["id"])
+            try:
+                vectors = fetch_vectors(index, ids, namespace=namespace)
+            except Exception:
+                vectors = None  # Fall back to the local text vectors
+        with span("cluster messages") as timing:
+            timing.add(records=len(entries))
+            return cluster_messages(entries, vectors)
+
+    clusters, _ = cache.get_or_load(
+        cache_key(namespace, None, page=("message_clusters", fetched_at, len(entries))),
+        compute,
+        sizer=lambda clusters: 256 * len(entries)
+    )
+    return clusters
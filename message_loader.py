@@ -0,0 +1,310 @@
+import sys
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from operator import attrgetter
+
+from perf import span
+from query_cache import cache_key, estimate_size, get_shared_cache
+from timestamps import parse_timestamp
+
+# Shared message loading layer used by the dashboards.
+# Instead of a single zero-vector query capped at top_k=1000, every ID in the
+# namespace is listed page by page and the metadata is fetched in bounded
+# concurrent batches, so the full namespace is loaded without truncation.
+
+MESSAGES_NAMESPACE = "messages"
+LIST_PAGE_SIZE = 100  # Pinecone caps list() pages at 100 IDs
+FETCH_BATCH_SIZE = 100  # IDs per fetch() call, keeps request URLs short
+MAX_CONCURRENT_FETCHES = 4
+
+MESSAGE_FIELDS = ("user_name", "room_id", "sender_type", "text", "timestamp")
+_FIELD_SET = frozenset(MESSAGE_FIELDS)
+
+
+_intern = sys.intern
+
+
+class MessageRecord:
+    # Compact stand-in for a Pinecone match, used everywhere after loading:
+    # the metadata fields the dashboards use are slots (None when missing),
+    # user_name and room_id are interned since they repeat on every message,
+    # and the message timestamp is parsed once (epoch seconds or None).
+    # Other metadata keys, if any, are kept in `extra`. Records support
+    # get() and `in` like a metadata dict, so matches_filter takes them as is.
+    __slots__ = ("id", "user_name", "room_id", "sender_type", "text", "timestamp", "ts", "extra")
+
+    def __init__(self, id, metadata=None, ts=None):
+        self.id = id
+        self.ts = ts
+        if metadata:
+            get = metadata.get
+            user_name = get("user_name")
+            room_id = get("room_id")
+            self.user_name = _intern(user_name) if type(user_name) is str else user_name
+            self.room_id = _intern(room_id) if type(room_id) is str else room_id
+            self.sender_type = get("sender_type")
+            self.text = get("text")
+            self.timestamp = get("timestamp")
+            self.extra = None if metadata.keys() <= _FIELD_SET else {
+                key: value for key, value in metadata.items() if key not in _FIELD_SET
+            }
+        else:
+            self.user_name = self.room_id = self.sender_type = self.text = self.timestamp = self.extra = None
+
+    def get(self, key, default=None):
+        value = getattr(self, key) if key in _FIELD_SET else (self.extra or {}).get(key)
+        return default if value is None else value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def metadata_values(self):
+        values = [self.user_name, self.room_id, self.sender_type, self.text, self.timestamp]
+        if self.extra:
+            values.extend(self.extra.values())
+        return [value for value in values if value is not None]
+
+    @property
+    def metadata(self):
+        # Metadata dict as loaded (missing fields left out), for older callers
+        metadata = {field: getattr(self, field) for field in MESSAGE_FIELDS if getattr(self, field) is not None}
+        if self.extra:
+            metadata.update(self.extra)
+        return metadata
+
+    def __eq__(self, other):
+        if not isinstance(other, MessageRecord):
+            return NotImplemented
+        return self.id == other.id and self.ts == other.ts and self.metadata == other.metadata
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"MessageRecord(id={self.id!r}, metadata={self.metadata!r}, ts={self.ts!r})"
+
+
+# Records as plain tuples, e.g. to ship them to worker processes (tuples
+# pickle several times faster than the records), and a read-only view of
+# such a tuple with the record attributes
+record_values = attrgetter(*MessageRecord.__slots__)
+RecordValues = namedtuple("RecordValues", MessageRecord.__slots__)
+
+
+def make_record(vector_id, metadata):
+    record = MessageRecord(vector_id, metadata)
+    if record.timestamp is not None:
+        record.ts = parse_timestamp(record.timestamp)
+    return record
+
+
+class LoadedRecords(list):
+    # Records loaded from a local store (Parquet snapshot, SQLite) that other
+    # processes can read again themselves: source is (function, args), both
+    # picklable, and function(*args, part=i, parts=n) reads the i-th of n
+    # disjoint parts of these same records (pinned to what was loaded here,
+    # whatever was appended since).
+    def __init__(self, records=(), source=None):
+        super().__init__(records)
+        self.source = source
+
+
+def column_records(ids, user_names, room_ids, sender_types, texts, timestamps):
+    # MessageRecords from parallel columns of the MESSAGE_FIELDS (None where
+    # missing), filling the slots directly instead of going through a
+    # metadata dict per message
+    new = MessageRecord.__new__
+    records = []
+    append = records.append
+    for id, user_name, room_id, sender_type, text, timestamp in zip(ids, user_names, room_ids, sender_types, texts, timestamps):
+        record = new(MessageRecord)
+        record.id = id
+        record.user_name = _intern(user_name) if type(user_name) is str else user_name
+        record.room_id = _intern(room_id) if type(room_id) is str else room_id
+        record.sender_type = sender_type
+        record.text = text
+        record.timestamp = timestamp
+        record.ts = None if timestamp is None else parse_timestamp(timestamp)
+        record.extra = None
+        append(record)
+    return records
+
+
+def as_record(match):
+    # MessageRecord for a loaded record or a raw Pinecone match
+    return match if type(match) is MessageRecord else make_record(match.id, match.metadata)
+
+
+def matches_filter(metadata, filter):
+    # Client-side evaluation of the Pinecone metadata filter syntax we use
+    if not filter:
+        return True
+    metadata = metadata or {}
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict):
+            for op, expected in condition.items():
+                if not _matches_operator(metadata, key, op, expected):
+                    return False
+        elif metadata.get(key) != condition:  # {"field": value} shorthand for $eq
+            return False
+    return True
+
+
+def _matches_operator(metadata, key, op, expected):
+    if op == "$exists":
+        return (key in metadata) == bool(expected)
+    value = metadata.get(key)
+    if op == "$eq":
+        return key in metadata and value == expected
+    if op == "$ne":
+        return value != expected
+    if op == "$in":
+        return key in metadata and value in expected
+    if op == "$nin":
+        return value not in expected
+    if op == "$gt":
+        return value is not None and value > expected
+    if op == "$gte":
+        return value is not None and value >= expected
+    if op == "$lt":
+        return value is not None and value < expected
+    if op == "$lte":
+        return value is not None and value <= expected
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+
+def count_messages(index, namespace=MESSAGES_NAMESPACE):
+    # Total number of vectors in the namespace, or None if stats are unavailable
+    try:
+        stats = index.describe_index_stats()
+    except Exception:
+        return None
+    summary = stats.namespaces.get(namespace) if stats.namespaces else None
+    return summary.vector_count if summary else 0
+
+
+def iter_message_ids(index, namespace=MESSAGES_NAMESPACE, page_size=LIST_PAGE_SIZE):
+    # Yields pages (lists) of vector IDs
+    for ids in index.list(namespace=namespace, limit=page_size):
+        yield ids
+
+
+def fetch_messages(index, ids, namespace=MESSAGES_NAMESPACE):
+    # Fetch metadata for a batch of IDs, keeping the listing order
+    response = index.fetch(ids=ids, namespace=namespace)
+    vectors = response.vectors
+    return [
+        make_record(vector_id, vectors[vector_id].metadata)
+        for vector_id in ids
+        if vector_id in vectors
+    ]
+
+
+def iter_messages(
+    index,
+    namespace=MESSAGES_NAMESPACE,
+    filter=None,
+    batch_size=FETCH_BATCH_SIZE,
+    max_workers=MAX_CONCURRENT_FETCHES,
+    on_progress=None,
+    skip_ids=None,
+):
+    # Stream every record in the namespace that matches the metadata filter.
+    # IDs in skip_ids are listed but not fetched (incremental loads).
+    # on_progress(done, total) is called after each fetched batch.
+    total = count_messages(index, namespace)
+    done = 0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = deque()
+
+        def drain_one():
+            nonlocal done
+            batch_ids, future = pending.popleft()
+            records = future.result()
+            done += len(batch_ids)
+            if on_progress:
+                on_progress(done, total)
+            return [r for r in records if matches_filter(r, filter)]
+
+        for page in iter_message_ids(index, namespace):
+            if skip_ids:
+                new_ids = [vector_id for vector_id in page if vector_id not in skip_ids]
+                done += len(page) - len(new_ids)
+                page = new_ids
+            for start in range(0, len(page), batch_size):
+                batch_ids = page[start:start + batch_size]
+                pending.append((batch_ids, pool.submit(fetch_messages, index, batch_ids, namespace)))
+                # Bound the number of in-flight fetches (and buffered results)
+                while len(pending) >= max_workers * 2:
+                    yield from drain_one()
+
+        while pending:
+            yield from drain_one()
+
+
+def load_messages(index, namespace=MESSAGES_NAMESPACE, filter=None, on_progress=None, **kwargs):
+    return list(iter_messages(index, namespace=namespace, filter=filter, on_progress=on_progress, **kwargs))
+
+
+def cached_load_messages(index, namespace=MESSAGES_NAMESPACE, filter=None, on_progress=None, cache=None, snapshot_dir=None, message_db=None):
+    # Returns (records, fetched_at); reruns are served from the query cache.
+    # With snapshot_dir or message_db the records come from the local Parquet
+    # snapshot or SQLite store instead of Pinecone.
+    with span("fetch messages") as timing:
+        records, fetched_at = _cached_load_messages(index, namespace, filter, on_progress, cache, snapshot_dir, message_db, timing)
+        if timing:
+            timing.add(records=len(records), bytes=estimate_size(records))
+    return records, fetched_at
+
+
+def _cached_load_messages(index, namespace, filter, on_progress, cache, snapshot_dir, message_db, timing):
+    if cache is None:
+        cache = get_shared_cache()
+    if message_db:
+        from sqlite_store import cached_store_messages
+
+        timing.add(source="sqlite")
+        return cached_store_messages(message_db, namespace=namespace, filter=filter, cache=cache)
+
+    def loaded(load):
+        # Marks the span as a cache miss when the loader actually runs
+        def run():
+            timing.add(cached=False)
+            return load()
+        return run
+
+    timing.add(cached=True)
+    if snapshot_dir:
+        from snapshot_store import load_snapshot_messages, snapshot_version
+
+        # Keyed by the snapshot version, so records appended by the ingestion
+        # worker are picked up on the next rerun
+        timing.add(source="snapshot")
+        return cache.get_or_load(
+            cache_key(namespace, filter, page=(f"snapshot:{snapshot_dir}", snapshot_version(snapshot_dir))),
+            loaded(lambda: load_snapshot_messages(snapshot_dir, filter=filter))
+        )
+    from async_loader import load_messages_concurrently
+
+    timing.add(source="index")
+    return cache.get_or_load(
+        cache_key(namespace, filter),
+        loaded(lambda: load_messages_concurrently(index, namespace=namespace, filter=filter, on_progress=on_progress))
+    )
+
+
+def progress_callback(progress_bar, status_text, label="Fetching messages"):
+    # Adapter reporting loader progress to a st.progress bar and st.empty text slot
+    def update(done, total):
+        if total:
+            progress_bar.progress(min(int(done * 100 / total), 99))
+            status_text.text(f"{label}... {done:,}/{total:,}")
+        else:
+            status_text.text(f"{label}... {done:,}")
+    return update
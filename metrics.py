@@ -0,0 +1,275 @@
+import os
+
+from message_loader import MESSAGES_NAMESPACE, MessageRecord, as_record
+from perf import span
+from query_cache import cache_key, get_shared_cache
+from response_classifier import get_classifier
+
+# Sidebar metrics shared by the dashboards.
+# All figures are derived from a per-user index filled in a single pass over
+# the messages, so the cost is linear in the number of messages. Per-room
+# response latency, turns and the reply funnel are computed apart, over
+# every message in conversation order (see conversation_metrics).
+# METRICS_ENGINE=pandas switches to the vectorized engine in vectorized_metrics.py,
+# METRICS_ENGINE=approx to the bounded-memory sketches in approximate_metrics.py,
+# and METRICS_ENGINE=parallel spreads the work over processes (parallel_metrics.py).
+# "ya"/"tidak" responses are recognised by the shared response_classifier.
+
+METRICS_ENGINE = os.getenv("METRICS_ENGINE", "python")  # "python", "pandas", "approx" or "parallel"
+
+
+class UserStats:
+    # Per-user aggregate record
+    __slots__ = ("count", "rooms", "user_messages", "agent_messages", "first_user_text", "first_user_id")
+
+    def __init__(self):
+        self.count = 0  # Messages counted towards the metrics
+        self.rooms = set()
+        self.user_messages = 0
+        self.agent_messages = 0
+        self.first_user_text = None  # Text of the user's first message sent as "user"
+        self.first_user_id = None  # ID of that message
+
+
+class MetricsAggregate:
+    def __init__(self):
+        self.total_messages = 0
+        self.users = {}  # user -> UserStats
+        self.counted_users = []  # Users in the order their first counted message was seen
+
+    def _stats(self, user_name):
+        stats = self.users.get(user_name)
+        if stats is None:
+            stats = self.users[user_name] = UserStats()
+        return stats
+
+    def add(self, metadata, message_id=None):
+        # Same as add_record, for a bare metadata dict
+        self.add_record(MessageRecord(message_id, metadata))
+
+    def add_record(self, record):
+        self.total_messages += 1
+        user_name = record.user_name
+        if not user_name:
+            return
+
+        # Remember the first user message, used to classify single message users
+        sender_type = record.sender_type
+        if sender_type == "user":
+            stats = self._stats(user_name)
+            if stats.first_user_text is None:
+                stats.first_user_text = "" if record.text is None else record.text
+                stats.first_user_id = record.id
+
+        room_id = record.room_id
+        if record.timestamp or not room_id:  # Only count messages without timestamp
+            return
+
+        stats = self._stats(user_name)
+        if stats.count == 0:
+            self.counted_users.append(user_name)
+        stats.count += 1
+        stats.rooms.add(room_id)
+        # Count user vs agent messages
+        if sender_type is None or sender_type == "user":
+            stats.user_messages += 1
+        else:
+            stats.agent_messages += 1
+
+    def add_all(self, matches):
+        for match in matches:
+            self.add_record(as_record(match))
+
+    def user_rows(self):
+        # (user, count, user messages, agent messages, first user text, its ID) per
+        # counted user in order; the text is only needed for single message users
+        for user in self.counted_users:
+            stats = self.users[user]
+            yield (
+                user, stats.count, stats.user_messages, stats.agent_messages,
+                stats.first_user_text if stats.count == 1 else None,
+                stats.first_user_id
+            )
+
+    def counted_rooms(self):
+        return set().union(*(self.users[user].rooms for user in self.counted_users))
+
+    def result(self):
+        return metrics_result(self.total_messages, self.user_rows(), self.counted_rooms())
+
+
+def metrics_result(total_messages, user_rows, rooms):
+    # Result dict from MetricsAggregate.user_rows-style rows and the set of
+    # counted rooms (shared with parallel_metrics)
+    user_message_count = 0
+    agent_message_count = 0
+    total_counted = 0
+    total_users = 0
+    single_message_users = 0  # Count users with only one message
+    multiple_message_users = 0  # Count users with 2 or more messages
+    multiple_message_total = 0  # Total messages from users with multiple messages
+    single_ya_users = 0  # Users with single "ya" message
+    single_tidak_users = 0  # Users with single "tidak" message
+    other_single_messages = []  # List of other single messages
+    classifier = get_classifier()
+
+    for user, count, user_messages, agent_messages, first_user_text, first_user_id in user_rows:
+        total_users += 1
+        total_counted += count
+        user_message_count += user_messages
+        agent_message_count += agent_messages
+
+        if count == 1:
+            single_message_users += 1
+            if first_user_text is not None:
+                # The whole message must be the response, e.g. "Ya" but not "ya saya mau"
+                intent = classifier.classify_exact(first_user_text)
+                if intent == "ya":
+                    single_ya_users += 1
+                elif intent == "tidak":
+                    single_tidak_users += 1
+                else:
+                    other_single_messages.append({
+                        "user": user,
+                        "message": first_user_text.strip(),
+                        "id": first_user_id
+                    })
+        else:
+            multiple_message_users += 1
+            multiple_message_total += count
+
+    # Calculate metrics
+    total_rooms = len(rooms)
+    avg_messages_per_user = total_counted / total_users if total_users > 0 else 0
+    single_message_percentage = (single_message_users / total_users * 100) if total_users > 0 else 0
+    multiple_message_percentage = (multiple_message_users / total_users * 100) if total_users > 0 else 0
+    avg_messages_multiple_users = multiple_message_total / multiple_message_users if multiple_message_users > 0 else 0
+    single_ya_percentage = (single_ya_users / single_message_users * 100) if single_message_users > 0 else 0
+    single_tidak_percentage = (single_tidak_users / single_message_users * 100) if single_message_users > 0 else 0
+
+    return {
+        "total_users": total_users,
+        "total_rooms": total_rooms,
+        "avg_messages_per_user": round(avg_messages_per_user, 2),
+        "total_messages": total_messages,
+        "user_messages": user_message_count,
+        "agent_messages": agent_message_count,
+        "single_message_users": single_message_users,
+        "single_message_percentage": round(single_message_percentage, 1),
+        "multiple_message_users": multiple_message_users,
+        "multiple_message_percentage": round(multiple_message_percentage, 1),
+        "avg_messages_multiple_users": round(avg_messages_multiple_users, 2),
+        "single_ya_users": single_ya_users,
+        "single_ya_percentage": round(single_ya_percentage, 1),
+        "single_tidak_users": single_tidak_users,
+        "single_tidak_percentage": round(single_tidak_percentage, 1),
+        "other_single_messages": other_single_messages,
+        "multiple_message_total": multiple_message_total
+    }
+
+
+def calculate_metrics(query_result):
+    aggregate = MetricsAggregate()
+    aggregate.add_all(query_result)
+    return aggregate.result()
+
+
+def calculate_response_metrics(messages):
+    # "ya"/"tidak" response analysis shown by test.py, plus every other configured intent
+    classifier = get_classifier()
+    total_messages = 0
+    user_message_counts = {}  # user -> number of messages, in order of first message
+    user_intent_counts = {name: {} for name in classifier.names}  # intent -> user -> messages
+
+    for match in messages:
+        record = as_record(match)
+        user_name = record.user_name
+        if not user_name:  # Skip if no user name
+            continue
+
+        total_messages += 1
+        user_message_counts[user_name] = user_message_counts.get(user_name, 0) + 1
+
+        # Intents mentioned as whole words, e.g. "ya" but not the "ya" in "saya"
+        for intent in classifier.classify(record.text):
+            counts = user_intent_counts[intent]
+            counts[user_name] = counts.get(user_name, 0) + 1
+
+    # Users whose every message mentions the intent
+    intents = {
+        name: {
+            "messages": sum(counts.values()),
+            "users_saying": len(counts),
+            "users_only": sum(1 for user, count in counts.items() if count == user_message_counts[user]),
+        }
+        for name, counts in user_intent_counts.items()
+    }
+    return response_metrics_result(total_messages, list(user_message_counts), intents)
+
+
+def response_metrics_result(total_messages, users, intents):
+    # Result dict shared by both engines
+    empty = {"messages": 0, "users_saying": 0, "users_only": 0}
+    tidak = intents.get("tidak", empty)
+    ya = intents.get("ya", empty)
+    return {
+        "total_messages": total_messages,
+        "total_users": len(users),
+        "users": users,
+        "tidak_messages": tidak["messages"],
+        "users_saying_tidak": tidak["users_saying"],
+        "users_only_tidak": tidak["users_only"],
+        "ya_messages": ya["messages"],
+        "users_saying_ya": ya["users_saying"],
+        "users_only_ya": ya["users_only"],
+        "intents": intents
+    }
+
+
+def aggregate_class(engine=None):
+    # Aggregate folded incrementally for the configured engine
+    if (engine or METRICS_ENGINE) == "approx":
+        from approximate_metrics import ApproximateAggregate
+
+        return ApproximateAggregate
+    return MetricsAggregate
+
+
+def compute_metrics(messages, engine=None):
+    # Sidebar metrics with the configured engine
+    with span("compute metrics") as timing:
+        timing.add(records=len(messages), engine=engine or METRICS_ENGINE)
+        if (engine or METRICS_ENGINE) == "pandas":
+            from vectorized_metrics import calculate_metrics_df, messages_frame
+
+            return calculate_metrics_df(messages_frame(messages))
+        if (engine or METRICS_ENGINE) == "approx":
+            from approximate_metrics import calculate_metrics_approx
+
+            return calculate_metrics_approx(messages)
+        if (engine or METRICS_ENGINE) == "parallel":
+            from parallel_metrics import calculate_metrics_parallel
+
+            return calculate_metrics_parallel(messages)
+        return calculate_metrics(messages)
+
+
+def cached_metrics(messages, fetched_at, namespace=MESSAGES_NAMESPACE, filter=None, engine=None, cache=None):
+    # Sidebar metrics computed once per load and shared across reruns
+    if cache is None:
+        cache = get_shared_cache()
+    metrics, _ = cache.get_or_load(
+        cache_key(namespace, filter, page=("metrics", fetched_at, engine or METRICS_ENGINE)),
+        lambda: compute_metrics(messages, engine),
+        sizer=lambda metrics: 256 * len(metrics["other_single_messages"])
+    )
+    return metrics
+
+
+def compute_response_metrics(messages, engine=None):
+    # "ya"/"tidak" response analysis with the configured engine
+    if (engine or METRICS_ENGINE) == "pandas":
+        from vectorized_metrics import calculate_response_metrics_df, messages_frame
+
+        return calculate_response_metrics_df(messages_frame(messages))
+    return calculate_response_metrics(messages)
@@ -0,0 +1,223 @@
+import gc
+import multiprocessing
+import os
+import pickle
+import sys
+import threading
+import types
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from operator import itemgetter
+
+from message_loader import RecordValues, as_record, record_values
+from metrics import MetricsAggregate, calculate_metrics, metrics_result
+from perf import span
+
+# Partitioned sidebar metrics (METRICS_ENGINE=parallel).
+# Messages are sharded by a stable hash of user_name, so every user (and
+# each of their rooms) lands in exactly one shard. Each worker process folds
+# its shard into a metrics.MetricsAggregate and sends back only what the
+# result needs (per-user rows and counted rooms) as plain values. The users
+# are put back in the order they were first seen, so the result is the same
+# as the single-process engine's.
+# Messages loaded from the Parquet snapshot or the SQLite store
+# (message_loader.LoadedRecords) are partitioned by the workers, in two
+# rounds: each reads one part of the same files or rows and splits it by
+# shard, then each folds one shard from the pieces all of them made. Pieces
+# are pickled by the workers, so this process only passes bytes on and does
+# nothing per message. Messages loaded from the index are sharded here and
+# shipped as plain tuples, whose pickling limits the speedup. Inputs below
+# PARALLEL_MIN_RECORDS are computed in-process, where the pool costs more
+# than it saves. The approximate engine shards the same way and merges its
+# workers' sketches (approximate_metrics.py).
+
+PARALLEL_WORKERS = int(os.getenv("METRICS_WORKERS", "0")) or os.cpu_count() or 1
+PARALLEL_MIN_RECORDS = 200_000
+STARTUP_TIMEOUT = 60  # Seconds for every worker of a new pool to start
+
+
+def shard_of(user_name, shards):
+    # Messages without a user only count towards the total; they go to shard 0
+    return zlib.crc32(user_name.encode()) % shards if user_name else 0
+
+
+def fold_shard(records, keys):
+    # Partial result of one shard. keys gives each record's load position (or
+    # any key sorting like it), kept for each counted user's first counted message.
+    aggregate = MetricsAggregate()
+    first_keys = []
+    for record, key in zip(records, keys):
+        counted = len(aggregate.counted_users)
+        aggregate.add_record(record)
+        if len(aggregate.counted_users) > counted:
+            first_keys.append(key)
+    return {
+        "total_messages": aggregate.total_messages,
+        "user_rows": list(zip(first_keys, aggregate.user_rows())),
+        "rooms": aggregate.counted_rooms(),
+    }
+
+
+def merge_partials(partials):
+    # Metrics dict from the partial results of disjoint shards
+    user_rows = []
+    rooms = set()
+    for partial in partials:
+        user_rows.extend(partial["user_rows"])
+        rooms.update(partial["rooms"])
+    user_rows.sort(key=itemgetter(0))
+    return metrics_result(
+        sum(partial["total_messages"] for partial in partials),
+        (row for _, row in user_rows),
+        rooms
+    )
+
+
+def _sent_shard(fold, positions, values):
+    # Worker: records arrive as record_values tuples, read through RecordValues.
+    # Only acyclic objects are made, so the cycle collector is paused meanwhile.
+    gc.disable()
+    try:
+        return fold(map(RecordValues._make, values), positions)
+    finally:
+        gc.enable()
+
+
+def _split_part(source, part, parts):
+    # Worker, first round: reads one part of the records (see LoadedRecords)
+    # and returns the record_values tuples of each shard, pickled
+    function, args = source
+    gc.disable()
+    try:
+        shards = [[] for _ in range(parts)]
+        for record in function(*args, part=part, parts=parts):
+            shards[shard_of(record.user_name, parts)].append(record_values(record))
+        return [pickle.dumps(shard, protocol=pickle.HIGHEST_PROTOCOL) for shard in shards]
+    finally:
+        gc.enable()
+
+
+def _gathered_shard(fold, pieces):
+    # Worker, second round: one shard from the pieces of every part. Local
+    # stores load in ID order, so sorting by ID restores the load order and
+    # the ID serves as the load position.
+    gc.disable()
+    try:
+        values = [value for piece in pieces for value in pickle.loads(piece)]
+        values.sort(key=itemgetter(0))
+        return fold(map(RecordValues._make, values), [value[0] for value in values])
+    finally:
+        gc.enable()
+
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+def _worker_started(barrier):
+    # Pool initializer: returns once every worker has started, so none is
+    # idle (which would stop the pool spawning the rest) while it fills
+    barrier.wait(STARTUP_TIMEOUT)
+
+
+def _ready():
+    return True
+
+
+def _start_pool(workers):
+    # Spawned workers import the parent's __main__ module when they start.
+    # Under Streamlit that is the dashboard script, which must not run in a
+    # worker, so every worker is started here, up front, with a bare one.
+    # A pool only spawns workers on submit, and never again once full.
+    context = multiprocessing.get_context("spawn")
+    main = sys.modules.get("__main__")
+    bare = types.ModuleType("__main__")
+    sys.modules["__main__"] = bare
+    try:
+        pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=context,
+            initializer=_worker_started, initargs=(context.Barrier(workers),)
+        )
+        try:
+            for future in [pool.submit(_ready) for _ in range(workers)]:
+                future.result(timeout=STARTUP_TIMEOUT)
+        except BaseException:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        return pool
+    finally:
+        if sys.modules.get("__main__") is bare:
+            sys.modules["__main__"] = main
+
+
+def get_process_pool(workers):
+    # One pool per process, started on first use and shared by every session.
+    # Workers are spawned rather than forked: the dashboards run threads.
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+                _pool = None
+            _pool = _start_pool(workers)
+            _pool_workers = workers
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+
+
+def run_shards(tasks, workers):
+    # Results of the (function, args) tasks, or None when the pool broke (e.g.
+    # a worker was killed) or did not start in time
+    try:
+        pool = get_process_pool(workers)
+        futures = [pool.submit(function, *args) for function, args in tasks]
+        return [future.result() for future in futures]
+    except (BrokenProcessPool, TimeoutError):
+        _reset_pool()
+        return None
+
+
+def shard_records(messages, workers):
+    # (load positions, record_values tuples) of every shard
+    with span("shard messages") as timing:
+        timing.add(records=len(messages), shards=workers)
+        shard_args = [([], []) for _ in range(workers)]
+        for position, match in enumerate(messages):
+            record = as_record(match)
+            positions, values = shard_args[shard_of(record.user_name, workers)]
+            positions.append(position)
+            values.append(record_values(record))
+        return shard_args
+
+
+def run_sharded(messages, fold, workers):
+    # fold(records, keys) of every shard, or None as for run_shards
+    source = getattr(messages, "source", None)
+    if source is None:
+        return run_shards([(_sent_shard, (fold, *shard)) for shard in shard_records(messages, workers)], workers)
+    split = run_shards([(_split_part, (source, part, workers)) for part in range(workers)], workers)
+    if split is None:
+        return None
+    return run_shards([(_gathered_shard, (fold, [pieces[shard] for pieces in split])) for shard in range(workers)], workers)
+
+
+def calculate_metrics_parallel(messages, workers=None):
+    # Same result as metrics.calculate_metrics, computed across processes
+    workers = workers or PARALLEL_WORKERS
+    if workers <= 1 or len(messages) < PARALLEL_MIN_RECORDS:
+        return calculate_metrics(messages)
+    with span("parallel metrics") as timing:
+        timing.add(records=len(messages), shards=workers, split_by_workers=getattr(messages, "source", None) is not None)
+        partials = run_sharded(messages, fold_shard, workers)
+    if partials is None:
+        return calculate_metrics(messages)
+    return merge_partials(partials)
@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+import time
+
+# Lightweight timing spans for the dashboards' hot paths.
+# A dashboard run calls start_trace() first; spans opened on the same thread
+# are recorded into that trace with their duration, nesting depth and
+# optional record and byte counts. finish_trace() ends the run and, when
+# PERF_TRACE_PATH is set, appends it as one JSON line to that file.
+# When disabled, span() hands back a shared no-op object, so instrumented
+# code costs one function call and a truthiness check.
+
+PERF_ENABLED = os.getenv("DASHBOARD_PERF") == "1"
+PERF_TRACE_PATH = os.getenv("PERF_TRACE_PATH")  # JSONL trace file; also enables tracing
+
+_local = threading.local()
+_trace_file_lock = threading.Lock()
+
+
+def perf_enabled():
+    return PERF_ENABLED or bool(PERF_TRACE_PATH)
+
+
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.seconds = None
+        self.spans = []  # Dicts in the order the spans were opened
+        self.depth = 0
+
+    def summary(self):
+        # Totals per span name, in order of first appearance
+        totals = {}
+        for entry in self.spans:
+            total = totals.get(entry["name"])
+            if total is None:
+                total = totals[entry["name"]] = {"name": entry["name"], "calls": 0, "seconds": 0.0, "records": 0, "bytes": 0}
+            total["calls"] += 1
+            total["seconds"] += entry["seconds"] or 0.0
+            total["records"] += entry.get("records", 0)
+            total["bytes"] += entry.get("bytes", 0)
+        return list(totals.values())
+
+    def to_dict(self):
+        return {"run": self.name, "started_at": self.started_at, "seconds": self.seconds, "spans": self.spans}
+
+
+class Span:
+    __slots__ = ("trace", "entry", "_start")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.entry = {"name": name, "depth": trace.depth, "offset": None, "seconds": None}
+        trace.spans.append(self.entry)
+
+    def add(self, records=0, bytes=0, **fields):
+        # Counters accumulate; other fields (e.g. cached=True) are recorded as they are
+        if records:
+            self.entry["records"] = self.entry.get("records", 0) + records
+        if bytes:
+            self.entry["bytes"] = self.entry.get("bytes", 0) + bytes
+        self.entry.update(fields)
+
+    def __enter__(self):
+        self.trace.depth += 1
+        self._start = time.perf_counter()
+        self.entry["offset"] = self._start - self.trace._start
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.entry["seconds"] = time.perf_counter() - self._start
+        self.trace.depth -= 1
+        if exc_type is not None:
+            self.entry["error"] = exc_type.__name__
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __bool__(self):
+        return False
+
+    def add(self, records=0, bytes=0, **fields):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+def start_trace(name):
+    # New trace for this thread's run, or None when tracing is off
+    _local.trace = Trace(name) if perf_enabled() else None
+    return _local.trace
+
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+
+def span(name):
+    # Timing span in the current thread's trace; falsy no-op without one
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        return NULL_SPAN
+    return Span(trace, name)
+
+
+def finish_trace():
+    # Ends the current trace, appends it to PERF_TRACE_PATH and returns it
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        return None
+    _local.trace = None
+    trace.seconds = time.perf_counter() - trace._start
+    if PERF_TRACE_PATH:
+        line = json.dumps(trace.to_dict(), default=str)
+        with _trace_file_lock:
+            with open(PERF_TRACE_PATH, "a") as f:
+                f.write(line + "\n")
+    return trace
@@ -0,0 +1,83 @@
+import json
+import os
+import pickle
+import tempfile
+import threading
+
+# Crash-safe state files and per-process registries.
+# write_atomic writes to a temporary file of its own in the target's
+# directory and renames it over the target, so readers see either the old
+# or the new file and concurrent writers never share a temporary file.
+# Objects guarded by a lock subclass LockedState, whose lock is left out
+# when pickled and recreated on load. A Registry holds one object per key,
+# created once and shared by every session of the process.
+
+
+def write_atomic(path, write, binary=False):
+    # write(f) fills the temporary file, which then replaces path
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb" if binary else "w") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def save_pickle(path, value):
+    write_atomic(path, lambda f: pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL), binary=True)
+
+
+def load_pickle(path, default=None):
+    if not path or not os.path.exists(path):
+        return default
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def save_json(path, value):
+    write_atomic(path, lambda f: json.dump(value, f))
+
+
+def load_json(path, default=None):
+    # Missing and unreadable files both give default
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+class LockedState:
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class Registry:
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, create):
+        # The object for key, calling create() the first time
+        with self._lock:
+            if key not in self._items:
+                self._items[key] = create()
+            return self._items[key]
+
+    def discard(self, key):
+        # Forget key, so the next get() creates it again
+        with self._lock:
+            self._items.pop(key, None)
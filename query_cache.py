@@ -0,0 +1,106 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# In-process cache for Pinecone query results.
+# Streamlit reruns the whole script on every widget interaction; the cache
+# lives at module level so reruns (and other sessions served by the same
+# process) reuse already fetched data instead of going back to the network.
+
+CACHE_TTL_SECONDS = int(os.getenv("QUERY_CACHE_TTL", "900"))
+CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+RECORD_OVERHEAD_BYTES = 200  # Rough per-record cost of the tuple, dict and id
+
+
+def cache_key(namespace, filter=None, page=None):
+    return (namespace, json.dumps(filter, sort_keys=True), page)
+
+
+def estimate_size(records):
+    # Approximate memory held by a list of records, used for the memory cap
+    size = 0
+    for record in records:
+        size += RECORD_OVERHEAD_BYTES
+        values = record.metadata_values() if hasattr(record, "metadata_values") else (getattr(record, "metadata", None) or {}).values()
+        for value in values:
+            size += len(value) if isinstance(value, str) else 8
+    return size
+
+
+class CacheEntry:
+    __slots__ = ("value", "size", "fetched_at")
+
+    def __init__(self, value, size, fetched_at):
+        self.value = value
+        self.size = size
+        self.fetched_at = fetched_at
+
+
+class QueryCache:
+    # TTL cache with a memory cap; least recently used entries are evicted first
+    def __init__(self, ttl_seconds=CACHE_TTL_SECONDS, max_bytes=CACHE_MAX_BYTES):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self.ttl_seconds and time.time() - entry.fetched_at > self.ttl_seconds:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, value, size=0):
+        entry = CacheEntry(value, size, time.time())
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.total_bytes += size
+            # Evict least recently used entries, but always keep the newest one
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                self._remove(next(iter(self._entries)))
+        return entry
+
+    def get_or_load(self, key, loader, sizer=estimate_size):
+        # Returns (value, fetched_at); loader() is only called on a miss
+        entry = self.get(key)
+        if entry is None:
+            value = loader()
+            entry = self.put(key, value, sizer(value))
+        return entry.value, entry.fetched_at
+
+    def invalidate(self, namespace=None):
+        # Drop every entry, or only the entries of one namespace
+        with self._lock:
+            for key in list(self._entries):
+                if namespace is None or key[0] == namespace:
+                    self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry.size
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache():
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = QueryCache()
+        return _shared_cache
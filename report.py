@@ -0,0 +1,163 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+from conversation_metrics import compute_conversation_metrics, conversation_order
+from index_backend import resolve_message_source
+from message_loader import MESSAGES_NAMESPACE, cached_load_messages, matches_filter
+from metrics import compute_metrics, compute_response_metrics
+from perf import finish_trace, start_trace
+
+# Headless batch reports.
+# Loads the messages through the same data layer as the dashboards (the
+# SQLite store or Parquet snapshot when configured, otherwise the index)
+# and writes the sidebar and conversation metrics of chat_dashboard.py and
+# the 'ya'/'tidak' response report of test.py as JSON or CSV, without a
+# Streamlit server (Streamlit is never imported). Meant for cron jobs, e.g.
+# a daily report:
+#
+#   python report.py --output reports/ --stamp
+#   python report.py --format csv --output reports/
+#   MESSAGE_DB=messages.db python report.py --reports metrics
+#
+# With --format json (the default) one report.json holds every report, or
+# it is printed when no --output is given. With --format csv every report
+# becomes <report>.csv with (metric, value) rows, nested figures as dotted
+# names, plus one <report>_<table>.csv per list, per-intent or per-room table.
+
+REPORTS = ("metrics", "conversations", "responses")
+METRICS_FILTER = {"timestamp": {"$exists": False}}  # Messages the dashboards compute metrics from
+
+
+def build_reports(index=None, snapshot_dir=None, message_db=None, namespace=MESSAGES_NAMESPACE, reports=REPORTS, engine=None, on_progress=None):
+    # One load of the namespace serves every report
+    messages, fetched_at = cached_load_messages(
+        index,
+        namespace=namespace,
+        on_progress=on_progress,
+        snapshot_dir=snapshot_dir,
+        message_db=message_db
+    )
+    result = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "fetched_at": datetime.fromtimestamp(fetched_at, timezone.utc).isoformat(),
+        "source": f"sqlite:{message_db}" if message_db else f"snapshot:{snapshot_dir}" if snapshot_dir else f"index:{namespace}",
+    }
+    if "metrics" in reports:
+        counted = [record for record in messages if matches_filter(record, METRICS_FILTER)]
+        result["metrics"] = compute_metrics(counted, engine)
+    if "conversations" in reports:
+        result["conversations"] = compute_conversation_metrics(conversation_order(messages), engine)
+    if "responses" in reports:
+        responses = compute_response_metrics(messages, engine)
+        responses.pop("users")  # Every user name; total_users carries the count
+        total = responses["total_messages"]
+        for counts in responses["intents"].values():
+            counts["percentage"] = round(counts["messages"] / total * 100, 2) if total else 0
+        result["responses"] = responses
+    return result
+
+
+def report_tables(name, report):
+    # {file stem: rows} for the CSV output of one report
+    summary = []
+    tables = {name: summary}
+
+    def flatten(prefix, value):
+        if isinstance(value, dict):
+            if value and all(isinstance(item, dict) for item in value.values()):
+                # Per-key figures, e.g. response intents: one row per key
+                tables[f"{name}_{prefix}"] = [{"name": key, **item} for key, item in value.items()]
+            elif value and all(isinstance(item, list) for item in value.values()):
+                # Columns, e.g. the per-room breakdown: one row per item
+                tables[f"{name}_{prefix}"] = [dict(zip(value, row)) for row in zip(*value.values())]
+            else:
+                for key, item in value.items():
+                    flatten(f"{prefix}.{key}" if prefix else key, item)
+        elif isinstance(value, list):
+            tables[f"{name}_{prefix}"] = value
+        else:
+            summary.append({"metric": prefix, "value": value})
+
+    flatten("", report)
+    return tables
+
+
+def write_csv(path, rows):
+    fields = []
+    for row in rows:
+        fields.extend(key for key in row if key not in fields)
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields or ["value"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def write_reports(result, output=None, format="json", stamp=None):
+    # Returns the paths written; JSON goes to stdout without an output directory
+    suffix = f"-{stamp}" if stamp else ""
+    if format == "json" and not output:
+        json.dump(result, sys.stdout, indent=2, default=str)
+        print()
+        return []
+    output = output or "."
+    os.makedirs(output, exist_ok=True)
+    paths = []
+    if format == "json":
+        paths.append(os.path.join(output, f"report{suffix}.json"))
+        with open(paths[-1], "w") as f:
+            json.dump(result, f, indent=2, default=str)
+        return paths
+    header = {key: value for key, value in result.items() if key not in REPORTS}
+    for name in REPORTS:
+        if name not in result:
+            continue
+        for stem, rows in report_tables(name, result[name]).items():
+            if stem == name:
+                rows = [{"metric": key, "value": value} for key, value in header.items()] + rows
+            paths.append(os.path.join(output, f"{stem}{suffix}.csv"))
+            write_csv(paths[-1], rows)
+    return paths
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="Write the dashboard metrics, conversation metrics and 'ya'/'tidak' report without Streamlit")
+    parser.add_argument("--reports", nargs="+", choices=REPORTS, default=list(REPORTS))
+    parser.add_argument("--format", choices=["json", "csv"], default="json")
+    parser.add_argument("--output", help="directory to write the files to (JSON is printed when omitted)")
+    parser.add_argument("--stamp", action="store_true", help="add today's date (UTC) to the file names")
+    parser.add_argument("--db", help="read from this SQLite store (default: MESSAGE_DB)")
+    parser.add_argument("--snapshot", metavar="DIR", help="read from this Parquet snapshot (default: SNAPSHOT_DIR)")
+    parser.add_argument("--namespace", default=MESSAGES_NAMESPACE)
+    parser.add_argument("--engine", choices=["python", "pandas", "approx", "parallel"], help="metrics engine (default: METRICS_ENGINE)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    started = time.perf_counter()
+    start_trace(os.path.basename(__file__))
+    index, snapshot_dir, message_db = resolve_message_source(args.db, args.snapshot)
+
+    def progress(done, total):
+        if sys.stderr.isatty():
+            print(f"\rFetched {done:,}/{total or '?'} messages", end="", flush=True, file=sys.stderr)
+
+    result = build_reports(
+        index,
+        snapshot_dir=snapshot_dir,
+        message_db=message_db,
+        namespace=args.namespace,
+        reports=args.reports,
+        engine=args.engine,
+        on_progress=progress
+    )
+    paths = write_reports(result, args.output, args.format, datetime.now(timezone.utc).strftime("%Y-%m-%d") if args.stamp else None)
+    finish_trace()
+    for path in paths:
+        print(f"Wrote {path}", file=sys.stderr)
+    print(f"Done in {time.perf_counter() - started:.2f}s", file=sys.stderr)
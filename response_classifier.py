@@ -0,0 +1,81 @@
+import json
+import os
+import re
+from functools import lru_cache
+
+# Response intent classifier shared by the metrics engines.
+# Every intent is a list of words or phrases. All of them are compiled into
+# one case-insensitive regex with a named group per intent, so a message is
+# scanned once whatever the number of intents, and only whole words match
+# ("ya" does not match inside "saya"). Two modes:
+#   classify(text)       -> intents mentioned anywhere in the message
+#   classify_exact(text) -> the intent the whole (stripped) message is, or None
+# Results are memoized per text, since bot replies repeat a lot.
+# RESPONSE_INTENTS may hold a JSON object overriding the default intents.
+
+DEFAULT_INTENTS = {
+    "ya": ["ya"],
+    "tidak": ["tidak"],
+    "stop": ["stop"],
+}
+CLASSIFY_CACHE_SIZE = 100000
+
+
+def load_intents():
+    configured = os.getenv("RESPONSE_INTENTS")
+    return json.loads(configured) if configured else DEFAULT_INTENTS
+
+
+def _alternatives(phrases):
+    # Longest first so the regex prefers "tidak mau" over "tidak"; inner spaces match any whitespace
+    return "|".join(
+        r"\s+".join(re.escape(word) for word in phrase.split())
+        for phrase in sorted(phrases, key=len, reverse=True)
+    )
+
+
+class ResponseClassifier:
+    def __init__(self, intents=None):
+        self.intents = dict(intents or load_intents())
+        self._names = list(self.intents)
+        groups = [f"(?P<i{position}>{_alternatives(self.intents[name])})" for position, name in enumerate(self._names)]
+        # Whole words anywhere in the text
+        self._search = re.compile(r"(?<!\w)(?:" + "|".join(groups) + r")(?!\w)", re.IGNORECASE)
+        # The whole message, ignoring surrounding whitespace
+        self._exact = re.compile(r"\s*(?:" + "|".join(groups) + r")\s*", re.IGNORECASE)
+        self.classify = lru_cache(maxsize=CLASSIFY_CACHE_SIZE)(self._classify)
+        self.classify_exact = lru_cache(maxsize=CLASSIFY_CACHE_SIZE)(self._classify_exact)
+
+    @property
+    def names(self):
+        return list(self._names)
+
+    def _name(self, group):
+        return self._names[int(group[1:])]
+
+    def _classify(self, text):
+        # Set of intents mentioned in the text
+        if not text:
+            return frozenset()
+        return frozenset(self._name(match.lastgroup) for match in self._search.finditer(text))
+
+    def _classify_exact(self, text):
+        match = self._exact.fullmatch(text) if text else None
+        return self._name(match.lastgroup) if match else None
+
+    def classify_batch(self, texts):
+        return [self.classify(text) for text in texts]
+
+    def classify_exact_batch(self, texts):
+        return [self.classify_exact(text) for text in texts]
+
+
+_default = None
+
+
+def get_classifier():
+    # Process-wide classifier for the configured intents
+    global _default
+    if _default is None:
+        _default = ResponseClassifier()
+    return _default
@@ -0,0 +1,223 @@
+import os
+import threading
+from datetime import date, timedelta
+
+from message_loader import MESSAGES_NAMESPACE, cached_load_messages
+from persist import load_json, save_json
+from query_cache import cache_key, get_shared_cache
+
+# Pre-bucketed engagement rollups for the time-series views.
+# Timestamped messages are counted per UTC day, hour and sender type, and
+# the users active on each day are kept as mergeable user-day sets, so a
+# date range is answered by summing a few hundred day buckets instead of
+# rescanning the messages. The rollups are stored next to the raw data:
+# as tables kept current by triggers in the SQLite store, and as
+# ROLLUP_FILE in a Parquet snapshot (updated by each export). Without a
+# local store they are built once per load of the namespace.
+
+ROLLUP_FILE = "_rollups.json"  # Ignored by pyarrow like the other "_" files
+SECONDS_PER_DAY = 86400
+SENDER_TYPES = ("user", "agent")
+
+_EPOCH = date(1970, 1, 1)
+
+
+def epoch_day(day):
+    return (day - _EPOCH).days
+
+
+def day_date(day):
+    return _EPOCH + timedelta(days=day)
+
+
+def sender_bucket(sender_type):
+    # Missing sender types count as user messages, as in the metrics
+    return 0 if sender_type is None or sender_type == "user" else 1
+
+
+class Rollups:
+    def __init__(self):
+        self.days = {}  # epoch day -> [[24 user counts], [24 agent counts]]
+        self.user_days = {}  # epoch day -> set of users active that day
+        self.records = 0  # Messages folded in, with or without a timestamp
+        self.undated = 0
+
+    def _hours(self, day):
+        hours = self.days.get(day)
+        if hours is None:
+            hours = self.days[day] = [[0] * 24 for _ in SENDER_TYPES]
+        return hours
+
+    def add(self, records):
+        # Fold in records not counted before
+        for record in records:
+            self.records += 1
+            ts = record.ts
+            if ts is None:
+                self.undated += 1
+                continue
+            day, seconds = divmod(ts, SECONDS_PER_DAY)
+            self._hours(day)[sender_bucket(record.sender_type)][seconds // 3600] += 1
+            if record.user_name:
+                users = self.user_days.get(day)
+                if users is None:
+                    users = self.user_days[day] = set()
+                users.add(record.user_name)
+        return self
+
+    def add_bucket(self, day, hour, sender_type, messages):
+        self._hours(day)[sender_bucket(sender_type)][hour] += messages
+
+    def merge(self, other):
+        for day, hours in other.days.items():
+            mine = self._hours(day)
+            for sender, counts in enumerate(hours):
+                for hour, count in enumerate(counts):
+                    mine[sender][hour] += count
+        for day, users in other.user_days.items():
+            self.user_days.setdefault(day, set()).update(users)
+        self.records += other.records
+        self.undated += other.undated
+        return self
+
+    def date_bounds(self):
+        # (first, last) day with timestamped messages, or None
+        if not self.days:
+            return None
+        return day_date(min(self.days)), day_date(max(self.days))
+
+    def _range(self, start, end):
+        first = epoch_day(start) if start else min(self.days, default=0)
+        last = epoch_day(end) if end else max(self.days, default=-1)
+        return first, last
+
+    def summary(self, start=None, end=None):
+        # Totals over the days from start to end (dates, inclusive)
+        first, last = self._range(start, end)
+        user_messages = agent_messages = active_days = 0
+        active_users = set()
+        for day, hours in self.days.items():
+            if first <= day <= last:
+                user_messages += sum(hours[0])
+                agent_messages += sum(hours[1])
+                active_days += 1
+                active_users.update(self.user_days.get(day, ()))
+        return {
+            "messages": user_messages + agent_messages,
+            "user_messages": user_messages,
+            "agent_messages": agent_messages,
+            "active_users": len(active_users),
+            "active_days": active_days,
+        }
+
+    def daily(self, start=None, end=None):
+        # One row per day in the range, days without messages included
+        first, last = self._range(start, end)
+        rows = []
+        for day in range(first, last + 1):
+            hours = self.days.get(day)
+            user_messages = sum(hours[0]) if hours else 0
+            agent_messages = sum(hours[1]) if hours else 0
+            rows.append({
+                "date": day_date(day),
+                "messages": user_messages + agent_messages,
+                "user_messages": user_messages,
+                "agent_messages": agent_messages,
+                "active_users": len(self.user_days.get(day, ())),
+            })
+        return rows
+
+    def hourly(self, start=None, end=None):
+        # Messages per UTC hour of day over the range: (user counts, agent counts)
+        first, last = self._range(start, end)
+        totals = [[0] * 24 for _ in SENDER_TYPES]
+        for day, hours in self.days.items():
+            if first <= day <= last:
+                for sender, counts in enumerate(hours):
+                    for hour, count in enumerate(counts):
+                        totals[sender][hour] += count
+        return totals
+
+    def to_dict(self):
+        return {
+            "records": self.records,
+            "undated": self.undated,
+            "days": {str(day): hours for day, hours in self.days.items()},
+            "user_days": {str(day): sorted(users) for day, users in self.user_days.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        rollups = cls()
+        rollups.records = data.get("records", 0)
+        rollups.undated = data.get("undated", 0)
+        rollups.days = {int(day): hours for day, hours in data.get("days", {}).items()}
+        rollups.user_days = {int(day): set(users) for day, users in data.get("user_days", {}).items()}
+        return rollups
+
+    def save(self, path):
+        save_json(path, self.to_dict())
+
+
+def build_rollups(records):
+    return Rollups().add(records)
+
+
+def load_rollups(path):
+    # Persisted rollups, or None when there are none
+    data = load_json(path)
+    return None if data is None else Rollups.from_dict(data)
+
+
+_snapshot_lock = threading.Lock()
+
+
+def update_snapshot_rollups(path, records, existing_records):
+    # Fold records just appended to a snapshot into its ROLLUP_FILE. The file
+    # is rebuilt from the snapshot when it does not cover exactly the
+    # existing_records that were there before (missing, or an interrupted run).
+    from snapshot_store import load_snapshot_messages
+
+    rollup_path = os.path.join(path, ROLLUP_FILE)
+    with _snapshot_lock:
+        rollups = load_rollups(rollup_path)
+        if rollups is None or rollups.records != existing_records:
+            appended = {record.id for record in records}
+            rollups = build_rollups(r for r in load_snapshot_messages(path) if r.id not in appended)
+        rollups.add(records).save(rollup_path)
+        return rollups
+
+
+def snapshot_rollups(path):
+    # Rollups of a snapshot, rebuilt from its messages when the file is stale
+    from snapshot_store import load_snapshot_messages, read_ingest_state
+
+    rollups = load_rollups(os.path.join(path, ROLLUP_FILE))
+    if rollups is None or rollups.records != read_ingest_state(path).get("records"):
+        rollups = build_rollups(load_snapshot_messages(path))
+    return rollups
+
+
+def cached_rollups(index, namespace=MESSAGES_NAMESPACE, snapshot_dir=None, message_db=None, cache=None):
+    # Rollups of every message in the namespace, shared across reruns and
+    # keyed by the data version, so range changes never touch the messages
+    if cache is None:
+        cache = get_shared_cache()
+    if message_db:
+        from sqlite_store import get_message_store
+
+        store = get_message_store(message_db)
+        version, load = f"sqlite:{message_db}:{store.version()}", store.rollups
+    elif snapshot_dir:
+        from snapshot_store import snapshot_version
+
+        version, load = f"snapshot:{snapshot_dir}:{snapshot_version(snapshot_dir)}", lambda: snapshot_rollups(snapshot_dir)
+    else:
+        records, fetched_at = cached_load_messages(index, namespace=namespace)
+        version, load = fetched_at, lambda: build_rollups(records)
+    rollups, _ = cache.get_or_load(
+        cache_key(namespace, None, page=("rollups", version)),
+        load,
+        sizer=lambda rollups: 64 * sum(len(users) for users in rollups.user_days.values())
+    )
+    return rollups
@@ -0,0 +1,203 @@
+import json
+import os
+import re
+import unicodedata
+from array import array
+
+import numpy as np
+
+from message_loader import MESSAGES_NAMESPACE
+from perf import span
+from persist import LockedState, Registry, load_pickle, save_pickle
+
+# Full-text search over message text.
+# An inverted index maps each term to the (ascending) numbers of the
+# messages containing it; a query intersects the postings of its terms,
+# shortest first, and returns the most recent hits. Tokens are NFKD
+# normalised, stripped of diacritics and casefolded. Indonesian particles
+# and possessive suffixes (-lah, -kah, -tah, -pun, -ku, -mu, -nya) are
+# stripped into extra index terms, so "rumah" also finds "rumahnya" and
+# "tidak" finds "tidaklah". New records are added incrementally. Postings
+# and times are int64 arrays read through numpy views at query time, so
+# intersecting and ranking large postings stays in the millisecond range.
+# Used for messages loaded from the index or a snapshot; the SQLite store
+# answers the same searches from its FTS5 table (sqlite_store.StoreSearch).
+
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH")
+SEARCH_RESULT_LIMIT = 50
+SUFFIXES = ("lah", "kah", "tah", "pun", "nya", "ku", "mu")
+MIN_STEM_LENGTH = 3
+
+_TOKEN = re.compile(r"\w+")
+
+
+def normalize(text):
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def tokenize(text):
+    # Casefolded word tokens of a text, in order
+    if not text:
+        return []
+    return _TOKEN.findall(normalize(str(text)))
+
+
+def index_terms(token):
+    # The token plus each form left after stripping a particle, then a possessive
+    terms = [token]
+    for _ in range(2):
+        for suffix in SUFFIXES:
+            if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM_LENGTH:
+                token = token[:-len(suffix)]
+                terms.append(token)
+                break
+        else:
+            break
+    return terms
+
+
+def word_forms(term):
+    # Every token index_terms() derives term from: the term itself, or the
+    # term followed by one or two suffixes
+    forms = [term]
+    for first in SUFFIXES:
+        for form in (term + first, *(term + first + second for second in SUFFIXES)):
+            if term in index_terms(form):
+                forms.append(form)
+    return list(dict.fromkeys(forms))
+
+
+def _intersect(matches, postings):
+    # Ascending message numbers present in both (matches is the shorter side)
+    positions = np.searchsorted(postings, matches)
+    positions[positions == len(postings)] = 0
+    return matches[postings[positions] == matches]
+
+
+class SearchHit:
+    __slots__ = ("id", "user_name", "room_id", "ts", "timestamp", "text")
+
+    def __init__(self, id, user_name, room_id, ts, timestamp, text):
+        self.id = id
+        self.user_name = user_name
+        self.room_id = room_id
+        self.ts = ts  # Epoch seconds, or None
+        self.timestamp = timestamp  # Original timestamp string
+        self.text = text
+
+
+class SearchIndex(LockedState):
+    def __init__(self, namespace=MESSAGES_NAMESPACE, filter=None):
+        super().__init__()
+        self.namespace = namespace  # Query whose records the index holds
+        self.filter = filter
+        self._postings = {}  # term -> array of message numbers, ascending
+        self._numbers = {}  # message ID -> message number
+        self._ids = []
+        self._users = []
+        self._rooms = []
+        self._times = array("q")  # Epoch seconds, -1 when missing (sorts oldest)
+        self._timestamps = []
+        self._texts = []
+        self.indexed_at = None  # fetched_at of the last load folded in
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, records):
+        # Index records not seen before; returns how many were new
+        with self._lock:
+            return self._add(records)
+
+    def refresh(self, records, fetched_at, path=None):
+        # Fold in a new load (fetched_at) once, saving when it added records
+        with self._lock:
+            if self.indexed_at != fetched_at:
+                if self._add(records) and path:
+                    save_pickle(path, self)
+                self.indexed_at = fetched_at
+        return self
+
+    def _add(self, records):
+        with span("index search terms") as timing:
+            added = 0
+            for record in records:
+                if record.id in self._numbers:
+                    continue
+                number = len(self._ids)
+                self._numbers[record.id] = number
+                self._ids.append(record.id)
+                self._users.append(record.user_name)
+                self._rooms.append(record.room_id)
+                self._times.append(-1 if record.ts is None else record.ts)
+                self._timestamps.append("" if record.timestamp is None else record.timestamp)
+                self._texts.append("" if record.text is None else record.text)
+                terms = set()
+                for token in tokenize(record.text):
+                    terms.update(index_terms(token))
+                for term in terms:
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        postings = self._postings[term] = array("q")
+                    postings.append(number)
+                added += 1
+            timing.add(records=added)
+            return added
+
+    def _matches(self, query):
+        # Numbers of the messages containing every query term
+        terms = set(tokenize(query))
+        if not terms or not all(term in self._postings for term in terms):
+            return np.empty(0, dtype=np.int64)
+        postings = sorted((self._postings[term] for term in terms), key=len)
+        matches = np.frombuffer(postings[0], dtype=np.int64)
+        for other in postings[1:]:
+            matches = _intersect(matches, np.frombuffer(other, dtype=np.int64))
+            if not len(matches):
+                break
+        return matches
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT):
+        # Messages containing every query term, most recent first
+        with self._lock, span("search") as timing:
+            matches = self._matches(query)
+            timing.add(records=len(matches))
+            times = np.frombuffer(self._times, dtype=np.int64)[matches]
+            if len(matches) > limit:
+                top = np.argpartition(times, len(matches) - limit)[-limit:]
+                matches, times = matches[top], times[top]
+            order = np.lexsort((matches, times))[::-1]
+            return [self._hit(int(n)) for n in matches[order]]
+
+    def _hit(self, n):
+        ts = self._times[n]
+        return SearchHit(self._ids[n], self._users[n], self._rooms[n], None if ts < 0 else ts, self._timestamps[n], self._texts[n])
+
+    def count(self, query):
+        with self._lock:
+            return len(self._matches(query))
+
+    def save(self, path):
+        with self._lock:
+            save_pickle(path, self)
+
+
+def load_search_index(path, namespace=MESSAGES_NAMESPACE, filter=None):
+    # Persisted index of this namespace and filter, or an empty one. A file
+    # written for another query (or before indexes recorded theirs) is rebuilt.
+    search_index = load_pickle(path)
+    if search_index is not None and getattr(search_index, "namespace", None) == namespace:
+        if json.dumps(search_index.filter, sort_keys=True) == json.dumps(filter, sort_keys=True):
+            return search_index
+    return SearchIndex(namespace, filter)
+
+
+_indexes = Registry()
+
+
+def get_search_index(records, fetched_at, namespace=MESSAGES_NAMESPACE, filter=None, path=SEARCH_INDEX_PATH):
+    # One index per query and file, shared by every session of the process.
+    # Each new load (fetched_at) folds in only the records not indexed yet.
+    key = (namespace, json.dumps(filter, sort_keys=True), path)
+    return _indexes.get(key, lambda: load_search_index(path, namespace, filter)).refresh(records, fetched_at, path)
@@ -0,0 +1,296 @@
+import os
+import time
+from datetime import datetime
+
+import streamlit as st
+
+from message_clusters import CLUSTER_MIN_MESSAGES, cached_message_clusters
+from query_cache import get_shared_cache
+
+# Sidebar sections shared by the dashboards.
+# The dashboards draw the header straight away and leave a placeholder for
+# the metrics, which is filled at the end of the script run, so the main
+# page becomes usable before the metrics are computed. The "other single
+# messages" groups are only computed while their toggle is on, and so are
+# the date-range activity views, which are answered from rollups.py, and
+# the conversation metrics, which read every message (see
+# conversation_metrics.py).
+# Results of the approximate engine get their own view with error bounds.
+# DASHBOARD_DEBUG=1 shows how long each run took to become interactive;
+# with perf tracing on (see perf.py) a "Performance" panel breaks the run
+# down into its timed steps.
+
+DASHBOARD_DEBUG = os.getenv("DASHBOARD_DEBUG") == "1"
+OTHER_MESSAGES_KEY = "show_other_single_messages"
+ACTIVITY_KEY = "show_activity"
+CONVERSATIONS_KEY = "show_conversations"
+
+
+def render_sidebar_header(fetched_at):
+    # Display date at the top
+    current_date = datetime.now().strftime("%d/%m/%Y")
+    st.header(f"📅 {current_date}")
+
+    # Data freshness and manual cache invalidation
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.caption(f"Last refreshed at {datetime.fromtimestamp(fetched_at).strftime('%d/%m/%Y %H:%M:%S')}")
+    with col2:
+        st.button("🔄 Refresh data", on_click=get_shared_cache().invalidate)
+
+
+def metrics_placeholder():
+    # Slot filled by render_metrics once the rest of the page is drawn
+    placeholder = st.empty()
+    placeholder.caption("⏳ Computing metrics...")
+    return placeholder
+
+
+def render_metrics(metrics, index, fetched_at):
+    if metrics.get("approximate"):
+        render_approximate_metrics(metrics)
+        return
+
+    # Overview Metrics Section
+    st.header("📊 Overview Metrics")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Total Users", metrics["total_users"])
+        st.metric("Total Rooms", metrics["total_rooms"])
+    with col2:
+        st.metric("Total Messages", metrics["total_messages"])
+        st.metric("Avg Messages per User", metrics["avg_messages_per_user"])
+
+    # User Analysis Section
+    st.header("👤 User Analysis")
+
+    # Single Message Users Section
+    st.subheader("Single Message Users")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric(
+            "Total Single Message Users",
+            metrics["single_message_users"],
+            f"{metrics['single_message_percentage']}%"
+        )
+    with col2:
+        st.metric(
+            "Users saying 'Ya'",
+            metrics["single_ya_users"],
+            f"{metrics['single_ya_percentage']}%"
+        )
+    with col3:
+        st.metric(
+            "Users saying 'Tidak'",
+            metrics["single_tidak_users"],
+            f"{metrics['single_tidak_percentage']}%"
+        )
+
+    render_other_single_messages(metrics["other_single_messages"], index, fetched_at)
+
+    # Multiple Message Users Section
+    st.subheader("Multiple Message Users")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric(
+            "Total Multiple Message Users",
+            metrics["multiple_message_users"],
+            f"{metrics['multiple_message_percentage']}%"
+        )
+    with col2:
+        st.metric(
+            "Total Messages",
+            metrics["multiple_message_total"]
+        )
+    with col3:
+        st.metric(
+            "Avg Messages per User",
+            round(metrics["avg_messages_multiple_users"], 2)
+        )
+
+    # Message Metrics Section
+    st.header("📝 Message Metrics")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("User Messages", metrics["user_messages"])
+    with col2:
+        st.metric("Agent Messages", metrics["agent_messages"])
+
+
+def render_approximate_metrics(metrics):
+    # Sketch-based metrics (METRICS_ENGINE=approx), each estimate with its error bound
+    bounds = metrics["error_bounds"]
+    st.header("📊 Overview Metrics")
+    st.caption("≈ Approximate: distinct counts are HyperLogLog estimates (±, about 95%)")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Total Users", f"≈{metrics['total_users']:,} ± {bounds['total_users']:,}")
+        st.metric("Total Rooms", f"≈{metrics['total_rooms']:,} ± {bounds['total_rooms']:,}")
+    with col2:
+        st.metric("Total Messages", metrics["total_messages"])
+        st.metric("Avg Messages per User", f"≈{metrics['avg_messages_per_user']} ± {bounds['avg_messages_per_user']}")
+
+    # Message Metrics Section
+    st.header("📝 Message Metrics")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("User Messages", metrics["user_messages"])
+    with col2:
+        st.metric("Agent Messages", metrics["agent_messages"])
+
+    # Most Active Users Section
+    if metrics["top_users"]:
+        st.header("🏆 Most Active Users")
+        st.caption(f"Counts may be overestimated by up to {bounds['top_user_messages']:,} messages (99%)")
+        st.dataframe(
+            [
+                {"User": top["user"], "Messages": f"{top['min_messages']:,}–{top['messages']:,}"}
+                for top in metrics["top_users"]
+            ],
+            hide_index=True,
+            use_container_width=True
+        )
+    st.caption("Single/multiple message users and 'Ya'/'Tidak' replies need the exact engines.")
+
+
+def _duration(seconds):
+    if seconds is None:
+        return "–"
+    if seconds < 120:
+        return f"{seconds:.0f}s"
+    if seconds < 7200:
+        return f"{seconds / 60:.1f}m"
+    return f"{seconds / 3600:.1f}h"
+
+
+def render_conversations(load_metrics, show_by_default=False):
+    # Response times, turns and the reply funnel over every message, dated or
+    # not; load_metrics() is only called while shown
+    st.header("💬 Conversations")
+    if not st.toggle("Show conversation metrics", value=show_by_default, key=CONVERSATIONS_KEY):
+        return
+    with st.spinner("Analysing conversations..."):
+        metrics = load_metrics()
+    latency = metrics["response_latency"]
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Median Response Time", _duration(latency["p50_seconds"]))
+        st.metric("Avg Turns per Room", metrics["turns_per_room"]["mean"])
+    with col2:
+        st.metric("P90 Response Time", _duration(latency["p90_seconds"]))
+        st.metric("Unanswered Rooms", metrics["unanswered_rooms"])
+    st.caption(f"{latency['responses']:,} timed agent replies over {metrics['conversation_rooms']:,} rooms")
+
+    st.subheader("Reply Funnel")
+    st.dataframe(
+        [
+            {
+                "User Turns": f"{step['user_turns']}+" if step is metrics["funnel"][-1] else str(step["user_turns"]),
+                "Rooms": step["rooms"],
+                "%": step["percentage"],
+                "Stopped After": step["dropped"],
+            }
+            for step in metrics["funnel"]
+        ],
+        hide_index=True,
+        use_container_width=True
+    )
+
+    with st.expander(f"Per-user breakdown ({len(metrics['users']['user']):,} users)"):
+        st.dataframe(metrics["users"], hide_index=True, use_container_width=True)
+    with st.expander(f"Per-room breakdown ({metrics['conversation_rooms']:,} rooms)"):
+        st.dataframe(metrics["rooms"], hide_index=True, use_container_width=True)
+
+
+def render_other_single_messages(other_messages, index, fetched_at):
+    # Listed as they are when few, grouped by similarity once there are many;
+    # nothing is computed until the toggle is switched on
+    if not other_messages:
+        return
+    if not st.toggle(f"Show other single messages ({len(other_messages):,})", key=OTHER_MESSAGES_KEY):
+        return
+    if len(other_messages) >= CLUSTER_MIN_MESSAGES:
+        with st.spinner("Grouping similar messages..."):
+            clusters = cached_message_clusters(index, other_messages, fetched_at)
+        st.caption(f"{len(other_messages):,} messages in {len(clusters)} groups")
+        for cluster in clusters:
+            samples = " · ".join(f"“{text}” ×{count}" for text, count in cluster["samples"])
+            st.markdown(f"**{cluster['size']:,} messages**: {samples}")
+    else:
+        for msg in other_messages:
+            st.write(f"**{msg['user']}**: {msg['message']}")
+
+
+def render_activity(load_rollups, show_by_default=False):
+    # Engagement over a date range; load_rollups() is only called while shown
+    st.header("📈 Activity over Time")
+    if not st.toggle("Show activity by date", value=show_by_default, key=ACTIVITY_KEY):
+        return
+    with st.spinner("Loading activity..."):
+        rollups = load_rollups()
+    bounds = rollups.date_bounds()
+    if bounds is None:
+        st.caption("No messages with a timestamp yet")
+        return
+    first, last = bounds
+    # Keyed by the bounds so the range starts over when newer days arrive
+    picked = st.date_input("Date range", value=(first, last), min_value=first, max_value=last, key=f"activity_range:{first}:{last}")
+    if len(picked) < 2:
+        st.caption("Pick the last day of the range")
+        return
+    start, end = picked
+
+    summary = rollups.summary(start, end)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Messages", summary["messages"])
+        st.metric("Active Users", summary["active_users"])
+    with col2:
+        st.metric("User Messages", summary["user_messages"])
+        st.metric("Agent Messages", summary["agent_messages"])
+    st.caption(
+        f"{summary['active_days']:,} active days (UTC). "
+        f"{rollups.undated:,} messages without a timestamp are not included."
+    )
+
+    import pandas as pd
+
+    daily = pd.DataFrame(rollups.daily(start, end)).set_index("date")
+    st.subheader("Active Users per Day")
+    st.line_chart(daily["active_users"])
+    st.subheader("Messages per Day")
+    st.bar_chart(daily[["user_messages", "agent_messages"]])
+    user_hours, agent_hours = rollups.hourly(start, end)
+    st.subheader("Messages by Hour (UTC)")
+    st.bar_chart(pd.DataFrame({"user_messages": user_hours, "agent_messages": agent_hours}))
+
+
+def render_timings(started_at, interactive_at):
+    # Debug footer: time until the main page was usable, and until the run ended
+    if DASHBOARD_DEBUG:
+        st.caption(
+            f"⏱️ Interactive after {interactive_at - started_at:.2f}s, "
+            f"complete after {time.perf_counter() - started_at:.2f}s"
+        )
+
+
+def render_performance(trace):
+    # Timed steps of a finished run (perf.finish_trace), totalled per step
+    if trace is None:
+        return
+    with st.expander("⏱️ Performance"):
+        st.caption(f"Run took {trace.seconds * 1000:,.1f} ms")
+        st.dataframe(
+            [
+                {
+                    "Step": total["name"],
+                    "Calls": total["calls"],
+                    "Time (ms)": round(total["seconds"] * 1000, 1),
+                    "Records": total["records"],
+                    "Bytes": total["bytes"],
+                }
+                for total in trace.summary()
+            ],
+            hide_index=True,
+            use_container_width=True
+        )
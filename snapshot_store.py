@@ -0,0 +1,287 @@
+import argparse
+import os
+import re
+import shutil
+import time
+import uuid
+from datetime import datetime
+
+from message_loader import MESSAGES_NAMESPACE, LoadedRecords, column_records, iter_messages
+from persist import load_json, save_json
+
+# Local columnar snapshot of the messages namespace.
+# Metadata is stored as a Parquet dataset partitioned by message date
+# (<dir>/date=YYYY-MM-DD/*.parquet, messages without timestamp go to
+# date=unknown). Exports are incremental: only IDs not yet in the snapshot
+# are fetched and appended as new files. Files are written to a staging
+# directory and moved into place, so readers never see a partial file, and
+# every export that appends records bumps <dir>/_ingest_state.json, which
+# readers use as the snapshot version. Each append is a numbered batch
+# (part-<batch>-<n>.parquet, the state's "batches" is the last one), so a
+# reader can pick up only the batches added since it last looked; files
+# from before batches were numbered count as batch 0. Entries prefixed with
+# "_" are ignored by the Parquet reader.
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots/messages")
+SNAPSHOT_COLUMNS = ["id", "user_name", "room_id", "sender_type", "text", "timestamp"]
+METADATA_COLUMNS = SNAPSHOT_COLUMNS[1:]
+UNKNOWN_DATE = "unknown"
+APPEND_BATCH_SIZE = 50000  # Records buffered before writing a set of files
+STREAM_FILES = 64  # Data files read at a time when streaming the snapshot
+STATE_FILE = "_ingest_state.json"
+STAGING_DIR = "_staging"
+BATCH_TEMPLATE = "part-{batch:08d}-{{i}}.parquet"
+
+_BATCH_FILE = re.compile(r"part-(\d+)-")
+
+
+def partition_date(timestamp_str):
+    if not timestamp_str:
+        return UNKNOWN_DATE
+    try:
+        return datetime.fromisoformat(timestamp_str.replace('Z', '+00:00')).date().isoformat()
+    except (ValueError, TypeError, AttributeError):
+        return UNKNOWN_DATE
+
+
+def snapshot_exists(path=SNAPSHOT_DIR):
+    return os.path.isdir(path) and any(
+        name.startswith("date=") for name in os.listdir(path)
+    )
+
+
+def read_ingest_state(path=SNAPSHOT_DIR):
+    return load_json(os.path.join(path, STATE_FILE), {})
+
+
+def write_ingest_state(path=SNAPSHOT_DIR, **fields):
+    # Merge fields into the state file, replacing it atomically
+    state = read_ingest_state(path)
+    state.update(fields)
+    save_json(os.path.join(path, STATE_FILE), state)
+    return state
+
+
+def snapshot_version(path=SNAPSHOT_DIR):
+    # Changes whenever an export appends records; None for snapshots without a state file
+    return read_ingest_state(path).get("updated_at")
+
+
+def read_snapshot_ids(path=SNAPSHOT_DIR):
+    import pandas as pd
+
+    if not snapshot_exists(path):
+        return set()
+    return set(pd.read_parquet(path, columns=["id"])["id"])
+
+
+def records_to_frame(records):
+    import pandas as pd
+
+    rows = []
+    for record in records:
+        row = {"id": record.id}
+        for column in METADATA_COLUMNS:
+            value = getattr(record, column)
+            row[column] = None if value is None else str(value)
+        rows.append(row)
+    df = pd.DataFrame(rows, columns=SNAPSHOT_COLUMNS)
+    df["date"] = [partition_date(ts) for ts in df["timestamp"]]
+    return df
+
+
+def append_records(records, path=SNAPSHOT_DIR, batch=0):
+    # Write records as new files of the batch in their date partitions; returns the row count
+    df = records_to_frame(records)
+    if df.empty:
+        return 0
+    staging = os.path.join(path, STAGING_DIR, uuid.uuid4().hex)
+    os.makedirs(staging)
+    try:
+        df.to_parquet(
+            staging, engine="pyarrow", partition_cols=["date"], index=False,
+            basename_template=BATCH_TEMPLATE.format(batch=batch)
+        )
+        for partition in os.listdir(staging):
+            os.makedirs(os.path.join(path, partition), exist_ok=True)
+            for name in os.listdir(os.path.join(staging, partition)):
+                os.replace(os.path.join(staging, partition, name), os.path.join(path, partition, name))
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return len(df)
+
+
+def export_snapshot(index, path=SNAPSHOT_DIR, namespace=MESSAGES_NAMESPACE, on_progress=None, known_ids=None):
+    # Incrementally export the namespace; returns the number of new records.
+    # known_ids (updated in place) saves re-reading the snapshot's IDs on every poll.
+    if known_ids is None:
+        known_ids = read_snapshot_ids(path)
+    written = 0
+    buffer = []
+
+    def flush():
+        nonlocal written
+        from rollups import update_snapshot_rollups
+
+        batch = read_ingest_state(path).get("batches", 0) + 1
+        written += append_records(buffer, path, batch)
+        update_snapshot_rollups(path, buffer, existing_records=len(known_ids))
+        known_ids.update(record.id for record in buffer)
+        write_ingest_state(path, updated_at=time.time(), records=len(known_ids), batches=batch)
+        buffer.clear()
+
+    for record in iter_messages(index, namespace=namespace, skip_ids=known_ids, on_progress=on_progress):
+        buffer.append(record)
+        if len(buffer) >= APPEND_BATCH_SIZE:
+            flush()
+    if buffer:
+        flush()
+    return written
+
+
+def read_snapshot_frame(path=SNAPSHOT_DIR, columns=None):
+    import pandas as pd
+
+    df = pd.read_parquet(path, columns=columns)
+    if "date" in df.columns:
+        df["date"] = df["date"].astype(str)
+    return df
+
+
+def load_snapshot_messages(path=SNAPSHOT_DIR, filter=None):
+    # Snapshot rows as MessageRecords; null columns are left out of the metadata
+    # so filters such as {"timestamp": {"$exists": False}} behave as in Pinecone.
+    # The records keep the list of files they were read from (LoadedRecords).
+    files = snapshot_batch_files(path)
+    return LoadedRecords(load_snapshot_files(files, filter), source=(load_snapshot_part, (files, filter)))
+
+
+def load_snapshot_part(files, filter=None, part=0, parts=1):
+    # Records of every parts-th file from the part-th, in ID order
+    return load_snapshot_files(files[part::parts], filter)
+
+
+def snapshot_batch_files(path=SNAPSHOT_DIR, after=None, upto=None):
+    # Data files of the batches in (after, upto]; after=None starts from the first
+    files = []
+    for partition in sorted(os.listdir(path)) if os.path.isdir(path) else []:
+        if not partition.startswith("date="):
+            continue
+        for name in sorted(os.listdir(os.path.join(path, partition))):
+            match = _BATCH_FILE.match(name)
+            batch = int(match.group(1)) if match else 0
+            if (after is None or batch > after) and (upto is None or batch <= upto):
+                files.append(os.path.join(path, partition, name))
+    return files
+
+
+def load_snapshot_batches(path=SNAPSHOT_DIR, after=None, upto=None, filter=None):
+    # Records of the batches in (after, upto], in ID order within them
+    return load_snapshot_files(snapshot_batch_files(path, after, upto), filter)
+
+
+def iter_snapshot_messages(path=SNAPSHOT_DIR, columns=SNAPSHOT_COLUMNS):
+    # Records of STREAM_FILES data files after another, in ID order within
+    # each group only; columns left out (e.g. the text) are None in the records
+    files = snapshot_batch_files(path)
+    for start in range(0, len(files), STREAM_FILES):
+        yield from frame_records(read_snapshot_table(files[start:start + STREAM_FILES], columns).to_pandas())
+
+
+def load_snapshot_files(files, filter=None):
+    # Records of the given data files matching filter, in ID order
+    if not files:
+        return []
+    return frame_records(read_snapshot_table(files).to_pandas(), filter)
+
+
+def read_snapshot_table(files, columns=SNAPSHOT_COLUMNS):
+    # Arrow table of the given data files. Reading them one by one skips the
+    # dataset discovery of pq.read_table, which costs more than the reads
+    # themselves on the many small files of a date-partitioned snapshot.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tables = [pq.ParquetFile(name).read(columns=columns, use_threads=False) for name in files]
+    # A column that is null throughout a file is stored untyped there
+    return pa.concat_tables(tables, promote_options="default")
+
+
+def frame_records(df, filter=None):
+    # Snapshot rows as MessageRecords matching filter. The filter is applied
+    # as a column mask and the records are built from the remaining columns,
+    # so nothing is done per row for the rows it drops.
+    df = df.sort_values("id", kind="stable")  # Same order as Pinecone's ID listing
+    if filter:
+        df = df[frame_mask(df, filter).to_numpy()]
+    return column_records(*(df[column].tolist() if column in df else [None] * len(df) for column in SNAPSHOT_COLUMNS))
+
+
+def frame_mask(df, filter):
+    # Boolean Series of the rows matching a metadata filter; the vectorized
+    # counterpart of message_loader.matches_filter (null cells are missing)
+    import pandas as pd
+
+    mask = pd.Series(True, index=df.index)
+    for key, condition in filter.items():
+        if key == "$and":
+            for sub in condition:
+                mask &= frame_mask(df, sub)
+        elif key == "$or":
+            matched = pd.Series(False, index=df.index)
+            for sub in condition:
+                matched |= frame_mask(df, sub)
+            mask &= matched
+        elif isinstance(condition, dict):
+            for op, expected in condition.items():
+                mask &= _column_mask(df, key, op, expected)
+        else:  # {"field": value} shorthand for $eq
+            mask &= _column_mask(df, key, "$eq", condition)
+    return mask
+
+
+def _column_mask(df, key, op, expected):
+    import pandas as pd
+
+    if key in METADATA_COLUMNS:
+        column = df[key]
+        present = column.notna()
+    else:
+        column = pd.Series(None, index=df.index, dtype=object)
+        present = pd.Series(False, index=df.index)
+    if op == "$exists":
+        return present if expected else ~present
+    if op == "$eq":
+        return present & (column == expected)
+    if op == "$ne":
+        return ~(present & (column == expected))
+    if op == "$in":
+        return present & column.isin(expected)
+    if op == "$nin":
+        return ~(present & column.isin(expected))
+    compare = {"$gt": "gt", "$gte": "ge", "$lt": "lt", "$lte": "le"}.get(op)
+    if compare is None:
+        raise ValueError(f"Unsupported filter operator: {op}")
+    # Missing values never compare
+    compared = getattr(column[present], compare)(expected)
+    return compared.reindex(df.index, fill_value=False).astype(bool)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    from index_backend import get_index
+
+    parser = argparse.ArgumentParser(description="Export the messages namespace to a local Parquet snapshot")
+    parser.add_argument("--dir", default=SNAPSHOT_DIR, help="snapshot directory")
+    parser.add_argument("--namespace", default=MESSAGES_NAMESPACE)
+    args = parser.parse_args()
+
+    load_dotenv()
+    index = get_index()
+
+    def report(done, total):
+        print(f"\rFetched {done:,}/{total or '?'} new messages", end="", flush=True)
+
+    count = export_snapshot(index, path=args.dir, namespace=args.namespace, on_progress=report)
+    print(f"\nAppended {count:,} messages to {args.dir}")
@@ -0,0 +1,448 @@
+import argparse
+import os
+import sqlite3
+import threading
+
+from conversation_loader import ROOM_PAGE_SIZE
+from message_loader import MESSAGES_NAMESPACE, LoadedRecords, column_records, iter_messages, make_record
+from perf import span
+from persist import Registry
+from query_cache import cache_key, get_shared_cache
+from search_index import SEARCH_RESULT_LIMIT, tokenize, word_forms
+
+# Embedded SQLite message store.
+# One row per message with indexes for the dashboard lookups: users and
+# their rooms (user_name, room_id), a room's conversation in time order
+# (room_id, ts, id) and sender_type, plus an FTS5 table over the text. The
+# user list, room list, conversation pages and message search are indexed
+# queries instead of scans over every loaded message. ts holds the epoch seconds parsed at
+# load time (NULL sorts first, like timestamps.sort_key). Metadata is kept
+# as text with NULL for missing fields, as in the Parquet snapshot.
+# Populated by ingest_worker.py --db or by running this module.
+
+MESSAGE_DB = os.getenv("MESSAGE_DB")
+METADATA_COLUMNS = ["user_name", "room_id", "sender_type", "text", "timestamp"]
+INSERT_BATCH_SIZE = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    seq INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    user_name TEXT,
+    room_id TEXT,
+    sender_type TEXT,
+    text TEXT,
+    timestamp TEXT,
+    ts INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_messages_user_room ON messages (user_name, room_id);
+CREATE INDEX IF NOT EXISTS idx_messages_room_ts ON messages (room_id, ts, id);
+CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages (sender_type);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+    text, content='messages', content_rowid='seq', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, text) VALUES (new.seq, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.seq, old.text);
+END;
+CREATE TABLE IF NOT EXISTS rollup_hourly (
+    day INTEGER NOT NULL,
+    hour INTEGER NOT NULL,
+    sender_type TEXT NOT NULL,
+    messages INTEGER NOT NULL,
+    PRIMARY KEY (day, hour, sender_type)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_user_days (
+    day INTEGER NOT NULL,
+    user_name TEXT NOT NULL,
+    messages INTEGER NOT NULL,
+    PRIMARY KEY (day, user_name)
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS messages_rollup_insert AFTER INSERT ON messages WHEN new.ts IS NOT NULL BEGIN
+    INSERT INTO rollup_hourly VALUES (new.ts / 86400, new.ts % 86400 / 3600, COALESCE(new.sender_type, 'user'), 1)
+        ON CONFLICT DO UPDATE SET messages = messages + 1;
+    INSERT INTO rollup_user_days SELECT new.ts / 86400, new.user_name, 1 WHERE new.user_name <> ''
+        ON CONFLICT DO UPDATE SET messages = messages + 1;
+END;
+"""
+
+# Rollups of rows stored before the rollup tables existed
+ROLLUP_BACKFILL = """
+INSERT INTO rollup_hourly
+    SELECT ts / 86400, ts % 86400 / 3600, COALESCE(sender_type, 'user'), COUNT(*)
+    FROM messages WHERE ts IS NOT NULL GROUP BY 1, 2, 3;
+INSERT INTO rollup_user_days
+    SELECT ts / 86400, user_name, COUNT(*)
+    FROM messages WHERE ts IS NOT NULL AND user_name <> '' GROUP BY 1, 2;
+"""
+
+_COMPARISONS = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+def where_clause(filter):
+    # Translate the metadata filter syntax (see message_loader.matches_filter)
+    # into SQL with the same semantics; returns (sql, params)
+    if not filter:
+        return "1", []
+    parts, params = [], []
+    for key, condition in filter.items():
+        if key in ("$and", "$or"):
+            subclauses = [where_clause(sub) for sub in condition]
+            joiner = " AND " if key == "$and" else " OR "
+            parts.append("(" + (joiner.join(sql for sql, _ in subclauses) or ("1" if key == "$and" else "0")) + ")")
+            for _, sub_params in subclauses:
+                params.extend(sub_params)
+            continue
+        if key not in METADATA_COLUMNS:
+            raise ValueError(f"Unsupported filter field: {key}")
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, expected in condition.items():
+            if op == "$exists":
+                parts.append(f"{key} IS {'NOT ' if expected else ''}NULL")
+            elif op == "$eq":
+                parts.append(f"{key} = ?")
+                params.append(str(expected))
+            elif op == "$ne":
+                parts.append(f"({key} IS NULL OR {key} != ?)")
+                params.append(str(expected))
+            elif op in ("$in", "$nin"):
+                placeholders = ", ".join("?" * len(expected))
+                if op == "$in":
+                    parts.append(f"{key} IN ({placeholders})")
+                else:
+                    parts.append(f"({key} IS NULL OR {key} NOT IN ({placeholders}))")
+                params.extend(str(value) for value in expected)
+            elif op in _COMPARISONS:
+                parts.append(f"{key} {_COMPARISONS[op]} ?")
+                params.append(str(expected))
+            else:
+                raise ValueError(f"Unsupported filter operator: {op}")
+    return " AND ".join(parts) or "1", params
+
+
+def match_expression(query):
+    # FTS5 query for messages holding every query word, each possibly with
+    # the suffixes search_index strips ("rumah" also finds "rumahnya")
+    return " AND ".join(
+        "(" + " OR ".join(f'"{form}"' for form in word_forms(token)) + ")"
+        for token in dict.fromkeys(tokenize(query))
+    )
+
+
+def _row_to_record(row):
+    # (id, user_name, room_id, sender_type, text, timestamp) -> MessageRecord
+    metadata = {
+        column: value
+        for column, value in zip(METADATA_COLUMNS, row[1:])
+        if value is not None
+    }
+    return make_record(row[0], metadata)
+
+
+_SELECT_RECORDS = "SELECT id, user_name, room_id, sender_type, text, timestamp FROM messages"
+
+
+class MessageStore:
+    def __init__(self, path=MESSAGE_DB, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self._local = threading.local()  # One connection per thread (Streamlit sessions)
+        if not readonly:
+            with self.connection() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")  # Readers are not blocked by the writer
+                new_rollups = not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'rollup_hourly'").fetchone()
+                conn.executescript(SCHEMA)
+                if new_rollups:
+                    conn.executescript(ROLLUP_BACKFILL)
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.readonly:
+                conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            else:
+                conn = sqlite3.connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def _query(self, sql, params=()):
+        with span("sqlite query") as timing:
+            rows = self.connection().execute(sql, params).fetchall()
+            timing.add(records=len(rows))
+        return rows
+
+    def add_records(self, records):
+        # Insert records not stored yet; returns the number of new rows
+        conn = self.connection()
+        rows = [
+            (record.id, *[None if getattr(record, c) is None else str(getattr(record, c)) for c in METADATA_COLUMNS], record.ts)
+            for record in records
+        ]
+        with conn:
+            cursor = conn.executemany(
+                "INSERT OR IGNORE INTO messages (id, user_name, room_id, sender_type, text, timestamp, ts) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            return cursor.rowcount
+
+    def known_ids(self):
+        return {row[0] for row in self._query("SELECT id FROM messages")}
+
+    def ingest(self, index, namespace=MESSAGES_NAMESPACE, on_progress=None, known_ids=None):
+        # Incrementally copy the namespace; known_ids (updated in place) saves a scan per poll
+        if known_ids is None:
+            known_ids = self.known_ids()
+        written, buffer = 0, []
+        for record in iter_messages(index, namespace=namespace, skip_ids=known_ids, on_progress=on_progress):
+            buffer.append(record)
+            if len(buffer) >= INSERT_BATCH_SIZE:
+                written += self.add_records(buffer)
+                known_ids.update(r.id for r in buffer)
+                buffer = []
+        if buffer:
+            written += self.add_records(buffer)
+            known_ids.update(r.id for r in buffer)
+        return written
+
+    def version(self):
+        # Changes whenever rows are added
+        return self._query("SELECT MAX(seq) FROM messages")[0][0]
+
+    def count(self):
+        return self._query("SELECT COUNT(*) FROM messages")[0][0]
+
+    def load_messages(self, filter=None, after=None, upto=None):
+        # Matching records in ID order (the order Pinecone lists them in),
+        # optionally of the rows after row `after` up to row upto (see version())
+        where, params = where_clause(filter)
+        where = f"({where}) AND seq > ?"
+        params = [*params, after or 0]
+        if upto is not None:
+            where += " AND seq <= ?"
+            params.append(upto)
+        rows = self._query(f"{_SELECT_RECORDS} WHERE {where} ORDER BY id", params)
+        return column_records(*zip(*rows)) if rows else []
+
+    def messages_between(self, after_seq, upto_seq, batch_size=INSERT_BATCH_SIZE):
+        # Records stored after row after_seq up to row upto_seq (see version()),
+        # in storage order and streamed in batches
+        cursor = self.connection().execute(
+            f"{_SELECT_RECORDS} WHERE seq > ? AND seq <= ? ORDER BY seq", [after_seq, upto_seq]
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield _row_to_record(row)
+
+    def conversation_records(self, batch_size=INSERT_BATCH_SIZE):
+        # Every message with a user and a room, one room after the other, each
+        # in conversation order. Streamed in batches: the user/room index gives
+        # the room order, so only one room at a time is sorted by time.
+        cursor = self.connection().execute(
+            f"{_SELECT_RECORDS} WHERE user_name <> '' AND room_id <> '' ORDER BY user_name, room_id, ts, id"
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield _row_to_record(row)
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT, filter=None):
+        # Messages containing every query word (or a longer word starting
+        # with it), most recent first
+        match = match_expression(query)
+        if not match:
+            return []
+        where, params = where_clause(filter)
+        rows = self._query(
+            f"{_SELECT_RECORDS} WHERE seq IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?) "
+            f"AND {where} ORDER BY ts DESC, seq DESC LIMIT ?",
+            [match, *params, limit]
+        )
+        return [_row_to_record(row) for row in rows]
+
+    def search_count(self, query, filter=None):
+        match = match_expression(query)
+        if not match:
+            return 0
+        where, params = where_clause(filter)
+        return self._query(
+            f"SELECT COUNT(*) FROM messages WHERE seq IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?) AND {where}",
+            [match, *params]
+        )[0][0]
+
+    def search_index(self, filter=None):
+        return StoreSearch(self, filter)
+
+    def conversations(self, filter=None):
+        return StoreConversations(self, filter)
+
+    def rollups(self):
+        # Rollups kept by the insert trigger (built from the rows if the
+        # database predates them and was only opened read-only since)
+        from rollups import Rollups, build_rollups
+
+        try:
+            hourly = self._query("SELECT day, hour, sender_type, messages FROM rollup_hourly")
+            user_days = self._query("SELECT day, user_name FROM rollup_user_days")
+        except sqlite3.OperationalError:
+            return build_rollups(self.load_messages())
+        rollups = Rollups()
+        for day, hour, sender_type, messages in hourly:
+            rollups.add_bucket(day, hour, sender_type, messages)
+        for day, user_name in user_days:
+            rollups.user_days.setdefault(day, set()).add(user_name)
+        rollups.records = self.count()
+        rollups.undated = self._query("SELECT COUNT(*) FROM messages WHERE ts IS NULL")[0][0]
+        return rollups
+
+
+class StoreSearch:
+    # Same interface as search_index.SearchIndex, answered by the FTS5 table
+    # of a MessageStore (restricted to a metadata filter)
+    def __init__(self, store, filter=None):
+        self.store = store
+        self.filter = filter
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT):
+        return self.store.search(query, limit, self.filter)
+
+    def count(self, query):
+        return self.store.search_count(query, self.filter)
+
+
+class StoreConversations:
+    # Same interface as conversation_loader.ConversationIndex, answered by
+    # indexed queries against a MessageStore (restricted to a metadata filter)
+    def __init__(self, store, filter=None):
+        self.store = store
+        self.filter = filter
+        self._where, self._params = where_clause(filter)
+
+    def users(self):
+        rows = self.store._query(
+            f"SELECT DISTINCT user_name FROM messages WHERE user_name IS NOT NULL AND {self._where} ORDER BY user_name",
+            self._params
+        )
+        return [row[0] for row in rows]
+
+    def rooms(self, user_name):
+        # Room IDs of a user, in the order they were first seen
+        rows = self.store._query(
+            f"SELECT room_id FROM messages WHERE user_name = ? AND room_id IS NOT NULL AND {self._where} "
+            "GROUP BY room_id ORDER BY MIN(id)",
+            [user_name, *self._params]
+        )
+        return [row[0] for row in rows]
+
+    def room_size(self, user_name, room_id):
+        return self.store._query(
+            f"SELECT COUNT(*) FROM messages WHERE room_id = ? AND user_name = ? AND {self._where}",
+            [room_id, user_name, *self._params]
+        )[0][0]
+
+    def room_messages(self, user_name, room_id):
+        return self._room_records(user_name, room_id)
+
+    def room_page(self, user_name, room_id, page=0, page_size=ROOM_PAGE_SIZE):
+        # One page of a room in chronological order; returns (messages, page_count)
+        page_count = max(1, -(-self.room_size(user_name, room_id) // page_size))
+        page = min(max(page, 0), page_count - 1)
+        return self._room_records(user_name, room_id, page_size, page * page_size), page_count
+
+    def room_position(self, user_name, room_id, epoch):
+        # Number of messages in the room before the given epoch second
+        return self.store._query(
+            f"SELECT COUNT(*) FROM messages WHERE room_id = ? AND user_name = ? AND (ts IS NULL OR ts < ?) AND {self._where}",
+            [room_id, user_name, epoch, *self._params]
+        )[0][0]
+
+    def room_date_bounds(self, user_name, room_id):
+        # (first, last) epoch second of the room's dated messages, or None
+        first, last = self.store._query(
+            f"SELECT MIN(ts), MAX(ts) FROM messages WHERE room_id = ? AND user_name = ? AND {self._where}",
+            [room_id, user_name, *self._params]
+        )[0]
+        return None if first is None else (first, last)
+
+    def message_position(self, user_name, room_id, message_id, ts=None):
+        # Position of a message within its room (for linking to its page)
+        if ts is None:
+            before, params = "ts IS NULL AND id < ?", [message_id]
+        else:
+            before, params = "(ts IS NULL OR ts < ? OR (ts = ? AND id < ?))", [ts, ts, message_id]
+        return self.store._query(
+            f"SELECT COUNT(*) FROM messages WHERE room_id = ? AND user_name = ? AND {before} AND {self._where}",
+            [room_id, user_name, *params, *self._params]
+        )[0][0]
+
+    def _room_records(self, user_name, room_id, limit=-1, offset=0):
+        rows = self.store._query(
+            f"{_SELECT_RECORDS} WHERE room_id = ? AND user_name = ? AND {self._where} ORDER BY ts, id LIMIT ? OFFSET ?",
+            [room_id, user_name, *self._params, limit, offset]
+        )
+        return [_row_to_record(row) for row in rows]
+
+
+_stores = Registry()
+
+
+def get_message_store(path=MESSAGE_DB):
+    # Read-only store handle shared by every session of the process
+    return _stores.get(path, lambda: MessageStore(path, readonly=True))
+
+
+def load_store_part(path, filter=None, upto=0, part=0, parts=1):
+    # Records of the part-th of parts equal row ranges up to row upto, read
+    # over a read-only connection of its own (in worker processes)
+    return MessageStore(path, readonly=True).load_messages(filter, after=upto * part // parts, upto=upto * (part + 1) // parts)
+
+
+def cached_store_messages(path=MESSAGE_DB, namespace=MESSAGES_NAMESPACE, filter=None, cache=None):
+    # Returns (records, fetched_at) for metrics; keyed by the store version,
+    # so rows added by the ingestion worker are picked up on the next rerun.
+    # The records are pinned to that version (LoadedRecords) for rereading.
+    if cache is None:
+        cache = get_shared_cache()
+    store = get_message_store(path)
+    version = store.version()
+
+    def load():
+        return LoadedRecords(
+            store.load_messages(filter, upto=version or 0),
+            source=(load_store_part, (os.path.abspath(path), filter, version or 0))
+        )
+
+    return cache.get_or_load(cache_key(namespace, filter, page=(f"sqlite:{path}", version)), load)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="Copy the messages namespace (or a Parquet snapshot) into the SQLite store")
+    parser.add_argument("--db", default=MESSAGE_DB or "messages.db", help="SQLite database path")
+    parser.add_argument("--namespace", default=MESSAGES_NAMESPACE)
+    parser.add_argument("--from-snapshot", metavar="DIR", help="import a Parquet snapshot instead of the index")
+    args = parser.parse_args()
+
+    store = MessageStore(args.db)
+    if args.from_snapshot:
+        from snapshot_store import load_snapshot_messages
+
+        count = store.add_records(load_snapshot_messages(args.from_snapshot))
+    else:
+        from index_backend import get_index
+
+        load_dotenv()
+
+        def report(done, total):
+            print(f"\rFetched {done:,}/{total or '?'} new messages", end="", flush=True)
+
+        count = store.ingest(get_index(), namespace=args.namespace, on_progress=report)
+    print(f"\nAdded {count:,} messages to {args.db}")
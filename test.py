@@ -1,9 +1,10 @@
 import streamlit as st
-from pinecone import Pinecone
 from dotenv import load_dotenv
-import os
 from datetime import datetime
-from collections import defaultdict
+from metrics import compute_response_metrics
+from index_backend import resolve_message_source
+from message_loader import MESSAGES_NAMESPACE, cached_load_messages, progress_callback
+from query_cache import get_shared_cache
 
 # Load environment variables
 load_dotenv()
@@ -17,75 +18,40 @@ st.set_page_config(
 st.title("Metrics of WhatsApp Bot")
 st.write(f"Date: 29/04/2024")
 
-# Initialize Pinecone
+# Initialize the index backend
 try:
-    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-    index = pc.Index(os.getenv("PINECONE_INDEX"))
-
-    # Query to get all messages
-    query_result = index.query(
-        vector=[0.0]*1536,
-        namespace="messages",
-        top_k=1000,
-        include_metadata=True
+    # Start from the local SQLite store or Parquet snapshot (kept current by
+    # ingest_worker.py) when one is configured
+    index, snapshot_dir, message_db = resolve_message_source()
+
+    # Load all messages in the namespace (no top_k truncation), cached across reruns
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    messages, fetched_at = cached_load_messages(
+        index,
+        namespace=MESSAGES_NAMESPACE,
+        on_progress=progress_callback(progress_bar, status_text),
+        snapshot_dir=snapshot_dir,
+        message_db=message_db
     )
+    progress_bar.empty()
+    status_text.empty()
 
-    # Initialize counters
-    tidak_count = 0
-    total_messages = 0
-    users_saying_tidak = set()
-    users_only_tidak = set()
-    user_message_counts = defaultdict(int)
-    user_tidak_counts = defaultdict(int)
-    user_messages = defaultdict(list)  # Store all messages per user
-
-    ya_count = 0
-    users_saying_ya = set()
-    users_only_ya = set()
-    user_ya_counts = defaultdict(int)
+    # Data freshness and manual cache invalidation
+    with st.sidebar:
+        st.caption(f"Last refreshed at {datetime.fromtimestamp(fetched_at).strftime('%d/%m/%Y %H:%M:%S')}")
+        st.button("🔄 Refresh data", on_click=get_shared_cache().invalidate)
 
-    # First pass: collect all messages and counts
-    for match in query_result.matches:
-        if match.metadata:
-            text = match.metadata.get("text", "").strip()
-            user_name = match.metadata.get("user_name", "")
-            if not user_name:  # Skip if no user name
-                continue
-                
-            total_messages += 1
-            user_message_counts[user_name] += 1
-            user_messages[user_name].append(text)
-            
-            # Count "tidak" responses
-            if "tidak" in text.lower():
-                tidak_count += 1
-                users_saying_tidak.add(user_name)
-                user_tidak_counts[user_name] += 1
-            
-            # Count "ya" responses
-            if "ya" in text.lower() or "Ya" in text:
-                ya_count += 1
-                users_saying_ya.add(user_name)
-                user_ya_counts[user_name] += 1
-
-    # Second pass: verify users who only said "tidak" or "ya"
-    for user, messages in user_messages.items():
-        # Check for "tidak" only
-        if user in users_saying_tidak:
-            all_tidak = all("tidak" in msg.lower() for msg in messages)
-            if all_tidak:
-                users_only_tidak.add(user)
-        
-        # Check for "ya" only
-        if user in users_saying_ya:
-            all_ya = all(("ya" in msg.lower() or "Ya" in msg) for msg in messages)
-            if all_ya:
-                users_only_ya.add(user)
+    # Response analysis with the shared classifier (METRICS_ENGINE selects the python or pandas engine)
+    response_metrics = compute_response_metrics(messages)
+    total_messages = response_metrics["total_messages"]
+    tidak_count = response_metrics["tidak_messages"]
+    ya_count = response_metrics["ya_messages"]
 
     # Display debug information
     st.write("Debug Information:")
-    st.write(f"Total unique users: {len(user_message_counts)}")
-    st.write(f"Users with messages: {list(user_message_counts.keys())}")
+    st.write(f"Total unique users: {response_metrics['total_users']}")
+    st.write(f"Users with messages: {response_metrics['users']}")
     st.write("---")
 
     # Display "tidak" metrics
@@ -99,10 +65,10 @@ try:
         st.metric("Messages with 'tidak'", tidak_count)
     
     with col3:
-        st.metric("Unique Users saying 'tidak'", len(users_saying_tidak))
+        st.metric("Unique Users saying 'tidak'", response_metrics["users_saying_tidak"])
     
     with col4:
-        st.metric("Users only saying 'tidak'", len(users_only_tidak))
+        st.metric("Users only saying 'tidak'", response_metrics["users_only_tidak"])
 
     # Display "tidak" percentage
     if total_messages > 0:
@@ -123,15 +89,32 @@ try:
         st.metric("Messages with 'ya'", ya_count)
     
     with col7:
-        st.metric("Unique Users saying 'ya'", len(users_saying_ya))
+        st.metric("Unique Users saying 'ya'", response_metrics["users_saying_ya"])
     
     with col8:
-        st.metric("Users only saying 'ya'", len(users_only_ya))
+        st.metric("Users only saying 'ya'", response_metrics["users_only_ya"])
 
     # Display "ya" percentage
     if total_messages > 0:
         percentage = (ya_count / total_messages) * 100
         st.metric("Percentage of messages with 'ya'", f"{percentage:.2f}%")
 
+    # Display the other configured intents (RESPONSE_INTENTS), e.g. "stop"
+    for intent, counts in response_metrics["intents"].items():
+        if intent in ("ya", "tidak"):
+            continue
+        st.write("---")
+        st.subheader(f"User Response Analysis - '{intent.title()}'")
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric(f"Messages with '{intent}'", counts["messages"])
+        with col2:
+            st.metric(f"Unique Users saying '{intent}'", counts["users_saying"])
+        with col3:
+            st.metric(f"Users only saying '{intent}'", counts["users_only"])
+        with col4:
+            if total_messages > 0:
+                st.metric(f"Percentage of messages with '{intent}'", f"{counts['messages'] / total_messages * 100:.2f}%")
+
 except Exception as e:
     st.error(f"Error connecting to database: {str(e)}") 
\ No newline at end of file
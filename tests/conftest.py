@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the top level of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_index import FakeVector  # noqa: E402
+
+
+def match(id, **metadata):
+    return FakeVector(id, metadata=metadata)
+
+
+@pytest.fixture
+def edge_case_matches():
+    # Synthetic matches covering the corner cases of the sidebar metrics
+    return [
+        # Single message users answering "ya" / "tidak", and one saying something else
+        match("a1", user_name="ana", room_id="r1", sender_type="user", text="Ya"),
+        match("b1", user_name="budi", room_id="r2", sender_type="user", text="  tidak "),
+        match("c1", user_name="citra", room_id="r3", sender_type="user", text="halo, berapa harganya?"),
+        # Several messages over two rooms, from both senders
+        match("d1", user_name="dewi", room_id="r4", sender_type="user", text="ya saya mau"),
+        match("d2", user_name="dewi", room_id="r4", sender_type="agent", text="Baik, terima kasih."),
+        match("d3", user_name="dewi", room_id="r5", sender_type="user", text="stop"),
+        # Dated messages are not counted, but a dated first user message
+        # still classifies a single message user
+        match("e1", user_name="eka", room_id="r6", sender_type="user", text="ya", timestamp="2024-05-01T10:00:00Z"),
+        match("e2", user_name="eka", room_id="r6", sender_type="agent", text="Halo!"),
+        match("f1", user_name="fajar", room_id="r7", sender_type="user", text="tidak", timestamp="2024-05-01T10:00:00Z"),
+        # An empty timestamp counts as undated
+        match("g1", user_name="gita", room_id="r8", sender_type="user", text="tidak", timestamp=""),
+        # Missing sender_type counts as a user message, but does not classify
+        match("h1", user_name="hadi", room_id="r9", text="ya"),
+        # Missing or empty user_name / room_id only count towards the total
+        match("i1", room_id="r10", sender_type="user", text="ya"),
+        match("i2", user_name="", room_id="r10", sender_type="user", text="ya"),
+        match("j1", user_name="joko", sender_type="user", text="ya"),
+        match("j2", user_name="joko", room_id="", sender_type="user", text="ya"),
+        match("k1", user_name="kiki", room_id="r11", sender_type="agent"),
+        FakeVector("l1", metadata=None),
+    ]
@@ -0,0 +1,69 @@
+import parallel_metrics
+from approximate_metrics import ApproximateAggregate, calculate_metrics_approx, merge_aggregates
+from benchmark import generate_messages
+from fake_index import FakeIndex
+from incremental_metrics import load_metrics_state, message_source
+from message_loader import matches_filter
+from metrics import calculate_metrics
+from parallel_metrics import shard_of
+from sketches import TopK
+
+UNDATED = {"timestamp": {"$exists": False}}
+
+
+def undated_messages(count, seed):
+    return [record for record in generate_messages(count, timestamped_fraction=0.3, seed=seed) if matches_filter(record, UNDATED)]
+
+
+def test_estimates_stay_within_their_error_bounds():
+    records = undated_messages(20000, seed=8)
+    exact = calculate_metrics(records)
+    approximate = calculate_metrics_approx(records, workers=1)
+    for key in ("total_messages", "user_messages", "agent_messages"):
+        assert approximate[key] == exact[key]
+    for key in ("total_users", "total_rooms"):
+        assert abs(approximate[key] - exact[key]) <= approximate["error_bounds"][key]
+
+
+def test_merged_user_partitions_match_one_aggregate():
+    records = undated_messages(6000, seed=9)
+    whole = ApproximateAggregate()
+    whole.add_all(records)
+    parts = [ApproximateAggregate() for _ in range(3)]
+    for record in records:
+        parts[shard_of(record.user_name, 3)].add_record(record)
+    assert merge_aggregates(parts).result() == whole.result()
+
+
+def test_worker_processes_merge_their_sketches(monkeypatch):
+    records = undated_messages(6000, seed=10)
+    monkeypatch.setattr(parallel_metrics, "PARALLEL_MIN_RECORDS", 0)
+    try:
+        assert calculate_metrics_approx(records, workers=2) == calculate_metrics_approx(records, workers=1)
+    finally:
+        parallel_metrics._reset_pool()
+
+
+def test_tied_users_keep_one_order_however_they_were_added():
+    forward, backward, merged = TopK(k=3), TopK(k=3), TopK(k=3)
+    users = ["budi", "ana", "dewi", "citra"]
+    for user in users:
+        forward.add(user, 5)
+    for user in reversed(users):
+        backward.add(user, 5)
+    for user in users:
+        part = TopK(k=3)
+        part.add(user, 5)
+        merged.merge(part)
+    assert forward.top() == backward.top() == merged.top() == [("ana", 5), ("budi", 5), ("citra", 5)]
+
+
+def test_incremental_state_persists_the_sketches(tmp_path):
+    records = generate_messages(4000, timestamped_fraction=0.3, seed=11)
+    path = str(tmp_path / "state.pickle")
+    index = FakeIndex.from_records(records[:2500])
+    load_metrics_state(path, UNDATED, "approx", message_source()).refresh(index, path=path)
+    index.upsert([(r.id, None, r.metadata) for r in records[2500:]], namespace="messages")
+    resumed = load_metrics_state(path, UNDATED, "approx", message_source())
+    assert resumed.refresh(index, path=path) == 1500
+    assert resumed.result() == calculate_metrics_approx([r for r in records if matches_filter(r, UNDATED)], workers=1)
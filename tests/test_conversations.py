@@ -0,0 +1,78 @@
+import pytest
+
+import snapshot_store
+from benchmark import generate_messages
+from conftest import match
+from conversation_loader import ConversationIndex
+from conversation_metrics import calculate_conversation_metrics, conversation_records
+from fake_index import FakeIndex
+from message_loader import as_record, matches_filter
+from snapshot_store import append_records
+from sqlite_store import MessageStore
+from timestamps import date_to_epoch, epoch_to_date, sort_key
+
+UNDATED = {"timestamp": {"$exists": False}}
+
+
+@pytest.fixture
+def records():
+    return [as_record(m) for m in [
+        match("m1", user_name="ana", room_id="r1", sender_type="user", text="halo"),
+        match("m2", user_name="ana", room_id="r1", sender_type="user", text="ya", timestamp="2024-05-01T10:00:00Z"),
+        match("m3", user_name="ana", room_id="r1", sender_type="agent", text="Baik", timestamp="2024-05-03T08:30:00Z"),
+        match("m4", user_name="budi", room_id="r2", sender_type="user", text="tidak"),
+    ]]
+
+
+@pytest.fixture(params=["index", "store"])
+def conversations(request, records, tmp_path):
+    # Both backends of the conversation view
+    def build(filter=None):
+        if request.param == "index":
+            return ConversationIndex([record for record in records if matches_filter(record, filter)])
+        store = MessageStore(str(tmp_path / "messages.db"))
+        store.add_records(records)
+        return store.conversations(filter)
+    return build
+
+
+def test_room_date_bounds_cover_the_dated_messages(conversations):
+    bounds = conversations().room_date_bounds("ana", "r1")
+    assert [epoch_to_date(epoch).isoformat() for epoch in bounds] == ["2024-05-01", "2024-05-03"]
+    assert bounds[0] == date_to_epoch(epoch_to_date(bounds[0])) + 10 * 3600
+
+
+def test_room_date_bounds_are_none_without_dated_messages(conversations):
+    assert conversations().room_date_bounds("budi", "r2") is None
+    assert conversations(UNDATED).room_date_bounds("ana", "r1") is None
+
+
+def breakdown_rows(metrics):
+    # The metrics with the per-room and per-user breakdowns as sets of rows:
+    # the room order depends on the source
+    metrics = dict(metrics)
+    return metrics, {name: sorted(zip(*metrics.pop(name).values())) for name in ("rooms", "users")}
+
+
+@pytest.mark.parametrize("source", ["index", "snapshot", "sqlite"])
+def test_every_source_streams_rooms_in_conversation_order(records, source, tmp_path, monkeypatch):
+    history = records + generate_messages(3000, timestamped_fraction=0.6, seed=11)
+    # A room's messages sorted together with every other room's
+    expected = calculate_conversation_metrics(sorted(
+        (record for record in sorted(history, key=lambda record: record.id) if record.user_name and record.room_id),
+        key=sort_key
+    ))
+    index = snapshot_dir = message_db = None
+    if source == "index":
+        index = FakeIndex.from_records(history)
+    elif source == "snapshot":
+        snapshot_dir = str(tmp_path / "snapshot")
+        # Files stream one by one, and every room is split over both batches
+        monkeypatch.setattr(snapshot_store, "STREAM_FILES", 1)
+        append_records(history[1::2], snapshot_dir, batch=1)
+        append_records(history[::2], snapshot_dir, batch=2)
+    else:
+        message_db = str(tmp_path / "messages.db")
+        MessageStore(message_db).add_records(history)
+    streamed = calculate_conversation_metrics(conversation_records(index, snapshot_dir=snapshot_dir, message_db=message_db))
+    assert breakdown_rows(streamed) == breakdown_rows(expected)
@@ -0,0 +1,112 @@
+import random
+import uuid
+
+import pytest
+
+from benchmark import generate_messages
+from fake_index import FakeIndex
+from incremental_metrics import get_metrics_state, load_metrics_state, message_source
+from message_loader import MESSAGES_NAMESPACE, make_record, matches_filter
+from metrics import calculate_metrics
+from snapshot_store import append_records, read_ingest_state, snapshot_batch_files, write_ingest_state
+from sqlite_store import MessageStore
+
+UNDATED = {"timestamp": {"$exists": False}}
+
+
+@pytest.fixture
+def records():
+    return generate_messages(3000, timestamped_fraction=0.3, seed=4)
+
+
+class IndexSource:
+    def __init__(self, tmp_path):
+        self.index = FakeIndex()
+        self.source = message_source()
+
+    def add(self, records):
+        self.index.upsert([(r.id, None, r.metadata) for r in records], namespace=MESSAGES_NAMESPACE)
+
+    def refresh(self, state, path):
+        return state.refresh(self.index, path=path)
+
+
+class StoreSource:
+    def __init__(self, tmp_path):
+        self.path = str(tmp_path / "messages.db")
+        self.store = MessageStore(self.path)
+        self.source = message_source(message_db=self.path)
+
+    def add(self, records):
+        self.store.add_records(records)
+
+    def refresh(self, state, path):
+        return state.refresh(message_db=self.path, path=path)
+
+
+class SnapshotSource:
+    def __init__(self, tmp_path):
+        self.path = str(tmp_path / "snapshot")
+        self.source = message_source(snapshot_dir=self.path)
+
+    def add(self, records):
+        # As export_snapshot does: write the batch, then publish it in the ingest state
+        batch = read_ingest_state(self.path).get("batches", 0) + 1
+        append_records(records, self.path, batch)
+        write_ingest_state(self.path, batches=batch)
+
+    def refresh(self, state, path):
+        return state.refresh(snapshot_dir=self.path, path=path)
+
+
+@pytest.fixture(params=[IndexSource, StoreSource, SnapshotSource], ids=["index", "sqlite", "snapshot"])
+def source(request, tmp_path):
+    return request.param(tmp_path)
+
+
+def test_refresh_reads_only_messages_added_after_the_watermark(records, source, tmp_path):
+    path = str(tmp_path / "state.pickle")
+    state = load_metrics_state(path, UNDATED, source=source.source)
+    source.add(records[:2000])
+    assert source.refresh(state, path) == 2000
+    assert source.refresh(state, path) == 0
+
+    # A new process resumes from the saved watermark
+    source.add(records[2000:])
+    resumed = load_metrics_state(path, UNDATED, source=source.source)
+    assert source.refresh(resumed, path) == 1000
+    undated = [record for record in records if matches_filter(record, UNDATED)]
+    assert resumed.result() == calculate_metrics(undated)
+
+
+def test_states_of_another_source_are_rebuilt(records, tmp_path):
+    path = str(tmp_path / "state.pickle")
+    state = load_metrics_state(path, source=message_source())
+    state.refresh(FakeIndex.from_records(records), path=path)
+    assert load_metrics_state(path, source=message_source()).watermark is not None
+    assert load_metrics_state(path, source=message_source(message_db="m.db")).watermark is None
+
+
+def test_states_are_shared_per_source(tmp_path):
+    path = str(tmp_path / "state.pickle")
+    assert get_metrics_state(path, source="a") is get_metrics_state(path, source="a")
+    assert get_metrics_state(path, source="a") is not get_metrics_state(path, source="b")
+
+
+def test_snapshot_files_before_numbered_batches_are_batch_zero(records, tmp_path):
+    path = str(tmp_path / "snapshot")
+    append_records(records[:10], path)
+    append_records(records[10:20], path, batch=1)
+    assert len(snapshot_batch_files(path)) == len(snapshot_batch_files(path, upto=0)) + len(snapshot_batch_files(path, after=0))
+
+
+def test_index_refresh_counts_new_ids_that_list_before_old_ones(records, tmp_path):
+    # IDs with no time order (UUIDs): new messages interleave with the old ones
+    renamed = [make_record(str(uuid.UUID(int=random.Random(n).getrandbits(128))), record.metadata) for n, record in enumerate(records)]
+    index = FakeIndex.from_records(renamed[:2000])
+    path = str(tmp_path / "state.pickle")
+    load_metrics_state(path, source=message_source()).refresh(index, path=path)
+    index.upsert([(r.id, None, r.metadata) for r in renamed[2000:]], namespace=MESSAGES_NAMESPACE)
+    resumed = load_metrics_state(path, source=message_source())
+    assert resumed.refresh(index, path=path) == 1000
+    assert resumed.result()["total_messages"] == len(records)
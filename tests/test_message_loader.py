@@ -0,0 +1,113 @@
+import asyncio
+import json
+
+import pytest
+
+from async_loader import AsyncMessageClient, ThreadedAsyncIndex, load_messages_concurrently, load_queries, run_async
+from benchmark import generate_messages
+from fake_index import FakeIndex
+from message_loader import LIST_PAGE_SIZE, as_record, cached_load_messages, iter_messages, load_messages, matches_filter
+from query_cache import QueryCache
+from snapshot_store import append_records, load_snapshot_messages
+
+UNDATED = {"timestamp": {"$exists": False}}
+
+
+@pytest.fixture
+def records():
+    # Several list pages and fetch batches
+    return generate_messages(LIST_PAGE_SIZE * 7 + 13, timestamped_fraction=0.3, seed=2)
+
+
+@pytest.fixture
+def index(records):
+    return FakeIndex.from_records(records)
+
+
+@pytest.mark.parametrize("filter", [None, UNDATED, {"$and": [{"sender_type": {"$eq": "user"}}, {"timestamp": {"$exists": True}}]}])
+def test_loaders_return_every_matching_record_in_listing_order(records, index, filter):
+    expected = [record for record in sorted(records, key=lambda record: record.id) if matches_filter(record, filter)]
+    assert list(iter_messages(index, filter=filter)) == expected
+    assert load_messages_concurrently(index, filter=filter, max_concurrency=3) == expected
+
+
+
+@pytest.mark.parametrize("filter", [
+    None, UNDATED, {"timestamp": {"$exists": True}}, {"sender_type": "user"}, {"sender_type": {"$ne": "agent"}},
+    {"room_id": {"$in": ["r4", "r10", ""]}}, {"user_name": {"$nin": ["dewi"]}}, {"timestamp": {"$gte": "2024-05-01"}},
+    {"$or": [{"sender_type": {"$eq": "agent"}}, {"text": {"$lt": "t"}}]}, {"other": {"$exists": False}},
+])
+def test_snapshot_load_filters_like_matches_filter(records, edge_case_matches, tmp_path, filter):
+    # The snapshot applies filters as column masks; nulls must count as missing
+    path = str(tmp_path / "snapshot")
+    messages = [as_record(match) for match in edge_case_matches] + records[:500]
+    append_records(messages[:10], path, batch=1)
+    append_records(messages[10:], path, batch=2)
+    expected = [record for record in sorted(messages, key=lambda record: record.id) if matches_filter(record, filter)]
+    assert load_snapshot_messages(path, filter) == expected
+
+def test_skip_ids_are_listed_but_not_fetched(records, index):
+    skip_ids = {record.id for record in records[:500]}
+    progress = []
+    loaded = load_messages(index, skip_ids=skip_ids, on_progress=lambda done, total: progress.append((done, total)))
+    assert [record.id for record in loaded] == sorted(record.id for record in records[500:])
+    assert progress[-1] == (len(records), len(records))
+    assert load_messages_concurrently(index, skip_ids=skip_ids) == loaded
+
+
+def test_concurrent_load_retries_rate_limited_calls(records):
+    index = FakeIndex.from_records(records, throttle_rate=0.2, seed=1)
+    assert load_messages_concurrently(index) == load_messages(FakeIndex.from_records(records))
+
+
+def test_load_queries_lists_each_namespace_once(records, index):
+    undated, every = load_queries(index, [("messages", UNDATED), ("messages", None)])
+    assert index.calls["list_paginated"] == -(-len(records) // LIST_PAGE_SIZE)
+    assert every == load_messages(index)
+    assert undated == [record for record in every if matches_filter(record, UNDATED)]
+
+
+def test_cached_load_serves_reruns_without_calls(index):
+    cache = QueryCache()
+    first, fetched_at = cached_load_messages(index, filter=UNDATED, cache=cache)
+    calls = dict(index.calls)
+    again, again_at = cached_load_messages(index, filter=UNDATED, cache=cache)
+    assert again is first and again_at == fetched_at
+    assert index.calls == calls
+
+
+def test_fake_query_filters(index, records):
+    response = index.query(vector=[0.0], top_k=10000, namespace="messages", filter={"user_name": {"$eq": records[0].user_name}}, include_metadata=True)
+    assert sorted(match.id for match in response.matches) == sorted(r.id for r in records if r.user_name == records[0].user_name)
+
+
+def test_from_jsonl(tmp_path):
+    path = tmp_path / "messages.jsonl"
+    path.write_text("\n".join([
+        json.dumps({"id": "m1", "metadata": {"user_name": "ana", "room_id": "r1", "text": "ya"}}),
+        json.dumps({"user_name": "budi", "room_id": "r2", "text": "tidak"}),
+    ]))
+    loaded = load_messages(FakeIndex.from_jsonl(str(path)))
+    assert [(record.id, record.user_name) for record in loaded] == [("1", "budi"), ("m1", "ana")]
+
+
+class TaskCountingIndex(ThreadedAsyncIndex):
+    # Records the most asyncio tasks alive during a fetch
+    max_tasks = 0
+
+    async def fetch(self, **kwargs):
+        self.max_tasks = max(self.max_tasks, len(asyncio.all_tasks()))
+        return await super().fetch(**kwargs)
+
+
+def test_concurrent_load_bounds_the_batches_in_flight(records):
+    async def load():
+        async with TaskCountingIndex(FakeIndex.from_records(records), max_workers=2) as async_index:
+            undated, every = await AsyncMessageClient(async_index, max_concurrency=2).load(filters=(UNDATED, None), batch_size=10)
+            return undated, every, async_index.max_tasks
+
+    undated, every, max_tasks = run_async(load())
+    assert every == load_messages(FakeIndex.from_records(records))
+    assert undated == [record for record in every if matches_filter(record, UNDATED)]
+    # The loading task plus a window of max_concurrency * 2 batches, though a list page holds 10
+    assert max_tasks <= 1 + 2 * 2
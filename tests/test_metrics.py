@@ -0,0 +1,171 @@
+import random
+from collections import defaultdict
+
+import pytest
+
+from benchmark import generate_messages
+from conftest import match
+from metrics import MetricsAggregate, calculate_metrics, compute_response_metrics
+from response_classifier import DEFAULT_INTENTS, ResponseClassifier
+
+
+def baseline_calculate_metrics(query_result):
+    # calculate_metrics as it was in chat_dashboard.py before the single-pass rewrite
+    total_messages = len(query_result)
+    user_rooms = defaultdict(set)
+    user_messages = defaultdict(int)
+    user_message_count = 0
+    agent_message_count = 0
+    single_message_users = 0
+    multiple_message_users = 0
+    multiple_message_total = 0
+    single_ya_users = 0
+    single_tidak_users = 0
+    other_single_messages = []
+
+    for match in query_result:
+        if match.metadata and not match.metadata.get("timestamp"):
+            user_name = match.metadata.get("user_name")
+            room_id = match.metadata.get("room_id")
+            sender_type = match.metadata.get("sender_type", "user")
+            text = match.metadata.get("text", "").strip()
+
+            if user_name and room_id:
+                user_rooms[user_name].add(room_id)
+                user_messages[user_name] += 1
+
+                if sender_type == "user":
+                    user_message_count += 1
+                else:
+                    agent_message_count += 1
+
+    for user, count in user_messages.items():
+        if count == 1:
+            single_message_users += 1
+            for match in query_result:
+                if (match.metadata and
+                        match.metadata.get("user_name") == user and
+                        match.metadata.get("sender_type") == "user"):
+                    text = match.metadata.get("text", "").strip().lower()
+                    if text == "ya":
+                        single_ya_users += 1
+                    elif text == "tidak":
+                        single_tidak_users += 1
+                    else:
+                        other_single_messages.append({
+                            "user": user,
+                            "message": match.metadata.get("text", "").strip()
+                        })
+                    break
+        elif count >= 2:
+            multiple_message_users += 1
+            multiple_message_total += count
+
+    total_users = len(user_rooms)
+    total_rooms = len(set(room for rooms in user_rooms.values() for room in rooms))
+    avg_messages_per_user = sum(user_messages.values()) / total_users if total_users > 0 else 0
+    single_message_percentage = (single_message_users / total_users * 100) if total_users > 0 else 0
+    multiple_message_percentage = (multiple_message_users / total_users * 100) if total_users > 0 else 0
+    avg_messages_multiple_users = multiple_message_total / multiple_message_users if multiple_message_users > 0 else 0
+    single_ya_percentage = (single_ya_users / single_message_users * 100) if single_message_users > 0 else 0
+    single_tidak_percentage = (single_tidak_users / single_message_users * 100) if single_message_users > 0 else 0
+
+    return {
+        "total_users": total_users,
+        "total_rooms": total_rooms,
+        "avg_messages_per_user": round(avg_messages_per_user, 2),
+        "total_messages": total_messages,
+        "user_messages": user_message_count,
+        "agent_messages": agent_message_count,
+        "single_message_users": single_message_users,
+        "single_message_percentage": round(single_message_percentage, 1),
+        "multiple_message_users": multiple_message_users,
+        "multiple_message_percentage": round(multiple_message_percentage, 1),
+        "avg_messages_multiple_users": round(avg_messages_multiple_users, 2),
+        "single_ya_users": single_ya_users,
+        "single_ya_percentage": round(single_ya_percentage, 1),
+        "single_tidak_users": single_tidak_users,
+        "single_tidak_percentage": round(single_tidak_percentage, 1),
+        "other_single_messages": other_single_messages,
+        "multiple_message_total": multiple_message_total
+    }
+
+
+def without_ids(metrics):
+    # The baseline did not report the message ID of other single messages
+    return {
+        **metrics,
+        "other_single_messages": [
+            {key: value for key, value in message.items() if key != "id"}
+            for message in metrics["other_single_messages"]
+        ]
+    }
+
+
+def test_edge_cases_match_baseline(edge_case_matches):
+    matches = edge_case_matches
+    assert without_ids(calculate_metrics(matches)) == baseline_calculate_metrics(matches)
+
+
+def test_edge_case_figures(edge_case_matches):
+    metrics = calculate_metrics(edge_case_matches)
+    assert metrics["total_messages"] == 17
+    assert metrics["single_ya_users"] == 2  # ana, and eka through her dated message
+    assert metrics["single_tidak_users"] == 2  # budi and gita
+    assert [message["user"] for message in metrics["other_single_messages"]] == ["citra"]
+    assert metrics["other_single_messages"][0]["id"] == "c1"
+
+
+def test_synthetic_history_matches_baseline():
+    records = generate_messages(5000, timestamped_fraction=0.3, seed=7)
+    random.Random(7).shuffle(records)
+    assert without_ids(calculate_metrics(records)) == baseline_calculate_metrics(records)
+
+
+def test_empty_input():
+    assert calculate_metrics([]) == baseline_calculate_metrics([])
+
+
+def test_folding_in_parts_matches_one_pass():
+    records = generate_messages(2000, seed=3)
+    aggregate = MetricsAggregate()
+    aggregate.add_all(records[:700])
+    aggregate.add_all(records[700:])
+    assert aggregate.result() == calculate_metrics(records)
+
+
+@pytest.mark.parametrize("text, intents", [
+    ("ya", {"ya"}),
+    ("saya mau", set()),  # "ya" inside a word
+    ("iya", set()),
+    ("yakin", set()),
+    ("tidaknya", set()),
+    ("Ya, saya mau!", {"ya"}),  # Punctuation next to a word
+    ("(tidak)", {"tidak"}),
+    ("ya.tidak?", {"ya", "tidak"}),
+    ("STOP!!!", {"stop"}),
+    ("  Tidak\n", {"tidak"}),
+    ("", set()),
+    (None, set()),
+])
+def test_classifier_matches_whole_words_only(text, intents):
+    assert ResponseClassifier(DEFAULT_INTENTS).classify(text) == intents
+
+
+def test_exact_classification_takes_the_whole_message():
+    classifier = ResponseClassifier(DEFAULT_INTENTS)
+    assert classifier.classify_exact("  Ya ") == "ya"
+    assert classifier.classify_exact("saya") is None
+    assert classifier.classify_exact("ya tidak") is None
+
+
+@pytest.mark.parametrize("engine", ["python", "pandas"])
+def test_response_metrics_count_whole_words(engine):
+    messages = [
+        match("a1", user_name="ana", text="saya mau"),
+        match("a2", user_name="ana", text="Ya!"),
+        match("b1", user_name="budi", text="tidak, terima kasih."),
+        match("c1", user_name="citra", text="kayaknya tidaknya"),
+    ]
+    metrics = compute_response_metrics(messages, engine)
+    assert (metrics["ya_messages"], metrics["tidak_messages"]) == (1, 1)
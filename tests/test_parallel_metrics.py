@@ -0,0 +1,65 @@
+import pytest
+
+import parallel_metrics
+from approximate_metrics import calculate_metrics_approx
+from benchmark import generate_messages
+from message_loader import as_record, matches_filter
+from metrics import calculate_metrics
+from parallel_metrics import calculate_metrics_parallel, fold_shard, merge_partials, shard_of
+from query_cache import QueryCache
+from snapshot_store import append_records, load_snapshot_messages
+from sqlite_store import MessageStore, cached_store_messages
+
+UNDATED = {"timestamp": {"$exists": False}}
+
+
+def test_merged_shards_match_the_single_process_result(edge_case_matches):
+    records = [as_record(m) for m in edge_case_matches] + generate_messages(3000, timestamped_fraction=0.3, seed=6)
+    shards = [([], []) for _ in range(3)]
+    for position, record in enumerate(records):
+        positions, shard = shards[shard_of(record.user_name, 3)]
+        positions.append(position)
+        shard.append(record)
+    partials = [fold_shard(shard, positions) for positions, shard in shards]
+    assert merge_partials(partials) == calculate_metrics(records)
+
+
+def test_worker_processes_match_the_single_process_result(monkeypatch):
+    records = [record for record in generate_messages(5000, timestamped_fraction=0.3, seed=7) if matches_filter(record, UNDATED)]
+    monkeypatch.setattr(parallel_metrics, "PARALLEL_MIN_RECORDS", 0)
+    try:
+        assert calculate_metrics_parallel(records, workers=2) == calculate_metrics(records)
+        # The started pool is reused
+        pool = parallel_metrics.get_process_pool(2)
+        assert calculate_metrics_parallel(records[:1000], workers=2) == calculate_metrics(records[:1000])
+        assert parallel_metrics.get_process_pool(2) is pool
+    finally:
+        parallel_metrics._reset_pool()
+
+
+def snapshot_source(tmp_path):
+    path = str(tmp_path / "snapshot")
+    return (lambda records: append_records(records, path, batch=len(records))), lambda: load_snapshot_messages(path, UNDATED)
+
+
+def store_source(tmp_path):
+    path = str(tmp_path / "messages.db")
+    store = MessageStore(path)
+    return store.add_records, lambda: cached_store_messages(path, filter=UNDATED, cache=QueryCache())[0]
+
+
+@pytest.mark.parametrize("source", [snapshot_source, store_source], ids=["snapshot", "sqlite"])
+def test_workers_read_local_stores_as_loaded(source, edge_case_matches, tmp_path, monkeypatch):
+    add, load = source(tmp_path)
+    records = [as_record(m) for m in edge_case_matches] + generate_messages(4000, timestamped_fraction=0.3, seed=8)
+    add(records[:3000])
+    loaded = load()
+    assert loaded.source is not None
+    # Messages added after the load are not picked up by the workers
+    add(records[3000:])
+    monkeypatch.setattr(parallel_metrics, "PARALLEL_MIN_RECORDS", 0)
+    try:
+        assert calculate_metrics_parallel(loaded, workers=2) == calculate_metrics(loaded)
+        assert calculate_metrics_approx(loaded, workers=2) == calculate_metrics_approx(list(loaded), workers=1)
+    finally:
+        parallel_metrics._reset_pool()
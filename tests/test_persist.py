@@ -0,0 +1,64 @@
+import os
+import pickle
+import threading
+
+import pytest
+
+from persist import LockedState, Registry, load_json, load_pickle, save_json, save_pickle, write_atomic
+
+
+class Counter(LockedState):
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+
+def test_saved_values_load_back(tmp_path):
+    save_json(str(tmp_path / "state" / "a.json"), {"records": 3})
+    save_pickle(str(tmp_path / "b.pickle"), [1, 2])
+    assert load_json(str(tmp_path / "state" / "a.json")) == {"records": 3}
+    assert load_pickle(str(tmp_path / "b.pickle")) == [1, 2]
+    assert load_json(str(tmp_path / "missing.json"), {}) == {}
+    assert load_pickle(str(tmp_path / "missing.pickle")) is None
+
+
+def test_failed_write_keeps_the_old_file(tmp_path):
+    path = str(tmp_path / "a.json")
+    save_json(path, {"records": 1})
+
+    def fail(f):
+        f.write("{")
+        raise RuntimeError("disk full")
+
+    with pytest.raises(RuntimeError):
+        write_atomic(path, fail)
+    assert load_json(path) == {"records": 1}
+    assert os.listdir(tmp_path) == ["a.json"]
+
+
+def test_concurrent_writers_never_leave_a_partial_file(tmp_path):
+    path = str(tmp_path / "a.json")
+    threads = [threading.Thread(target=lambda n=n: [save_json(path, list(range(n * 1000))) for _ in range(20)]) for n in range(1, 5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(load_json(path)) in (1000, 2000, 3000, 4000)
+    assert os.listdir(tmp_path) == ["a.json"]
+
+
+def test_locked_state_pickles_without_its_lock():
+    counter = Counter()
+    counter.count = 2
+    loaded = pickle.loads(pickle.dumps(counter))
+    assert loaded.count == 2
+    with loaded._lock:
+        pass
+
+
+def test_registry_creates_each_key_once():
+    registry = Registry()
+    created = []
+    first = registry.get("a", lambda: created.append("a") or object())
+    assert registry.get("a", lambda: created.append("a") or object()) is first
+    assert created == ["a"]
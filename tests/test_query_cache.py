@@ -0,0 +1,89 @@
+import pytest
+
+import query_cache
+from fake_index import FakeIndex
+from message_loader import cached_load_messages
+from query_cache import QueryCache, cache_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(query_cache.time, "time", clock)
+    return clock
+
+
+def counting_loader(value):
+    calls = []
+
+    def load():
+        calls.append(value)
+        return value
+    return load, calls
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = QueryCache(ttl_seconds=60)
+    load, calls = counting_loader("first")
+    key = cache_key("messages", {"timestamp": {"$exists": False}})
+    assert cache.get_or_load(key, load, sizer=len) == ("first", 1000.0)
+    clock.now += 60
+    assert cache.get_or_load(key, load, sizer=len) == ("first", 1000.0)
+    assert calls == ["first"]
+    clock.now += 1
+    assert cache.get_or_load(key, load, sizer=len) == ("first", 1061.0)
+    assert calls == ["first", "first"]
+
+
+def test_zero_ttl_never_expires(clock):
+    cache = QueryCache(ttl_seconds=0)
+    load, calls = counting_loader("value")
+    cache.get_or_load("key", load, sizer=len)
+    clock.now += 10 ** 9
+    cache.get_or_load("key", load, sizer=len)
+    assert calls == ["value"]
+
+
+def test_invalidate_drops_one_namespace_or_everything():
+    cache = QueryCache()
+    for namespace in ("messages", "archive"):
+        for filter in (None, {"room_id": "r1"}):
+            cache.put(cache_key(namespace, filter), namespace, size=10)
+    cache.invalidate("messages")
+    assert len(cache) == 2 and cache.total_bytes == 20
+    assert cache.get(cache_key("messages")) is None
+    assert cache.get(cache_key("archive")).value == "archive"
+    cache.invalidate()
+    assert len(cache) == 0 and cache.total_bytes == 0
+
+
+def test_memory_cap_evicts_least_recently_used():
+    cache = QueryCache(max_bytes=25)
+    cache.put("a", "a", size=10)
+    cache.put("b", "b", size=10)
+    cache.get("a")
+    cache.put("c", "c", size=10)
+    assert cache.get("b") is None
+    assert cache.get("a").value == "a" and cache.get("c").value == "c"
+    # An entry over the cap on its own is still kept
+    cache.put("d", "d", size=100)
+    assert len(cache) == 1 and cache.get("d").value == "d"
+
+
+def test_invalidated_messages_are_loaded_again():
+    index = FakeIndex()
+    index.upsert([("m1", None, {"user_name": "ana", "room_id": "r1"})], namespace="messages")
+    cache = QueryCache()
+    first, _ = cached_load_messages(index, cache=cache)
+    index.upsert([("m2", None, {"user_name": "budi", "room_id": "r2"})], namespace="messages")
+    assert cached_load_messages(index, cache=cache)[0] is first
+    cache.invalidate("messages")
+    assert [r.id for r in cached_load_messages(index, cache=cache)[0]] == ["m1", "m2"]
@@ -0,0 +1,58 @@
+import csv
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmark import generate_messages
+from message_loader import matches_filter
+from metrics import calculate_metrics
+from report import METRICS_FILTER
+from sqlite_store import MessageStore
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def message_db(tmp_path):
+    path = str(tmp_path / "messages.db")
+    records = generate_messages(1500, timestamped_fraction=0.3, seed=11)
+    MessageStore(path).add_records(records)
+    return path, calculate_metrics([r for r in records if matches_filter(r, METRICS_FILTER)])
+
+
+def run_report(message_db, output, format):
+    # The report CLI as a cron job runs it
+    subprocess.run(
+        [sys.executable, "report.py", "--db", message_db, "--reports", "metrics", "--engine", "python", "--format", format, "--output", str(output)],
+        cwd=REPO, check=True, capture_output=True, env={**os.environ, "MESSAGE_DB": "", "SNAPSHOT_DIR": ""}
+    )
+
+
+def read_csv(path):
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def test_json_report_matches_calculate_metrics(message_db, tmp_path):
+    path, expected = message_db
+    run_report(path, tmp_path / "out", "json")
+    with open(tmp_path / "out" / "report.json") as f:
+        report = json.load(f)
+    assert report["source"] == f"sqlite:{path}"
+    assert report["metrics"] == json.loads(json.dumps(expected))
+
+
+def test_csv_report_matches_calculate_metrics(message_db, tmp_path):
+    path, expected = message_db
+    run_report(path, tmp_path / "out", "csv")
+    assert sorted(os.listdir(tmp_path / "out")) == ["metrics.csv", "metrics_other_single_messages.csv"]
+    figures = {row["metric"]: row["value"] for row in read_csv(tmp_path / "out" / "metrics.csv")}
+    assert figures["source"] == f"sqlite:{path}"
+    for key, value in expected.items():
+        if key != "other_single_messages":
+            assert figures[key] == str(value), key
+    others = read_csv(tmp_path / "out" / "metrics_other_single_messages.csv")
+    assert others == [{key: str(value) for key, value in row.items()} for row in expected["other_single_messages"]]
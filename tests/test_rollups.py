@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from benchmark import generate_messages
+from message_loader import make_record
+from metrics import calculate_metrics
+from rollups import ROLLUP_FILE, build_rollups, load_rollups, update_snapshot_rollups
+from snapshot_store import append_records
+from sqlite_store import MessageStore
+
+
+def undated(records):
+    # The records with their timestamps dropped, which calculate_metrics counts
+    return [make_record(r.id, {k: v for k, v in r.metadata.items() if k != "timestamp"}) for r in records]
+
+
+@pytest.fixture
+def records(edge_case_matches):
+    edge_cases = [make_record(m.id, m.metadata) for m in edge_case_matches if m.metadata]
+    return edge_cases + generate_messages(2000, timestamped_fraction=0.5, seed=7)
+
+
+def memory_rollups(records, tmp_path):
+    return build_rollups(records)
+
+
+def store_rollups(records, tmp_path):
+    store = MessageStore(str(tmp_path / "messages.db"))
+    store.add_records(records)
+    return store.rollups()
+
+
+def snapshot_rollups(records, tmp_path):
+    path = str(tmp_path / "snapshot")
+    append_records(records, path)
+    update_snapshot_rollups(path, records, 0)
+    return load_rollups(os.path.join(path, ROLLUP_FILE))
+
+
+@pytest.mark.parametrize("rollups_of", [memory_rollups, store_rollups, snapshot_rollups])
+def test_rollup_totals_match_metrics(records, tmp_path, rollups_of):
+    rollups = rollups_of(records, tmp_path)
+    summary = rollups.summary()
+    dated = [r for r in records if r.ts is not None]
+    metrics = calculate_metrics(records)  # Counts the undated messages only
+    all_metrics = calculate_metrics(undated(records))  # ... here all of them
+    dated_metrics = calculate_metrics(undated(dated))
+
+    assert rollups.records == metrics["total_messages"] == len(records)
+    assert rollups.undated == len(records) - len(dated)
+    assert summary["messages"] == len(dated)
+    # Every dated message has a user and room, so the rollups plus the
+    # undated counts of the metrics give the counts over all messages
+    assert summary["user_messages"] == dated_metrics["user_messages"]
+    assert summary["agent_messages"] == dated_metrics["agent_messages"]
+    assert summary["user_messages"] + metrics["user_messages"] == all_metrics["user_messages"]
+    assert summary["agent_messages"] + metrics["agent_messages"] == all_metrics["agent_messages"]
+    assert summary["active_users"] == dated_metrics["total_users"]
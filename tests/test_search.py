@@ -0,0 +1,58 @@
+import pytest
+
+import search_index as search_module
+from benchmark import generate_messages
+from conftest import match
+from message_loader import as_record
+from persist import Registry
+from search_index import SearchIndex, get_search_index
+from sqlite_store import MessageStore
+
+QUERIES = ["ya", "tidak", "rumah", "harga rumah", "cafe", "RUMAHNYA", "yang", "", "tidak ada"]
+
+
+@pytest.fixture
+def records():
+    written = [as_record(m) for m in [
+        match("w1", user_name="ana", room_id="r1", text="Ya, rumahnya dijual?", timestamp="2024-05-01T10:00:00Z"),
+        match("w2", user_name="ana", room_id="r1", text="tidaklah, harga rumah naik"),
+        match("w3", user_name="budi", room_id="r2", text="yang itu di café", timestamp="2024-05-02T10:00:00Z"),
+        match("w4", user_name="budi", room_id="r2", text="rumahku rumahmu"),
+        match("w5", user_name="citra", room_id="r3", text="tidak ada", timestamp="2024-05-03T10:00:00Z"),
+    ]]
+    return written + generate_messages(2000, timestamped_fraction=0.5, seed=5)
+
+
+@pytest.fixture
+def searches(records, tmp_path):
+    search_index = SearchIndex()
+    search_index.add(records)
+    store = MessageStore(str(tmp_path / "messages.db"))
+    store.add_records(records)
+    return search_index, store.search_index()
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_store_search_matches_the_search_index(searches, query):
+    search_index, store_search = searches
+    assert [hit.id for hit in store_search.search(query, limit=20)] == [hit.id for hit in search_index.search(query, limit=20)]
+    assert store_search.count(query) == search_index.count(query)
+
+
+def test_store_search_applies_the_filter(records, tmp_path):
+    store = MessageStore(str(tmp_path / "messages.db"))
+    store.add_records(records)
+    undated = store.search_index({"timestamp": {"$exists": False}})
+    assert [hit.id for hit in undated.search("rumah")][-2:] == ["w4", "w2"]
+    assert all(hit.timestamp is None for hit in undated.search("ya", limit=1000))
+
+
+def test_persisted_index_is_only_reused_for_its_own_query(records, tmp_path, monkeypatch):
+    path = str(tmp_path / "search.pickle")
+    undated = {"timestamp": {"$exists": False}}
+    get_search_index(records[:3], fetched_at=1, filter=undated, path=path)
+    # A new process: nothing in the registry, only the file
+    monkeypatch.setattr(search_module, "_indexes", Registry())
+    assert len(get_search_index([], fetched_at=2, filter=None, path=path)) == 0
+    assert len(get_search_index([], fetched_at=2, filter=undated, path=path)) == 3
+    assert len(get_search_index([], fetched_at=2, namespace="other", filter=undated, path=path)) == 0
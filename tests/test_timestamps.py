@@ -0,0 +1,59 @@
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from message_loader import make_record
+from timestamps import date_to_epoch, epoch_to_date, format_timestamp, parse_timestamp, sort_key
+
+MOMENT = datetime(2024, 5, 1, 23, 30, 15, tzinfo=timezone.utc)
+EPOCH = int(MOMENT.timestamp())
+
+
+@pytest.mark.parametrize("hours", [-8, -3.5, 0, 5.5, 7, 14])
+def test_offset_timestamps_round_trip(hours):
+    local = MOMENT.astimezone(timezone(timedelta(hours=hours)))
+    assert parse_timestamp(local.isoformat()) == EPOCH
+    assert datetime.fromtimestamp(parse_timestamp(local.isoformat()), timezone.utc) == MOMENT
+
+
+@pytest.mark.parametrize("value", [
+    "2024-05-01T23:30:15",
+    "2024-05-01 23:30:15",
+    "2024-05-01T23:30:15Z",
+    "2024-05-01T23:30:15+00:00",
+    "2024-05-02T06:30:15+07:00",
+])
+def test_naive_timestamps_are_utc(value):
+    assert parse_timestamp(value) == EPOCH
+    assert epoch_to_date(parse_timestamp(value)) == date(2024, 5, 1)
+
+
+@pytest.mark.parametrize("value", [EPOCH, EPOCH * 1000, float(EPOCH), str(EPOCH), str(EPOCH * 1000)])
+def test_numeric_epochs_in_seconds_or_milliseconds(value):
+    assert parse_timestamp(value) == EPOCH
+
+
+@pytest.mark.parametrize("value", [None, "", "yesterday", "2024-13-01T00:00:00"])
+def test_missing_or_unparseable_timestamps(value):
+    assert parse_timestamp(value) is None
+
+
+def test_dates_round_trip():
+    day = epoch_to_date(EPOCH)
+    assert date_to_epoch(day) <= EPOCH < date_to_epoch(day + timedelta(days=1))
+    assert epoch_to_date(date_to_epoch(day)) == day
+
+
+def test_mixed_formats_sort_chronologically():
+    records = [
+        make_record("late", {"timestamp": "2024-05-02T06:30:16+07:00"}),
+        make_record("undated", {}),
+        make_record("early", {"timestamp": "2024-05-01T23:30:14"}),
+        make_record("same", {"timestamp": EPOCH * 1000}),
+    ]
+    assert [r.id for r in sorted(records, key=sort_key)] == ["undated", "early", "same", "late"]
+
+
+def test_format_timestamp_keeps_unparseable_values():
+    assert format_timestamp("2024-05-01T23:30:15Z") == "Wednesday, May 01, 2024, 11:30 PM"
+    assert format_timestamp("yesterday") == "yesterday"
@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+from benchmark import generate_messages
+from conversation_metrics import calculate_conversation_metrics, conversation_order
+from fake_index import FakeVector
+from message_loader import as_record
+from metrics import calculate_metrics, calculate_response_metrics, compute_metrics, compute_response_metrics
+from vectorized_metrics import (
+    calculate_conversation_metrics_df,
+    calculate_metrics_df,
+    calculate_response_metrics_df,
+    messages_frame,
+)
+
+
+def synthetic(total=3000, timestamped_fraction=0.3, seed=11):
+    records = generate_messages(total, timestamped_fraction=timestamped_fraction, seed=seed)
+    random.Random(seed).shuffle(records)
+    return records
+
+
+EMPTY_STRINGS = [
+    FakeVector("e1", metadata={"user_name": "ana", "room_id": "r1", "sender_type": "", "text": ""}),
+    FakeVector("e2", metadata={"user_name": "ana", "room_id": "", "sender_type": "user", "text": "ya"}),
+    FakeVector("e3", metadata={"user_name": "", "room_id": "r2", "sender_type": "user", "text": "tidak"}),
+    FakeVector("e4", metadata={"user_name": "budi", "room_id": "r3", "sender_type": "user", "text": "", "timestamp": ""}),
+    FakeVector("e5", metadata={"user_name": "citra", "room_id": "r4", "sender_type": "user", "text": "  "}),
+]
+
+NO_USER_SENDER = [
+    FakeVector("n1", metadata={"user_name": "ana", "room_id": "r1", "sender_type": "agent", "text": "Halo!"}),
+    FakeVector("n2", metadata={"user_name": "budi", "room_id": "r2", "sender_type": "agent", "text": "Ya"}),
+    FakeVector("n3", metadata={"user_name": "budi", "room_id": "r2", "text": "tidak"}),
+]
+
+
+@pytest.fixture(params=["edge_cases", "empty", "empty_strings", "no_user_sender", "synthetic"])
+def messages(request, edge_case_matches):
+    return {
+        "edge_cases": edge_case_matches,
+        "empty": [],
+        "empty_strings": EMPTY_STRINGS,
+        "no_user_sender": NO_USER_SENDER,
+        "synthetic": synthetic(),
+    }[request.param]
+
+
+def test_metrics_parity(messages):
+    assert calculate_metrics_df(messages_frame(messages)) == calculate_metrics(messages)
+
+
+def test_response_metrics_parity(messages):
+    assert calculate_response_metrics_df(messages_frame(messages)) == calculate_response_metrics(messages)
+
+
+def test_conversation_metrics_parity(messages):
+    ordered = list(conversation_order([as_record(match) for match in messages]))
+    assert calculate_conversation_metrics_df(messages_frame(ordered)) == calculate_conversation_metrics(ordered)
+
+
+def test_conversation_metrics_parity_mostly_dated():
+    # Dated messages drive the latencies: most rooms get measured replies
+    ordered = list(conversation_order(synthetic(timestamped_fraction=0.8, seed=5)))
+    expected = calculate_conversation_metrics(ordered)
+    assert expected["response_latency"]["responses"] > 0
+    assert calculate_conversation_metrics_df(messages_frame(ordered)) == expected
+
+
+def test_engine_switch():
+    records = synthetic(1000)
+    assert compute_metrics(records, "pandas") == compute_metrics(records, "python")
+    assert compute_response_metrics(records, "pandas") == compute_response_metrics(records, "python")
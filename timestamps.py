@@ -0,0 +1,56 @@
+from datetime import datetime, time, timezone
+from functools import lru_cache
+
+# Timestamp handling shared by the dashboards.
+# Timestamps are parsed once at load time into epoch seconds stored next to
+# each record (MessageRecord.ts); sorting and date filtering compare those
+# integers instead of raw strings, which order incorrectly when formats are
+# mixed. Display strings are memoized, so reruns do no parsing at all.
+
+FORMAT_CACHE_SIZE = 100000
+
+
+def parse_timestamp(value):
+    # Epoch seconds for an ISO-8601 string (naive values are taken as UTC) or a
+    # numeric epoch in seconds/milliseconds; None when missing or unparseable
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return int(value / 1000 if value > 1e11 else value)
+    try:
+        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (ValueError, AttributeError):
+        try:
+            number = float(value)
+        except (ValueError, TypeError):
+            return None
+        return int(number / 1000 if number > 1e11 else number)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def sort_key(record):
+    # Records without a timestamp sort first, then chronologically
+    return (record.ts is not None, record.ts or 0)
+
+
+def date_to_epoch(day):
+    # Epoch seconds of midnight UTC at the start of a date
+    return int(datetime.combine(day, time.min, tzinfo=timezone.utc).timestamp())
+
+
+def epoch_to_date(epoch):
+    # UTC date of an epoch second
+    return datetime.fromtimestamp(epoch, timezone.utc).date()
+
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def format_timestamp(timestamp_str):
+    try:
+        # Convert timestamp to datetime object
+        dt = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
+        # Format as: Day, Month Date, Year, Time
+        return dt.strftime("%A, %B %d, %Y, %I:%M %p")
+    except (ValueError, TypeError, AttributeError):
+        return timestamp_str  # Return original if parsing fails
@@ -0,0 +1,183 @@
+import numpy as np
+import pandas as pd
+
+from conversation_metrics import LATENCY_EDGES, LatencyHistogram, conversation_metrics_result
+from message_loader import as_record
+from metrics import response_metrics_result
+from response_classifier import get_classifier
+
+# Vectorized metrics engine: computes the same figures as metrics.py with
+# pandas groupby and vectorized string operations over a DataFrame of
+# messages (one row per message, null for missing metadata fields).
+# Responses are classified with the shared response_classifier once per
+# distinct text, then mapped back to the rows through factorized codes.
+
+FRAME_COLUMNS = ["id", "user_name", "room_id", "sender_type", "text", "timestamp"]
+FRAME_DTYPE = "string[pyarrow]"
+
+
+def messages_frame(messages):
+    # Build a DataFrame from loaded records (MessageRecords or Pinecone matches)
+    columns = {column: [] for column in FRAME_COLUMNS}
+    times = []
+    for match in messages:
+        record = as_record(match)
+        columns["id"].append(record.id)
+        for column in FRAME_COLUMNS[1:]:
+            columns[column].append(getattr(record, column))
+        times.append(record.ts)
+    # Arrow-backed strings make the string operations and groupbys much cheaper
+    df = pd.DataFrame(columns, columns=FRAME_COLUMNS, dtype=object).astype(FRAME_DTYPE)
+    df["ts"] = pd.array(times, dtype="Int64")  # Parsed timestamps (epoch seconds)
+    return df
+
+
+def _present(series):
+    # Non-null, non-empty values (Python truthiness of metadata strings)
+    return series.notna() & (series != "")
+
+
+def calculate_metrics_df(df):
+    total_messages = len(df)
+
+    # Only count messages without timestamp that have a user and a room
+    counted = df[_present(df["user_name"]) & _present(df["room_id"]) & ~_present(df["timestamp"])]
+    per_user = counted.groupby("user_name", sort=False).size()  # Users in order of first message
+    is_user_sender = counted["sender_type"].isna() | (counted["sender_type"] == "user")
+    user_message_count = int(is_user_sender.sum())
+    agent_message_count = len(counted) - user_message_count
+
+    single_users = per_user.index[per_user == 1]
+    multiple_counts = per_user[per_user >= 2]
+    single_message_users = len(single_users)
+    multiple_message_users = len(multiple_counts)
+    multiple_message_total = int(multiple_counts.sum())
+
+    # First message each user sent as "user", used to classify single message users
+    user_rows = df[_present(df["user_name"]) & (df["sender_type"] == "user")]
+    first_rows = user_rows.drop_duplicates("user_name").set_index("user_name")
+    first_texts = first_rows["text"].fillna("")
+    single_texts = first_texts.reindex(single_users).dropna().astype(FRAME_DTYPE).str.strip()
+    intents = np.array(get_classifier().classify_exact_batch(single_texts.tolist()), dtype=object)
+    is_ya = intents == "ya"
+    is_tidak = intents == "tidak"
+    single_ya_users = int(is_ya.sum())
+    single_tidak_users = int(is_tidak.sum())
+    others = single_texts[~is_ya & ~is_tidak]
+    other_single_messages = [
+        {"user": user, "message": message, "id": message_id}
+        for user, message, message_id in zip(others.index, others.values, first_rows["id"].reindex(others.index).values)
+    ]
+
+    # Calculate metrics
+    total_users = len(per_user)
+    total_rooms = int(counted["room_id"].nunique())
+    avg_messages_per_user = len(counted) / total_users if total_users > 0 else 0
+    single_message_percentage = (single_message_users / total_users * 100) if total_users > 0 else 0
+    multiple_message_percentage = (multiple_message_users / total_users * 100) if total_users > 0 else 0
+    avg_messages_multiple_users = multiple_message_total / multiple_message_users if multiple_message_users > 0 else 0
+    single_ya_percentage = (single_ya_users / single_message_users * 100) if single_message_users > 0 else 0
+    single_tidak_percentage = (single_tidak_users / single_message_users * 100) if single_message_users > 0 else 0
+
+    return {
+        "total_users": total_users,
+        "total_rooms": total_rooms,
+        "avg_messages_per_user": round(avg_messages_per_user, 2),
+        "total_messages": total_messages,
+        "user_messages": user_message_count,
+        "agent_messages": agent_message_count,
+        "single_message_users": single_message_users,
+        "single_message_percentage": round(single_message_percentage, 1),
+        "multiple_message_users": multiple_message_users,
+        "multiple_message_percentage": round(multiple_message_percentage, 1),
+        "avg_messages_multiple_users": round(avg_messages_multiple_users, 2),
+        "single_ya_users": single_ya_users,
+        "single_ya_percentage": round(single_ya_percentage, 1),
+        "single_tidak_users": single_tidak_users,
+        "single_tidak_percentage": round(single_tidak_percentage, 1),
+        "other_single_messages": other_single_messages,
+        "multiple_message_total": multiple_message_total
+    }
+
+
+def calculate_conversation_metrics_df(df):
+    # Same figures as conversation_metrics.ConversationAnalyzer, from rows in
+    # conversation order (see conversation_metrics.conversation_records),
+    # regrouped by room with a stable sort
+    rows = df[_present(df["user_name"]) & _present(df["room_id"])]
+    ts = rows["ts"]
+    room_codes = rows.groupby(["user_name", "room_id"], sort=False).ngroup().to_numpy()  # Rooms in order of first message
+    _, room_first = np.unique(room_codes, return_index=True)
+    room_count = len(room_first)
+    order = np.argsort(room_codes, kind="stable")
+    room = room_codes[order]
+    has_ts = ts.notna().to_numpy()[order]
+    seconds = ts.fillna(0).to_numpy(dtype=np.int64)[order]
+    is_user = (rows["sender_type"].isna() | (rows["sender_type"] == "user")).to_numpy(dtype=bool)[order]
+
+    # A turn starts with each room's first message and at every change of sender
+    room_start = np.ones(len(room), dtype=bool)
+    room_start[1:] = room[1:] != room[:-1]
+    turn_start = room_start.copy()
+    turn_start[1:] |= is_user[1:] != is_user[:-1]
+    messages = np.bincount(room, minlength=room_count)
+    turns = np.bincount(room[turn_start], minlength=room_count)
+    user_turns = np.bincount(room[turn_start & is_user], minlength=room_count)
+    room_end = np.ones(len(room), dtype=bool)
+    room_end[:-1] = room_start[1:]
+    ended_on_user = np.zeros(room_count, dtype=bool)
+    ended_on_user[room[room_end]] = is_user[room_end]
+
+    # Reply latency: first message of an agent turn that follows a user turn,
+    # minus the first dated message of that user turn
+    turn_id = np.cumsum(turn_start) - 1
+    waiting = np.zeros(int(turn_start.sum()), dtype=np.int64)
+    has_waiting = np.zeros(len(waiting), dtype=bool)
+    dated_turns, first_dated = np.unique(turn_id[has_ts], return_index=True)
+    waiting[dated_turns] = seconds[has_ts][first_dated]
+    has_waiting[dated_turns] = True
+    replies = np.flatnonzero(turn_start & ~room_start & ~is_user & has_ts)
+    previous = turn_id[replies] - 1
+    measured = has_waiting[previous]
+    latencies = seconds[replies][measured] - waiting[previous][measured]
+    reply_rooms = room[replies][measured]
+
+    latency = LatencyHistogram()
+    buckets = np.searchsorted(np.array(LATENCY_EDGES), latencies, side="right")
+    latency.add_counts(np.bincount(buckets, minlength=len(LATENCY_EDGES) + 1), len(latencies), int(latencies.sum()))
+    latency_total = np.zeros(room_count, dtype=np.int64)
+    np.add.at(latency_total, reply_rooms, latencies)
+    columns = {
+        "user": rows["user_name"].to_numpy(dtype=object)[room_first].tolist(),
+        "room": rows["room_id"].to_numpy(dtype=object)[room_first].tolist(),
+        "messages": messages.tolist(),
+        "turns": turns.tolist(),
+        "user_turns": user_turns.tolist(),
+        "ended_on_user": ended_on_user.tolist(),
+        "responses": np.bincount(reply_rooms, minlength=room_count).tolist(),
+        "latency_total": latency_total.tolist(),
+    }
+    return conversation_metrics_result(columns, latency)
+
+
+def calculate_response_metrics_df(df):
+    rows = df[_present(df["user_name"])]
+    classifier = get_classifier()
+
+    # Classify each distinct text once
+    text_codes, texts = pd.factorize(rows["text"].fillna(""))
+    text_intents = classifier.classify_batch(texts.tolist())
+
+    # Per-user counts via integer codes (users in order of first message)
+    codes, users = pd.factorize(rows["user_name"])
+    messages = np.bincount(codes, minlength=len(users))
+    intents = {}
+    for name in classifier.names:
+        has_intent = np.fromiter((name in found for found in text_intents), dtype=bool, count=len(texts))[text_codes]
+        per_user = np.bincount(codes, weights=has_intent, minlength=len(users))
+        intents[name] = {
+            "messages": int(has_intent.sum()),
+            "users_saying": int((per_user > 0).sum()),
+            "users_only": int(((per_user > 0) & (per_user == messages)).sum()),
+        }
+    return response_metrics_result(len(rows), list(users), intents)